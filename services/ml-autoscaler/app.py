@@ -25,6 +25,8 @@ import requests
 from prometheus_client import Gauge, Counter, generate_latest, REGISTRY
 
 from inference import K8sAutoScalingPredictor
+from ensemble import EnsemblePredictor
+from inference_worker import InferenceWorkerPredictor
 import config
 
 # Logging setup
@@ -39,6 +41,12 @@ PROMETHEUS_URL = os.getenv('PROMETHEUS_URL', 'http://kube-prometheus-stack-prome
 NAMESPACE = os.getenv('NAMESPACE', 'ballandbeer')
 MODEL_TYPE = os.getenv('MODEL_TYPE', 'transformer')
 PREDICTION_INTERVAL = int(os.getenv('PREDICTION_INTERVAL', '30'))  # seconds
+MODEL_DIR = os.getenv('MODEL_DIR')  # Mount a volume here to deploy models without rebuilding
+MODEL_WATCH_INTERVAL = float(os.getenv('MODEL_WATCH_INTERVAL', str(config.MODEL_WATCH_INTERVAL)))  # 0 disables
+MODEL_QUANTIZATION = os.getenv('MODEL_QUANTIZATION') or config.MODEL_QUANTIZATION  # 'int8' or 'float16'
+INFERENCE_WORKER = os.getenv('INFERENCE_WORKER', '0').lower() in ('1', 'true', 'yes')  # transformer only
+ENSEMBLE_FALLBACK = os.getenv('ENSEMBLE_FALLBACK', config.ENSEMBLE_PARAMS['fallback'])  # MODEL_TYPE=ensemble
+ENSEMBLE_BUDGET_MS = float(os.getenv('ENSEMBLE_BUDGET_MS', str(config.ENSEMBLE_PARAMS['budget_ms'])))
 SERVICES = config.SERVICES
 
 # Prometheus metrics for KEDA
@@ -72,10 +80,30 @@ prediction_errors_counter = Counter(
     ['service', 'error_type']
 )
 
+model_reloads_counter = Counter(
+    'ml_model_reloads_total',
+    'Model version swaps performed by hot reload',
+    ['result']
+)
+
+prediction_cache_counter = Counter(
+    'ml_prediction_cache_total',
+    'Sequence-model windows served from the window cache (hit) or scored (miss)',
+    ['service', 'result']
+)
+
+prediction_path_counter = Counter(
+    'ml_prediction_path_total',
+    'Model that served each prediction (ensemble mode)',
+    ['service', 'path']
+)
+
 # Global state
 predictor: Optional[K8sAutoScalingPredictor] = None
 last_predictions: Dict[str, Dict] = {}
 prediction_task: Optional[asyncio.Task] = None
+exported_cache_stats: Dict[str, Dict[str, int]] = {}
+exported_error_stats: Dict[str, int] = {}
 
 
 # Pydantic models
@@ -89,10 +117,10 @@ class PredictionResponse(BaseModel):
     confidence: float
     timestamp: str
     lookahead_minutes: int = 10
+    served_by: Optional[str] = None
 
 
-class PredictionRequest(BaseModel):
-    service_name: str = Field(..., description="Service name")
+class MetricSample(BaseModel):
     cpu_usage_percent: float = Field(0.0, ge=0, le=100)
     ram_usage_percent: float = Field(0.0, ge=0, le=100)
     request_count_per_second: float = Field(0.0, ge=0)
@@ -112,12 +140,22 @@ class PredictionRequest(BaseModel):
     pod_restart_count: int = Field(0, ge=0)
     node_cpu_pressure_flag: int = Field(0, ge=0, le=1)
     node_memory_pressure_flag: int = Field(0, ge=0, le=1)
+    timestamp: Optional[str] = Field(None, description="ISO 8601 sample time for the time encoding (default: now)")
+
+
+class PredictionRequest(MetricSample):
+    service_name: str = Field(..., description="Service name")
+    history: List[MetricSample] = Field(
+        default_factory=list,
+        description="Earlier samples, oldest first; the request's own metrics are the latest sample"
+    )
 
 
 class HealthResponse(BaseModel):
     status: str
     model_type: str
     model_loaded: bool
+    model_version: Optional[str] = None
     services: List[str]
     lookahead_minutes: int
 
@@ -257,40 +295,10 @@ def collect_metrics_for_service(service: str) -> Optional[Dict]:
         features['node_cpu_pressure_flag'] = 0
         features['node_memory_pressure_flag'] = 0
         
-        # Engineered features (required by model - 36 features total)
-        cpu_pct = features['cpu_usage_percent']
-        ram_pct = features['ram_usage_percent']
-        replica_count = features['replica_count']
-        req_rate = features['request_count_per_second']
-        resp_time = features['response_time_ms']
-        
-        # Utilization ratios
-        features['cpu_utilization_ratio'] = cpu_pct / 100 if cpu_pct > 0 else 0
-        features['ram_utilization_ratio'] = ram_pct / 100 if ram_pct > 0 else 0
-        
-        # Change rates (defaults as no history yet)
-        features['cpu_change_rate'] = 0.0
-        features['ram_change_rate'] = 0.0
-        features['request_change_rate'] = 0.0
-        
-        # Rolling stats (estimates based on current values)
-        features['cpu_rolling_std'] = cpu_pct * 0.1
-        features['ram_rolling_std'] = ram_pct * 0.1
-        features['request_rolling_max'] = req_rate * 1.2
-        features['response_time_rolling_p95'] = resp_time * 1.2
-        
-        # Per-replica metrics
-        features['cpu_per_replica'] = cpu_pct / max(replica_count, 1)
-        features['ram_per_replica'] = ram_pct / max(replica_count, 1)
-        features['requests_per_replica'] = req_rate / max(replica_count, 1)
-        
-        # System pressure indicator
-        pressure = 0
-        if cpu_pct > 70: pressure += 1
-        if ram_pct > 75: pressure += 1
-        if resp_time > 500: pressure += 1
-        if features['error_rate'] > 0.05: pressure += 1
-        features['system_pressure'] = pressure
+        # Engineered features (lags, rolling stats, utilization ratios, time
+        # encoding, ...) are derived by the predictor from each service's recent
+        # samples, like in training (see feature_manifest.py)
+        features['timestamp'] = datetime.now().isoformat()
         
         # Incident flag
         features['is_incident'] = 0
@@ -303,44 +311,88 @@ def collect_metrics_for_service(service: str) -> Optional[Dict]:
         return None
 
 
+def export_cache_stats():
+    """Add window cache hits/misses since the last export to the Prometheus counter"""
+    for service, stats in list(predictor.cache_stats.items()):
+        exported = exported_cache_stats.setdefault(service, {'hit': 0, 'miss': 0})
+        for result in ('hit', 'miss'):
+            count = stats[result]
+            if count > exported[result]:
+                prediction_cache_counter.labels(service=service, result=result).inc(count - exported[result])
+            exported[result] = count
+
+
+def export_error_stats():
+    """Add per-service prediction failures since the last export to the error counter"""
+    for service, count in list(predictor.error_stats.items()):
+        if count > exported_error_stats.get(service, 0):
+            prediction_errors_counter.labels(service=service, error_type='prediction').inc(
+                count - exported_error_stats.get(service, 0))
+        exported_error_stats[service] = count
+
+
 async def make_predictions():
     """Make predictions for all services and update Prometheus metrics"""
     logger.info("Making predictions for all services...")
     
+    # Swap in a newly published model version between cycles; the swap re-runs
+    # the smoke prediction (and may wait on the inference worker), so keep it
+    # off the event loop
+    reload_result = await asyncio.to_thread(predictor.apply_pending_model)
+    if reload_result:
+        model_reloads_counter.labels(result=reload_result).inc()
+        logger.info(f"Model reload: {reload_result}, serving version {predictor.model_version}")
+    
+    # Collect metrics for every service first so the model runs once per cycle
+    batch_services, batch_features = [], []
     for service in SERVICES:
-        try:
-            # Collect metrics
-            features = collect_metrics_for_service(service)
-            if not features:
-                logger.warning(f"Skipping {service} due to missing metrics")
-                continue
-            
-            # Make prediction (predicts 10 minutes ahead based on model training)
-            decision = predictor.get_scaling_decision(features)
-            
-            # Update Prometheus metrics (KEDA will read these)
-            predicted_replicas_gauge.labels(service=service).set(decision['predicted_replicas'])
-            current_replicas_gauge.labels(service=service).set(decision['current_replicas'])
-            prediction_confidence_gauge.labels(service=service).set(decision['confidence'])
-            prediction_counter.labels(service=service, action=decision['action']).inc()
-            
-            # Store last prediction
-            last_predictions[service] = {
-                'timestamp': datetime.now().isoformat(),
-                'lookahead_minutes': config.LOOKAHEAD_MINUTES,
-                **decision
-            }
-            
-            logger.info(
-                f"{service}: current={decision['current_replicas']}, "
-                f"predicted={decision['predicted_replicas']} (10min ahead), "
-                f"action={decision['action']}, "
-                f"confidence={decision['confidence']}"
-            )
-            
-        except Exception as e:
-            logger.error(f"Error making prediction for {service}: {e}")
+        features = collect_metrics_for_service(service)
+        if not features:
+            logger.warning(f"Skipping {service} due to missing metrics")
+            continue
+        batch_services.append(service)
+        batch_features.append(features)
+    
+    if not batch_features:
+        return
+    
+    try:
+        # Make predictions (predicts 10 minutes ahead based on model training);
+        # off the event loop so the API and /metrics stay responsive. Per-service
+        # models fail per service (current replica count, counted in error_stats);
+        # only a shared model's failure fails the whole batch.
+        decisions = await asyncio.to_thread(predictor.get_scaling_decisions, batch_features)
+    except Exception as e:
+        logger.error(f"Error making batched prediction: {e}")
+        for service in batch_services:
             prediction_errors_counter.labels(service=service, error_type='prediction').inc()
+        return
+    
+    export_cache_stats()
+    export_error_stats()
+    
+    for service, decision in zip(batch_services, decisions):
+        # Update Prometheus metrics (KEDA will read these)
+        predicted_replicas_gauge.labels(service=service).set(decision['predicted_replicas'])
+        current_replicas_gauge.labels(service=service).set(decision['current_replicas'])
+        prediction_confidence_gauge.labels(service=service).set(decision['confidence'])
+        prediction_counter.labels(service=service, action=decision['action']).inc()
+        if 'served_by' in decision:
+            prediction_path_counter.labels(service=service, path=decision['served_by']).inc()
+        
+        # Store last prediction
+        last_predictions[service] = {
+            'timestamp': datetime.now().isoformat(),
+            'lookahead_minutes': config.LOOKAHEAD_MINUTES,
+            **decision
+        }
+        
+        logger.info(
+            f"{service}: current={decision['current_replicas']}, "
+            f"predicted={decision['predicted_replicas']} (10min ahead), "
+            f"action={decision['action']}, "
+            f"confidence={decision['confidence']}"
+        )
 
 
 async def prediction_loop():
@@ -363,8 +415,17 @@ async def lifespan(app: FastAPI):
     
     # Startup
     logger.info(f"Starting ML-Autoscaler service with model type: {MODEL_TYPE}")
-    predictor = K8sAutoScalingPredictor(model_type=MODEL_TYPE)
-    logger.info("ML Predictor initialized successfully")
+    if MODEL_TYPE == 'ensemble':
+        predictor = EnsemblePredictor(fallback_type=ENSEMBLE_FALLBACK, model_dir=MODEL_DIR,
+                                      budget_ms=ENSEMBLE_BUDGET_MS, quantization=MODEL_QUANTIZATION)
+    elif INFERENCE_WORKER:
+        predictor = InferenceWorkerPredictor(model_type=MODEL_TYPE, model_dir=MODEL_DIR, quantization=MODEL_QUANTIZATION)
+    else:
+        predictor = K8sAutoScalingPredictor(model_type=MODEL_TYPE, model_dir=MODEL_DIR, quantization=MODEL_QUANTIZATION)
+    logger.info(f"ML Predictor initialized successfully (model version: {predictor.model_version})")
+    
+    if MODEL_WATCH_INTERVAL > 0:
+        predictor.start_model_watcher(MODEL_WATCH_INTERVAL)
     
     # Start background prediction task
     prediction_task = asyncio.create_task(prediction_loop())
@@ -374,6 +435,7 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down ML-Autoscaler service...")
+    predictor.stop_model_watcher()
     if prediction_task:
         prediction_task.cancel()
         try:
@@ -399,6 +461,7 @@ async def health():
         status="healthy",
         model_type=MODEL_TYPE,
         model_loaded=predictor is not None,
+        model_version=predictor.model_version if predictor is not None else None,
         services=SERVICES,
         lookahead_minutes=config.LOOKAHEAD_MINUTES
     )
@@ -439,25 +502,40 @@ async def get_service_prediction(service: str):
     return PredictionResponse(**last_predictions[service])
 
 
+def _sample_features(sample: MetricSample, service_name: str) -> Dict:
+    """Feature dict for one manual sample, filling in missing optional fields"""
+    features = {'service_name': service_name, **sample.model_dump(exclude={'service_name', 'history'})}
+    
+    if features['cpu_usage_percent_last_5_min'] is None:
+        features['cpu_usage_percent_last_5_min'] = features['cpu_usage_percent']
+    if features['cpu_usage_percent_slope'] is None:
+        features['cpu_usage_percent_slope'] = 0.0
+    if features['ram_usage_percent_last_5_min'] is None:
+        features['ram_usage_percent_last_5_min'] = features['ram_usage_percent']
+    if features['ram_usage_percent_slope'] is None:
+        features['ram_usage_percent_slope'] = 0.0
+    if features['request_count_per_second_last_5_min'] is None:
+        features['request_count_per_second_last_5_min'] = features['request_count_per_second']
+    return features
+
+
 @app.post("/predict", response_model=PredictionResponse)
 async def predict(request: PredictionRequest):
-    """Manual prediction endpoint (for testing)"""
+    """
+    Manual prediction endpoint (for testing)
+    
+    Stateless: the window is request.history plus the request's own metrics,
+    and the live per-service buffers used by the prediction loop are never
+    touched. Sequence models need a full window in history to predict.
+    """
     try:
-        features = request.model_dump()
-        
-        # Fill in missing optional fields
-        if features['cpu_usage_percent_last_5_min'] is None:
-            features['cpu_usage_percent_last_5_min'] = features['cpu_usage_percent']
-        if features['cpu_usage_percent_slope'] is None:
-            features['cpu_usage_percent_slope'] = 0.0
-        if features['ram_usage_percent_last_5_min'] is None:
-            features['ram_usage_percent_last_5_min'] = features['ram_usage_percent']
-        if features['ram_usage_percent_slope'] is None:
-            features['ram_usage_percent_slope'] = 0.0
-        if features['request_count_per_second_last_5_min'] is None:
-            features['request_count_per_second_last_5_min'] = features['request_count_per_second']
+        window = [
+            _sample_features(sample, request.service_name)
+            for sample in [*request.history, request]
+        ]
         
-        decision = predictor.get_scaling_decision(features)
+        # Inference runs in a worker thread so the event loop keeps serving
+        decision = await asyncio.to_thread(predictor.get_window_decision, window)
         decision['timestamp'] = datetime.now().isoformat()
         decision['lookahead_minutes'] = config.LOOKAHEAD_MINUTES
         
@@ -10,6 +10,21 @@ BASE_DIR = Path(__file__).parent
 S3_BUCKET = 'ballandbeer-metrics'
 S3_PREFIX = 'metrics/'
 AWS_REGION = 'ap-southeast-1'
+# Downloaded objects are kept here under their S3 key and ETag, so unchanged
+# days are not downloaded again (DataPreprocessor.download_data_from_s3)
+S3_CACHE_DIR = BASE_DIR / 'metrics' / 's3_cache'
+S3_DOWNLOAD_WORKERS = 8
+
+# Relative change of the winsorization thresholds up to which cached engineered
+# days are reused (DataPreprocessor.load_engineered_folder). 0 keeps training
+# exact: cached days are only reused while the thresholds are unchanged. Above
+# 0, a retrain may clean with thresholds that far from the folder's current ones.
+FEATURE_CACHE_THRESHOLD_TOLERANCE = 0.0
+
+# Relative error of the quantile sketches (training/quantile_sketch.py) behind
+# the winsorization thresholds of per-day preprocessing and the streamed
+# robust scalers of feature_shards.py
+QUANTILE_SKETCH_ACCURACY = 0.005
 
 # Data Configuration
 # Profile service excluded - rarely scales, not worth predicting
@@ -78,12 +93,50 @@ TEST_SIZE = 0.2
 VALIDATION_SPLIT = 0.2
 RANDOM_STATE = 42
 
+# Processes training per-service models in parallel (training/parallel_training.py;
+# None: one per service, up to the CPU count). Each worker's TF, Random Forest
+# and CatBoost thread pools are capped at cpu_count // workers threads
+TRAINING_WORKERS = None
+
 # Output paths (absolute paths relative to ml-autoscaler/)
 MODEL_OUTPUT_DIR = BASE_DIR / 'models'
 METRICS_OUTPUT_DIR = BASE_DIR / 'evaluation'
 PLOTS_OUTPUT_DIR = BASE_DIR / 'plots'
 COMPARISON_OUTPUT_DIR = BASE_DIR / 'training' / 'comparison_results'
 
+# Versioned model deployment (hot reload without rebuilding the image)
+# models/CURRENT holds the active version name, versions live in models/versions/<name>/
+MODEL_POINTER_FILE = 'CURRENT'
+MODEL_VERSIONS_DIR = 'versions'
+MODEL_WATCH_INTERVAL = 60        # Seconds between checks for a new model version
+
+# Serve transformer_model.<variant>.tflite instead of the float32 Keras model
+# ('int8', 'float16' or None); produced by training/quantize_transformer.py
+MODEL_QUANTIZATION = None
+
+# Reuse a service's last transformer/LSTM-CNN output while its scaled window is
+# unchanged to within this tolerance (in standardized units; 0 disables)
+PREDICTION_CACHE_TOLERANCE = 0.01
+
+# Threads scoring per-service models concurrently (None: one per CPU core)
+INFERENCE_WORKERS = None
+
+# Out-of-process transformer inference (INFERENCE_WORKER=1 in the deployment):
+# the model runs in a child process reading windows from shared memory
+INFERENCE_WORKER_PARAMS = {
+    'max_services': 64,  # Window slots in the shared block
+    'timeout': 30,       # Seconds to wait for a reply before restarting the worker
+    'cpus': None         # CPU ids to pin the worker to (None: no pinning)
+}
+
+# Ensemble serving (MODEL_TYPE=ensemble): the per-service tree model is always
+# computed and serves any service the transformer cannot answer within budget
+ENSEMBLE_PARAMS = {
+    'primary': 'transformer',
+    'fallback': 'random_forest',  # or 'catboost'
+    'budget_ms': 500              # Per-cycle latency budget for the primary
+}
+
 # Scaling thresholds for determining when to scale
 SCALE_UP_THRESHOLDS = {
     'cpu_usage_percent': 60,     # Lower than typical 70-80% - scale earlier
@@ -0,0 +1,210 @@
+"""
+Engineered features shared by training and serving
+
+DataPreprocessor.engineer_features derives these columns from the cleaned
+metrics of every service. At serving time the same functions run over each
+service's last HISTORY_ROWS samples (see sample_features and the 'engineered'
+derivation in feature_manifest.py), so the models see the inputs they were
+trained on.
+"""
+
+from typing import Dict, Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+from pandas.api.indexers import BaseIndexer
+
+# Rolling statistics span 10 samples = 5 minutes
+ROLLING_WINDOW = 10
+# Preceding samples of a service that one row depends on (lag 10, 10-sample rolling windows)
+HISTORY_ROWS = 10
+
+# Engineered features used for training (after config.FEATURE_COLUMNS)
+ENGINEERED_FEATURES = [
+    # Time encoding
+    'hour_sin', 'hour_cos', 'dow_sin', 'dow_cos',
+    # Utilization
+    'cpu_utilization_ratio', 'ram_utilization_ratio',
+    # Lag features
+    'cpu_lag_1', 'cpu_lag_5', 'cpu_lag_10',
+    'ram_lag_1', 'ram_lag_5', 'ram_lag_10',
+    'rps_lag_1', 'rps_lag_5', 'rps_lag_10',
+    # Rate of change
+    'cpu_change_rate', 'ram_change_rate', 'request_change_rate',
+    # Acceleration
+    'cpu_acceleration', 'rps_acceleration',
+    # Rolling statistics
+    'cpu_rolling_mean', 'ram_rolling_mean', 'rps_rolling_mean',
+    'cpu_rolling_std', 'ram_rolling_std', 'rps_rolling_std',
+    'request_rolling_max', 'response_time_rolling_p95',
+    # Spike detection
+    'cpu_spike_flag', 'rps_spike_flag',
+    # Pressure
+    'system_pressure'
+]
+
+# Raw metrics read from serving samples, with the value used when one is
+# missing (the raw defaults of feature_manifest.FEATURE_DERIVATIONS)
+SAMPLE_DEFAULTS = {
+    'cpu_usage_percent': 0.0,
+    'ram_usage_percent': 0.0,
+    'request_count_per_second': 0.0,
+    'response_time_ms': 200.0,
+    'error_rate': 0.0,
+    'cpu_request': 0.1,
+    'cpu_limit': 0.5,
+    'ram_request': 536870912.0,
+    'ram_limit': 1073741824.0,
+}
+
+
+class ServiceWindowIndexer(BaseIndexer):
+    """
+    Trailing rolling windows that stop at the start of each service's rows
+
+    Expects group_starts: for every row, the position of the first row of its
+    service (rows sorted by service).
+    """
+
+    def get_window_bounds(self, num_values=0, min_periods=None, center=None, closed=None, step=None):
+        end = np.arange(1, num_values + 1, dtype=np.int64)
+        start = np.maximum(end - self.window_size, self.group_starts).astype(np.int64)
+        return start, end
+
+
+def time_encoding(hour, day_of_week, dtype=np.float64) -> Dict:
+    """Cyclical (sin/cos) encoding of hour of day and day of week"""
+    return {
+        'hour_sin': np.sin(2 * np.pi * hour / 24).astype(dtype),
+        'hour_cos': np.cos(2 * np.pi * hour / 24).astype(dtype),
+        'dow_sin': np.sin(2 * np.pi * day_of_week / 7).astype(dtype),
+        'dow_cos': np.cos(2 * np.pi * day_of_week / 7).astype(dtype),
+    }
+
+
+def normalize_resources(df: pd.DataFrame, dtype=np.float64):
+    """Convert resource requests/limits in place (CPU / 1000, bytes to GB), clipped to [0, 100]"""
+    df['cpu_request'] = np.clip(df['cpu_request'] / 1000, 0, 100)
+    df['cpu_limit'] = np.clip(df['cpu_limit'] / 1000, 0, 100)
+    df['ram_request'] = np.clip(df['ram_request'] / (1024**3), 0, 100).astype(dtype)
+    df['ram_limit'] = np.clip(df['ram_limit'] / (1024**3), 0, 100).astype(dtype)
+
+
+def service_features(df: pd.DataFrame, dtype=np.float64) -> pd.DataFrame:
+    """
+    Lag, rate, rolling and spike features of service-sorted rows
+    
+    One pass over the whole frame: shifts are masked where they would reach
+    into the previous service's rows, and rolling windows are clipped at the
+    start of each service's run (ServiceWindowIndexer), so the values match
+    computing every service separately.
+    """
+    base = {'cpu': 'cpu_usage_percent', 'ram': 'ram_usage_percent', 'rps': 'request_count_per_second'}
+    
+    # Position of every row within its service's run
+    services = df['service_name'].to_numpy()
+    positions = np.arange(len(df))
+    run_start = np.r_[True, services[1:] != services[:-1]]
+    group_starts = np.maximum.accumulate(np.where(run_start, positions, 0))
+    offset = positions - group_starts
+    
+    signals = df[list(base.values())].to_numpy(dtype=np.float64)
+    
+    def shifted(values, lag):
+        out = np.full_like(values, np.nan)
+        out[lag:] = values[:-lag]
+        out[offset < lag] = np.nan
+        return out
+    
+    # A NaN first change per service also makes the first acceleration NaN
+    change = signals - shifted(signals, 1)
+    acceleration = change - shifted(change, 1)
+    
+    # Shared rolling object over the three load signals
+    indexer = ServiceWindowIndexer(window_size=ROLLING_WINDOW, group_starts=group_starts)
+    rolling = df[list(base.values())].rolling(window=indexer, min_periods=1)
+    rolling_mean = rolling.mean()
+    rolling_std = rolling.std()
+    
+    features = {
+        # Resource utilization ratios
+        'cpu_utilization_ratio': df['cpu_usage_percent'] / (df['cpu_limit'] + 1e-6),
+        'ram_utilization_ratio': df['ram_usage_percent'] / (df['ram_limit'] + 1e-6)
+    }
+    
+    # Lag features (t-1, t-5, t-10 for capturing recent history)
+    for lag in [1, 5, 10]:
+        lagged = shifted(signals, lag)
+        for i, prefix in enumerate(base):
+            features[f'{prefix}_lag_{lag}'] = lagged[:, i]
+    
+    # Rate of change (first derivative) and acceleration (second derivative)
+    features['cpu_change_rate'] = change[:, 0]
+    features['ram_change_rate'] = change[:, 1]
+    features['request_change_rate'] = change[:, 2]
+    features['cpu_acceleration'] = acceleration[:, 0]
+    features['rps_acceleration'] = acceleration[:, 2]
+    
+    # Rolling mean for smoothing, std for volatility detection
+    for prefix, col in base.items():
+        features[f'{prefix}_rolling_mean'] = rolling_mean[col]
+    for prefix, col in base.items():
+        features[f'{prefix}_rolling_std'] = rolling_std[col]
+    
+    # Rolling max/p95 for peak detection
+    features['request_rolling_max'] = (
+        df['request_count_per_second'].rolling(window=indexer, min_periods=1).max()
+    )
+    features['response_time_rolling_p95'] = (
+        df['response_time_ms'].rolling(window=indexer, min_periods=1).quantile(0.95)
+    )
+    
+    # Spike/burst detection (values exceeding 1.5*std)
+    for prefix in ('cpu', 'rps'):
+        col = base[prefix]
+        features[f'{prefix}_spike_flag'] = (
+            (df[col] - rolling_mean[col]) > 1.5 * rolling_std[col]
+        ).astype(int)
+    
+    # System pressure indicator (combined thresholds)
+    features['system_pressure'] = (
+        (df['cpu_usage_percent'] > 70).astype(int) +
+        (df['ram_usage_percent'] > 75).astype(int) +
+        (df['response_time_ms'] > 500).astype(int) +
+        (df['error_rate'] > 0.05).astype(int)
+    )
+    
+    # Columns used to be filled in with .loc over NaN, so they are all float
+    return pd.DataFrame(features, index=df.index).astype(dtype)
+
+
+def sample_features(runs: Sequence[Sequence[Mapping]]) -> pd.DataFrame:
+    """
+    ENGINEERED_FEATURES of serving samples
+
+    Args:
+        runs: Consecutive samples of one service each, oldest first. Every
+              run is engineered on its own, like one service's rows in
+              training: its first rows have no lags (0, as in training).
+
+    Returns:
+        One row per sample, runs concatenated in order
+    """
+    samples = [sample for run in runs for sample in run]
+    df = pd.DataFrame({
+        name: np.array([sample.get(name) for sample in samples], dtype=np.float64)
+        for name in SAMPLE_DEFAULTS
+    })
+    for name, default in SAMPLE_DEFAULTS.items():
+        df[name] = df[name].fillna(default)
+    # Runs are told apart by position, so two runs of the same service stay separate
+    df['service_name'] = np.repeat(np.arange(len(runs)), [len(run) for run in runs])
+    normalize_resources(df)
+
+    now = pd.Timestamp.now().isoformat()
+    timestamps = pd.DatetimeIndex(pd.to_datetime([sample.get('timestamp') or now for sample in samples],
+                                                 format='ISO8601'))
+    features = service_features(df)
+    for name, values in time_encoding(timestamps.hour.to_numpy(), timestamps.dayofweek.to_numpy()).items():
+        features[name] = values
+    return features[ENGINEERED_FEATURES].fillna(0)
@@ -0,0 +1,201 @@
+"""
+Deadline-bounded ensemble of a sequence model and a cheap per-service model
+
+Every cycle the fallback (per-service Random Forest / CatBoost) prediction is
+always computed. The primary (transformer) forward pass runs in a worker
+thread under a per-cycle latency budget; services are served by the primary
+when it answers in time and by the fallback otherwise, so a stalled forward
+pass (GC pause, CPU throttling at the pod limit) cannot hold up the cycle.
+
+Rows are appended to the primary's sequence buffers on the calling thread
+before the forward pass is submitted, so a timed-out pass never leaves gaps
+in the windows. While a previous pass is still running no new one is
+started.
+
+Served paths (decision['served_by']):
+    primary           transformer answered within the budget
+    fallback_warmup   transformer window not full yet
+    fallback_timeout  transformer exceeded the budget
+    fallback_busy     previous transformer pass still running
+    fallback_error    transformer raised
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional, Tuple
+
+import config
+from inference import K8sAutoScalingPredictor
+
+logger = logging.getLogger(__name__)
+
+SERVED_PATHS = ('primary', 'fallback_warmup', 'fallback_timeout', 'fallback_busy', 'fallback_error')
+
+
+class EnsemblePredictor:
+    """
+    Transformer with a per-cycle deadline and a per-service tree fallback
+
+    Exposes the subset of the K8sAutoScalingPredictor API used by app.py.
+    """
+
+    def __init__(self, primary_type: str = None, fallback_type: str = None, model_dir: str = None,
+                 budget_ms: float = None, quantization: Optional[str] = None):
+        """
+        Args:
+            primary_type: Sequence model under the deadline ('transformer' or 'lstm_cnn')
+            fallback_type: Always-computed model ('random_forest' or 'catboost')
+            model_dir: Model root shared by both predictors
+            budget_ms: Per-cycle latency budget for the primary
+            quantization: Passed to the primary predictor
+        """
+        params = config.ENSEMBLE_PARAMS
+        primary_type = primary_type or params['primary']
+        fallback_type = fallback_type or params['fallback']
+        if primary_type not in ('transformer', 'lstm_cnn'):
+            raise ValueError(f"Ensemble primary must be a sequence model, got {primary_type}")
+
+        self.model_type = 'ensemble'
+        self.budget = (budget_ms if budget_ms is not None else params['budget_ms']) / 1000
+        self.primary = K8sAutoScalingPredictor(model_type=primary_type, model_dir=model_dir,
+                                               quantization=quantization)
+        self.fallback = K8sAutoScalingPredictor(model_type=fallback_type, model_dir=model_dir)
+        self.last_paths = {}  # service -> served path of the last cycle
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ensemble-primary')
+        self._inflight = None
+
+    @property
+    def model_version(self) -> str:
+        return f"{self.primary.model_version}+{self.fallback.model_version}"
+
+    @property
+    def cache_stats(self) -> Dict:
+        return self.primary.cache_stats
+
+    @property
+    def error_stats(self) -> Dict:
+        errors = dict(self.primary.error_stats)
+        for service, count in self.fallback.error_stats.items():
+            errors[service] = errors.get(service, 0) + count
+        return errors
+
+    def _primary_busy(self) -> bool:
+        return self._inflight is not None and not self._inflight.done()
+
+    def predict_batch_with_paths(self, features_list: List[Dict]) -> Tuple[List[int], List[str]]:
+        """
+        Predict replica counts and report which model served each service
+
+        Returns:
+            (predicted replica counts, served paths) aligned with features_list
+        """
+        if not features_list:
+            return [], []
+        deadline = time.perf_counter() + self.budget
+
+        # Keep the primary windows current even when its forward pass is skipped
+        busy = self._primary_busy()
+        ready, sequences = self.primary.buffer_batch(features_list)
+        future = None
+        if ready and not busy:
+            service_names = [features_list[i].get('service_name', 'unknown') for i in ready]
+            future = self._executor.submit(self.primary.forward_batch, sequences, service_names=service_names)
+            self._inflight = future
+
+        # The cheap answer is always computed, overlapping the primary pass
+        predictions = self.fallback.predict_batch(features_list)
+        paths = ['fallback_warmup'] * len(features_list)
+
+        if ready:
+            path = 'fallback_busy'
+            if future is not None:
+                try:
+                    outputs = future.result(timeout=max(deadline - time.perf_counter(), 0))
+                except FutureTimeoutError:
+                    path = 'fallback_timeout'
+                    logger.warning(f"Primary model exceeded the {self.budget * 1000:.0f}ms budget, serving fallback")
+                except Exception as e:
+                    path = 'fallback_error'
+                    logger.error(f"Primary model failed, serving fallback: {e}")
+                else:
+                    path = 'primary'
+                    replicas = self.primary.outputs_to_replicas([features_list[i] for i in ready], outputs)
+                    for i, replica_count in zip(ready, replicas):
+                        predictions[i] = replica_count
+            for i in ready:
+                paths[i] = path
+
+        for features, path in zip(features_list, paths):
+            self.last_paths[features.get('service_name', 'unknown')] = path
+        return predictions, paths
+
+    def predict_batch(self, features_list: List[Dict]) -> List[int]:
+        return self.predict_batch_with_paths(features_list)[0]
+
+    def predict_single(self, features: Dict) -> int:
+        return self.predict_batch([features])[0]
+
+    def get_scaling_decisions(self, features_list: List[Dict]) -> List[Dict]:
+        """Scaling decisions with the served path recorded as decision['served_by']"""
+        predictions, paths = self.predict_batch_with_paths(features_list)
+        decisions = self.primary.get_scaling_decisions(features_list, predictions=predictions)
+        for decision, path in zip(decisions, paths):
+            decision['served_by'] = path
+        return decisions
+
+    def get_scaling_decision(self, features: Dict) -> Dict:
+        return self.get_scaling_decisions([features])[0]
+
+    def get_window_decisions(self, histories: List[List[Dict]]) -> List[Dict]:
+        """
+        Stateless decisions from explicit sample windows
+
+        Runs on the calling thread without the deadline worker, so it never
+        competes with the prediction loop for the in-flight slot.
+        """
+        predictions = self.fallback.predict_windows(histories)
+        seq_length = self.primary._sequence_length()
+        paths = ['fallback_warmup'] * len(histories)
+
+        ready = [i for i, history in enumerate(histories) if len(history) >= seq_length]
+        if ready:
+            try:
+                primary = self.primary.predict_windows([histories[i] for i in ready])
+            except Exception as e:
+                logger.error(f"Primary model failed, serving fallback: {e}")
+                for i in ready:
+                    paths[i] = 'fallback_error'
+            else:
+                for i, replica_count in zip(ready, primary):
+                    predictions[i] = replica_count
+                    paths[i] = 'primary'
+
+        decisions = self.primary.get_window_decisions(histories, predictions=predictions)
+        for decision, path in zip(decisions, paths):
+            decision['served_by'] = path
+        return decisions
+
+    def get_window_decision(self, history: List[Dict]) -> Dict:
+        return self.get_window_decisions([history])[0]
+
+    def apply_pending_model(self) -> Optional[str]:
+        """Swap staged versions of either model; the primary waits for its in-flight pass"""
+        results = [self.fallback.apply_pending_model()]
+        if not self._primary_busy():
+            results.append(self.primary.apply_pending_model())
+        return next((result for result in results if result), None)
+
+    def start_model_watcher(self, interval: float = None):
+        self.primary.start_model_watcher(interval)
+        self.fallback.start_model_watcher(interval)
+
+    def stop_model_watcher(self):
+        self.primary.stop_model_watcher()
+        self.fallback.stop_model_watcher()
+        self._executor.shutdown(wait=False)
+
+    def reset_sequence_buffer(self, service_name: str = None):
+        self.primary.reset_sequence_buffer(service_name)
+        self.fallback.reset_sequence_buffer(service_name)
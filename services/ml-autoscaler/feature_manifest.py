@@ -0,0 +1,345 @@
+"""
+Feature manifest and compiled feature extractor
+
+Training writes a manifest describing the model input: the ordered feature
+names, how each one is derived from a raw metrics dict, and the default used
+when a metric is missing. Inference compiles the manifest once into a
+FeatureExtractor that fills a preallocated array from the feature dicts of a
+prediction cycle (or any columnar batch).
+
+Derivations:
+    value            features[source], else features[fallback] * fallback_scale,
+                     else default; the result is multiplied by scale
+    per_replica      features[source] / max(features['replica_count'], 1)
+    threshold_count  number of thresholds exceeded ({feature: threshold})
+    one_hot          1 if features[source] == value else 0
+    engineered       computed like in training from the service's last samples
+                     (lags, rolling stats, utilization, time encoding; see
+                     engineered_features.py)
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+from engineered_features import ENGINEERED_FEATURES, HISTORY_ROWS, sample_features
+
+logger = logging.getLogger(__name__)
+
+FEATURE_MANIFEST_VERSION = 1
+FEATURE_MANIFEST_FILE = 'feature_manifest.json'
+
+DERIVATIONS = ('value', 'per_replica', 'threshold_count', 'one_hot', 'engineered')
+
+SERVICE_ONE_HOT = ['authen', 'booking', 'frontend', 'order', 'product', 'profile', 'recommender']
+
+# Serving-time derivation for every feature name the models know about.
+# Names not listed here (other than service one-hots) cannot be served and are
+# rejected when a manifest is built or compiled.
+FEATURE_DERIVATIONS = {
+    # CPU metrics
+    'cpu_usage_percent': {'derivation': 'value', 'default': 0.0},
+    'cpu_usage_percent_last_5_min': {'derivation': 'value', 'fallback': 'cpu_usage_percent', 'default': 0.0},
+    'cpu_usage_percent_slope': {'derivation': 'value', 'default': 0.0},
+
+    # RAM metrics
+    'ram_usage_percent': {'derivation': 'value', 'default': 0.0},
+    'ram_usage_percent_last_5_min': {'derivation': 'value', 'fallback': 'ram_usage_percent', 'default': 0.0},
+    'ram_usage_percent_slope': {'derivation': 'value', 'default': 0.0},
+
+    # Request metrics
+    'request_count_per_second': {'derivation': 'value', 'default': 0.0},
+    'request_count_per_second_last_5_min': {'derivation': 'value', 'fallback': 'request_count_per_second', 'default': 0.0},
+    'response_time_ms': {'derivation': 'value', 'default': 200.0},
+
+    # Resource limits (CPU / 1000 and RAM in GB, as normalized by engineer_features)
+    'cpu_request': {'derivation': 'value', 'default': 0.1, 'scale': 1 / 1000},
+    'cpu_limit': {'derivation': 'value', 'default': 0.5, 'scale': 1 / 1000},
+    'ram_request': {'derivation': 'value', 'default': 536870912.0, 'scale': 1 / (1024 ** 3)},
+    'ram_limit': {'derivation': 'value', 'default': 1073741824.0, 'scale': 1 / (1024 ** 3)},
+
+    # Utilization, lags, change rates, rolling stats, spikes, pressure and
+    # time encoding, derived from the service's recent samples
+    **{name: {'derivation': 'engineered'} for name in ENGINEERED_FEATURES},
+
+    # Per-replica metrics
+    'cpu_per_replica': {'derivation': 'per_replica', 'source': 'cpu_usage_percent', 'default': 0.0},
+    'ram_per_replica': {'derivation': 'per_replica', 'source': 'ram_usage_percent', 'default': 0.0},
+    'requests_per_replica': {'derivation': 'per_replica', 'source': 'request_count_per_second', 'default': 0.0},
+}
+
+# Input layout of the PCA transformer served by K8sAutoScalingPredictor
+TRANSFORMER_FEATURES = [
+    'cpu_usage_percent', 'cpu_usage_percent_last_5_min', 'cpu_usage_percent_slope',
+    'ram_usage_percent', 'ram_usage_percent_last_5_min', 'ram_usage_percent_slope',
+    'request_count_per_second', 'request_count_per_second_last_5_min', 'response_time_ms',
+    'cpu_request', 'cpu_limit', 'ram_request', 'ram_limit',
+    'cpu_utilization_ratio', 'ram_utilization_ratio',
+    'cpu_change_rate', 'ram_change_rate', 'request_change_rate',
+    'cpu_rolling_std', 'ram_rolling_std', 'request_rolling_max', 'response_time_rolling_p95',
+    'cpu_per_replica', 'ram_per_replica', 'requests_per_replica',
+    'system_pressure',
+] + [f'service_{service}' for service in SERVICE_ONE_HOT]
+
+
+def feature_spec(name: str) -> Dict:
+    """Manifest entry for a feature name; raises for names with no serving-time derivation"""
+    if name in FEATURE_DERIVATIONS:
+        spec = {'name': name, 'source': name}
+        spec.update(FEATURE_DERIVATIONS[name])
+        return spec
+    if name.startswith('service_'):
+        return {'name': name, 'derivation': 'one_hot', 'source': 'service_name', 'value': name[len('service_'):]}
+    raise ValueError(f"Feature {name!r} has no serving-time derivation (add it to FEATURE_DERIVATIONS)")
+
+
+def build_feature_manifest(feature_names: Sequence[str]) -> Dict:
+    """Build a manifest for an ordered list of model input features"""
+    return {
+        'version': FEATURE_MANIFEST_VERSION,
+        'features': [feature_spec(name) for name in feature_names]
+    }
+
+
+def default_transformer_manifest() -> Dict:
+    """Manifest for models trained before manifests were emitted"""
+    return build_feature_manifest(TRANSFORMER_FEATURES)
+
+
+def save_feature_manifest(manifest: Dict, path) -> Path:
+    """Write a manifest as JSON"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+
+def load_feature_manifest(path) -> Dict:
+    """Read a manifest written by save_feature_manifest"""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+class FeatureExtractor:
+    """
+    Feature extractor compiled from a manifest
+
+    Entries are grouped by derivation once at construction; batches are
+    filled with one vectorized operation per feature group. Engineered
+    features need each service's preceding samples: history_rows of them
+    (0 when the manifest has none).
+    """
+
+    def __init__(self, manifest: Dict):
+        if manifest.get('version') != FEATURE_MANIFEST_VERSION:
+            raise ValueError(
+                f"Unsupported feature manifest version {manifest.get('version')!r}, "
+                f"expected {FEATURE_MANIFEST_VERSION}"
+            )
+
+        features = manifest.get('features')
+        if not features:
+            raise ValueError("Feature manifest has no features")
+
+        # Entries written before the current serving derivation of a known
+        # feature (e.g. estimated rolling stats) would not match training
+        stale = [spec['name'] for spec in features
+                 if spec['name'] in FEATURE_DERIVATIONS and spec != feature_spec(spec['name'])]
+        if stale:
+            logger.warning(f"Feature manifest entries {stale} predate the current serving derivations, using those")
+            features = [feature_spec(spec['name']) if spec['name'] in stale else spec for spec in features]
+
+        unknown = [spec['name'] for spec in features
+                   if spec['name'] not in FEATURE_DERIVATIONS and spec.get('derivation') != 'one_hot']
+        if unknown:
+            raise ValueError(f"Feature manifest has features with no serving-time derivation: {unknown}")
+
+        self.manifest = manifest
+        self.feature_names = [spec['name'] for spec in features]
+        if len(set(self.feature_names)) != len(self.feature_names):
+            raise ValueError("Feature manifest contains duplicate feature names")
+        self.n_features = len(self.feature_names)
+
+        self._values = []        # (index, source, fallback, fallback_scale, default, scale)
+        self._per_replica = []   # (index, source, default)
+        self._thresholds = []    # (index, [(source, threshold), ...])
+        self._one_hot = {}       # source -> {value: index}
+        self._engineered = []    # (index, name)
+        self._scale = np.ones(self.n_features)
+
+        for index, spec in enumerate(features):
+            derivation = spec.get('derivation')
+            if derivation not in DERIVATIONS:
+                raise ValueError(f"Unknown derivation {derivation!r} for feature {spec['name']!r}")
+
+            if derivation == 'value':
+                self._values.append((
+                    index,
+                    spec.get('source', spec['name']),
+                    spec.get('fallback'),
+                    float(spec.get('fallback_scale', 1.0)),
+                    float(spec.get('default', 0.0)),
+                    float(spec.get('scale', 1.0))
+                ))
+                self._scale[index] = float(spec.get('scale', 1.0))
+            elif derivation == 'per_replica':
+                self._per_replica.append((index, spec['source'], float(spec.get('default', 0.0))))
+            elif derivation == 'threshold_count':
+                self._thresholds.append((index, [(k, float(v)) for k, v in spec['thresholds'].items()]))
+            elif derivation == 'engineered':
+                self._engineered.append((index, spec['name']))
+            else:
+                self._one_hot.setdefault(spec['source'], {})[spec['value']] = index
+
+        self._scaled = not np.all(self._scale == 1.0)
+        self.history_rows = HISTORY_ROWS if self._engineered else 0
+
+    def validate(self, n_features: int = None, feature_names: Optional[Sequence[str]] = None):
+        """Raise if the manifest does not match what a model/scaler expects"""
+        if n_features is not None and n_features != self.n_features:
+            raise ValueError(
+                f"Feature manifest has {self.n_features} features but the model expects {n_features}"
+            )
+        if feature_names is not None and list(feature_names) != self.feature_names:
+            missing = [name for name in feature_names if name not in self.feature_names]
+            raise ValueError(
+                f"Feature manifest order does not match the model input (missing: {missing})"
+            )
+
+    def extract_batch(self, columns: Mapping[str, Sequence], n_rows: int = None,
+                      out: np.ndarray = None) -> np.ndarray:
+        """
+        Fill a (n_rows, n_features) matrix from columnar data
+
+        Args:
+            columns: Mapping of raw feature name -> sequence of values. Missing
+                     columns and NaN/None entries use the fallback/default.
+                     Engineered features are read from columns of their own
+                     name (extract_records/extract_window compute them).
+            n_rows: Number of rows (inferred from the columns if omitted)
+        """
+        if n_rows is None:
+            n_rows = len(next(iter(columns.values()))) if columns else 0
+        if out is None:
+            out = np.empty((n_rows, self.n_features), dtype=np.float32)
+
+        cache = {}
+
+        def column(name):
+            if name not in cache:
+                values = columns.get(name)
+                cache[name] = None if values is None else np.asarray(
+                    [np.nan if v is None else v for v in values] if isinstance(values, list) else values,
+                    dtype=np.float64
+                )
+            return cache[name]
+
+        for index, source, fallback, fallback_scale, default, _ in self._values:
+            values = column(source)
+            if values is None or np.isnan(values).any():
+                backup = column(fallback) if fallback is not None else None
+                backup = np.full(n_rows, default) if backup is None else np.where(
+                    np.isnan(backup), default, backup * fallback_scale)
+                values = backup if values is None else np.where(np.isnan(values), backup, values)
+            out[:, index] = values
+
+        if self._per_replica:
+            replicas = column('replica_count')
+            replicas = np.ones(n_rows) if replicas is None else np.maximum(np.nan_to_num(replicas, nan=1.0), 1)
+            for index, source, default in self._per_replica:
+                values = column(source)
+                values = np.full(n_rows, default) if values is None else np.where(np.isnan(values), default, values)
+                out[:, index] = values / replicas
+
+        for index, thresholds in self._thresholds:
+            count = np.zeros(n_rows)
+            for source, threshold in thresholds:
+                values = column(source)
+                if values is not None:
+                    count += np.nan_to_num(values, nan=0.0) > threshold
+            out[:, index] = count
+
+        for index, name in self._engineered:
+            values = column(name)
+            if values is None:
+                raise ValueError(f"Engineered feature {name!r} is derived from sample history, "
+                                 f"use extract_records or extract_window")
+            out[:, index] = values
+
+        for source, indices in self._one_hot.items():
+            values = columns.get(source)
+            labels = np.asarray(values if values is not None else ['unknown'] * n_rows, dtype=object)
+            for value, index in indices.items():
+                out[:, index] = labels == value
+
+        if self._scaled:
+            out *= self._scale
+        return out
+
+    def extract_records(self, records: Sequence[Mapping], histories: Optional[Sequence[Sequence[Mapping]]] = None,
+                        out: np.ndarray = None) -> np.ndarray:
+        """
+        Fill a (len(records), n_features) matrix from a list of feature dicts
+
+        Args:
+            histories: Per record, the preceding samples of its service (oldest
+                       first; the last history_rows are used). Engineered
+                       features of a record without history are those of a
+                       service's first sample.
+        """
+        columns = self._raw_columns(records)
+        if self._engineered:
+            runs = [[*history[-self.history_rows:], record]
+                    for record, history in zip(records, histories or [()] * len(records))]
+            engineered = sample_features(runs)
+            latest = np.cumsum([len(run) for run in runs]) - 1
+            for _, name in self._engineered:
+                columns[name] = engineered[name].to_numpy()[latest]
+        return self.extract_batch(columns, n_rows=len(records), out=out)
+
+    def extract_window(self, samples: Sequence[Mapping], out: np.ndarray = None) -> np.ndarray:
+        """Fill a (len(samples), n_features) matrix from consecutive samples of one service, oldest first"""
+        columns = self._raw_columns(samples)
+        if self._engineered:
+            engineered = sample_features([samples])
+            for _, name in self._engineered:
+                columns[name] = engineered[name].to_numpy()
+        return self.extract_batch(columns, n_rows=len(samples), out=out)
+
+    def _raw_columns(self, records: Sequence[Mapping]) -> Dict[str, list]:
+        """Columns of the raw metrics the non-engineered entries read"""
+        names = set()
+        for _, source, fallback, _, _, _ in self._values:
+            names.add(source)
+            if fallback is not None:
+                names.add(fallback)
+        names.update(source for _, source, _ in self._per_replica)
+        names.update(source for _, thresholds in self._thresholds for source, _ in thresholds)
+        if self._per_replica:
+            names.add('replica_count')
+
+        columns = {name: [record.get(name) for record in records] for name in names}
+        for source in self._one_hot:
+            columns[source] = [record.get(source, 'unknown') for record in records]
+        return columns
+
+
+def load_feature_extractor(model_dir, default_features: Optional[List[str]] = None) -> FeatureExtractor:
+    """
+    Compile the manifest stored next to a model
+
+    Falls back to a manifest built from default_features (or the transformer
+    layout) for models trained before manifests were emitted.
+    """
+    manifest_path = Path(model_dir) / FEATURE_MANIFEST_FILE
+    if manifest_path.exists():
+        return FeatureExtractor(load_feature_manifest(manifest_path))
+
+    logger.warning(f"No feature manifest in {model_dir}, using the built-in feature layout")
+    if default_features is None:
+        return FeatureExtractor(default_transformer_manifest())
+    return FeatureExtractor(build_feature_manifest(default_features))
@@ -0,0 +1,362 @@
+"""
+Rotary transformer with cached attention state for incremental inference
+
+The per-service transformer adds an absolute sinusoidal encoding to every
+timestep, so when the window slides by one sample every position's encoding
+(and every attention output) changes and the whole window must be
+recomputed. This variant instead:
+
+1. Encodes positions with rotary embeddings (RoPE) inside attention, so a
+   query/key score depends only on their distance.
+2. Restricts causal attention to a band of the last `band` steps, so a
+   step's hidden state never depends on where the window starts.
+3. Pools the last step and the mean of the last `pool` steps.
+
+With num_blocks * (band - 1) + pool <= sequence_length the prediction for a
+full window equals streaming the samples one at a time through
+IncrementalTransformer, which caches each layer's keys/values for the last
+`band` steps and computes only the newest position per cycle.
+
+Training:   build_rotary_transformer() (used by transformer_per_service.py --rotary)
+Serving:    IncrementalTransformer(model).step(state, row)
+Check:      check_incremental_equivalence(model, stream) / python incremental_transformer.py
+"""
+
+import logging
+from typing import Dict, Optional
+
+import keras
+import numpy as np
+from keras import layers, models, ops
+from scipy.special import erf
+
+logger = logging.getLogger(__name__)
+
+ROTARY_PARAMS = {
+    'band': 10,     # Attention span per layer (steps)
+    'pool': 10      # Steps averaged by the pooling head
+}
+
+
+def required_window(num_blocks: int, band: int, pool: int) -> int:
+    """Shortest window whose last prediction is unaffected by where it starts"""
+    return num_blocks * (band - 1) + pool
+
+
+def _rotary_frequencies(key_dim: int) -> np.ndarray:
+    return 1.0 / (10000.0 ** (np.arange(0, key_dim, 2) / key_dim))
+
+
+@keras.saving.register_keras_serializable(package='ml_autoscaler')
+class RotaryCausalSelfAttention(layers.Layer):
+    """Multi-head causal self-attention with rotary positions and a banded mask"""
+
+    def __init__(self, num_heads, key_dim, band, dropout=0.0, **kwargs):
+        super().__init__(**kwargs)
+        if key_dim % 2:
+            raise ValueError(f"key_dim must be even for rotary embeddings, got {key_dim}")
+        self.num_heads = num_heads
+        self.key_dim = key_dim
+        self.band = band
+        self.dropout = dropout
+        self.query_dense = layers.Dense(num_heads * key_dim, name='query')
+        self.key_dense = layers.Dense(num_heads * key_dim, name='key')
+        self.value_dense = layers.Dense(num_heads * key_dim, name='value')
+        self.output_dense = None
+        self.attention_dropout = layers.Dropout(dropout)
+
+    def build(self, input_shape):
+        d_model = input_shape[-1]
+        for dense in (self.query_dense, self.key_dense, self.value_dense):
+            dense.build(input_shape)
+        self.output_dense = layers.Dense(d_model, name='attention_output')
+        self.output_dense.build(tuple(input_shape[:-1]) + (self.num_heads * self.key_dim,))
+
+    def get_config(self):
+        config = super().get_config()
+        config.update({
+            'num_heads': self.num_heads,
+            'key_dim': self.key_dim,
+            'band': self.band,
+            'dropout': self.dropout
+        })
+        return config
+
+    def _split_heads(self, x, seq_len):
+        x = ops.reshape(x, (-1, seq_len, self.num_heads, self.key_dim))
+        return ops.transpose(x, (0, 2, 1, 3))
+
+    def _rotate(self, x, cos, sin):
+        half = self.key_dim // 2
+        x1, x2 = x[..., :half], x[..., half:]
+        return ops.concatenate([x1 * cos - x2 * sin, x1 * sin + x2 * cos], axis=-1)
+
+    def call(self, x, training=False):
+        seq_len = x.shape[1]
+        q = self._split_heads(self.query_dense(x), seq_len)
+        k = self._split_heads(self.key_dense(x), seq_len)
+        v = self._split_heads(self.value_dense(x), seq_len)
+
+        angles = np.arange(seq_len)[:, None] * _rotary_frequencies(self.key_dim)[None, :]
+        cos = ops.convert_to_tensor(np.cos(angles), dtype=q.dtype)
+        sin = ops.convert_to_tensor(np.sin(angles), dtype=q.dtype)
+        q = self._rotate(q, cos, sin)
+        k = self._rotate(k, cos, sin)
+
+        scores = ops.matmul(q, ops.transpose(k, (0, 1, 3, 2))) / np.sqrt(self.key_dim).astype('float32')
+
+        # Causal band: position i attends to i - band + 1 .. i
+        offsets = np.arange(seq_len)[:, None] - np.arange(seq_len)[None, :]
+        allowed = ops.convert_to_tensor((offsets >= 0) & (offsets < self.band))
+        scores = ops.where(allowed, scores, ops.full_like(scores, -1e9))
+
+        weights = self.attention_dropout(ops.softmax(scores, axis=-1), training=training)
+        attended = ops.transpose(ops.matmul(weights, v), (0, 2, 1, 3))
+        attended = ops.reshape(attended, (-1, seq_len, self.num_heads * self.key_dim))
+        return self.output_dense(attended)
+
+
+@keras.saving.register_keras_serializable(package='ml_autoscaler')
+class TailPooling(layers.Layer):
+    """Concatenate the last step with the mean of the last `pool` steps"""
+
+    def __init__(self, pool, **kwargs):
+        super().__init__(**kwargs)
+        self.pool = pool
+
+    def get_config(self):
+        config = super().get_config()
+        config.update({'pool': self.pool})
+        return config
+
+    def call(self, x):
+        return ops.concatenate([x[:, -1, :], ops.mean(x[:, -self.pool:, :], axis=1)], axis=-1)
+
+
+def build_rotary_transformer(sequence_length, n_features, num_classes, d_model=64, num_heads=4,
+                             dff=128, num_blocks=2, dropout=0.2, band=ROTARY_PARAMS['band'],
+                             pool=ROTARY_PARAMS['pool'], name='rotary_transformer'):
+    """
+    Per-service transformer classifier with rotary banded attention
+
+    Same block structure and head as ServiceTransformer.build_model, with the
+    absolute positional encoding replaced by rotary attention.
+    """
+    if sequence_length < required_window(num_blocks, band, pool):
+        raise ValueError(
+            f"sequence_length={sequence_length} is shorter than the receptive field "
+            f"{required_window(num_blocks, band, pool)} (num_blocks * (band - 1) + pool)"
+        )
+
+    inputs = layers.Input(shape=(sequence_length, n_features), name='sequence_input')
+
+    # Layer normalization before projection (Pre-LN Transformer)
+    x = layers.LayerNormalization(epsilon=1e-6, name='input_norm')(inputs)
+    x = layers.Dense(d_model, name='input_projection')(x)
+
+    for i in range(num_blocks):
+        attn_output = RotaryCausalSelfAttention(
+            num_heads=num_heads,
+            key_dim=d_model // num_heads,
+            band=band,
+            dropout=dropout,
+            name=f'attention_{i}'
+        )(x)
+        attn_output = layers.Dropout(dropout)(attn_output)
+        x = layers.LayerNormalization(epsilon=1e-6, name=f'attention_norm_{i}')(x + attn_output)
+
+        ffn = keras.Sequential([
+            layers.Dense(dff, activation='gelu'),
+            layers.Dropout(dropout),
+            layers.Dense(d_model)
+        ], name=f'ffn_{i}')
+        x = layers.LayerNormalization(epsilon=1e-6, name=f'ffn_norm_{i}')(x + ffn(x))
+
+    x = TailPooling(pool, name='tail_pooling')(x)
+
+    # Classification head (same as ServiceTransformer)
+    x = layers.Dense(128, activation='gelu', kernel_regularizer=keras.regularizers.l2(1e-5), name='head_dense_1')(x)
+    x = layers.Dropout(dropout)(x)
+    x = layers.Dense(64, activation='gelu', kernel_regularizer=keras.regularizers.l2(1e-5), name='head_dense_2')(x)
+    x = layers.Dropout(dropout)(x)
+    output = layers.Dense(num_classes, activation='softmax', name='replica_output')(x)
+
+    return models.Model(inputs=inputs, outputs=output, name=name)
+
+
+def _layer_norm(x, gamma, beta, epsilon=1e-6):
+    mean = x.mean(axis=-1, keepdims=True)
+    var = ((x - mean) ** 2).mean(axis=-1, keepdims=True)
+    return (x - mean) / np.sqrt(var + epsilon) * gamma + beta
+
+
+def _gelu(x):
+    return 0.5 * x * (1.0 + erf(x / np.sqrt(2.0)))
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+def _dense(layer):
+    kernel, bias = layer.get_weights()
+    return kernel.astype(np.float64), bias.astype(np.float64)
+
+
+def _norm(layer):
+    gamma, beta = layer.get_weights()
+    return gamma.astype(np.float64), beta.astype(np.float64)
+
+
+class IncrementalTransformer:
+    """
+    Step-by-step numpy inference for a model from build_rotary_transformer
+
+    Weights are copied out of the Keras model once; per-stream caches live in
+    the state dict from new_state(), so one runner serves many streams.
+    Cached keys are stored unrotated and rotated by their distance to the
+    newest step, which keeps the angles bounded however long the stream runs.
+    """
+
+    def __init__(self, model):
+        attention = [layer for layer in model.layers if isinstance(layer, RotaryCausalSelfAttention)]
+        pooling = model.get_layer('tail_pooling')
+
+        self.window = int(model.input_shape[1])
+        self.n_features = int(model.input_shape[2])
+        self.num_heads = attention[0].num_heads
+        self.key_dim = attention[0].key_dim
+        self.band = attention[0].band
+        self.pool = pooling.pool
+
+        self.input_norm = _norm(model.get_layer('input_norm'))
+        self.input_projection = _dense(model.get_layer('input_projection'))
+        self.blocks = []
+        for i, layer in enumerate(attention):
+            ffn_dense = [sub for sub in model.get_layer(f'ffn_{i}').layers if isinstance(sub, layers.Dense)]
+            self.blocks.append({
+                'query': _dense(layer.query_dense),
+                'key': _dense(layer.key_dense),
+                'value': _dense(layer.value_dense),
+                'output': _dense(layer.output_dense),
+                'attention_norm': _norm(model.get_layer(f'attention_norm_{i}')),
+                'ffn_1': _dense(ffn_dense[0]),
+                'ffn_2': _dense(ffn_dense[1]),
+                'ffn_norm': _norm(model.get_layer(f'ffn_norm_{i}'))
+            })
+        self.head = [_dense(model.get_layer(name)) for name in ('head_dense_1', 'head_dense_2', 'replica_output')]
+
+        # Rotation of a key `offset` steps older than the query: angle -offset * freq
+        angles = -np.arange(self.band)[:, None] * _rotary_frequencies(self.key_dim)[None, :]
+        self.cos = np.cos(angles)[:, None, :]
+        self.sin = np.sin(angles)[:, None, :]
+        self.scale = 1.0 / np.sqrt(self.key_dim)
+
+    def new_state(self) -> Dict:
+        """Empty caches for one stream"""
+        shape = (self.band, self.num_heads, self.key_dim)
+        return {
+            'count': 0,
+            'keys': [np.zeros(shape) for _ in self.blocks],
+            'values': [np.zeros(shape) for _ in self.blocks],
+            'outputs': np.zeros((self.pool, self.input_projection[1].shape[0]))
+        }
+
+    @property
+    def ready_after(self) -> int:
+        """Samples needed before step() matches full-window inference"""
+        return self.window
+
+    def step(self, state: Dict, row: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Push one (already scaled) sample through the network
+
+        Returns:
+            Class probabilities once `window` samples were seen, else None
+        """
+        t = state['count']
+        slot = t % self.band
+        n_keys = min(t + 1, self.band)
+        # Cache slots ordered newest first: offset d holds step t - d
+        order = (t - np.arange(n_keys)) % self.band
+        half = self.key_dim // 2
+
+        x = _layer_norm(np.asarray(row, dtype=np.float64), *self.input_norm)
+        x = x @ self.input_projection[0] + self.input_projection[1]
+
+        for block, keys, values in zip(self.blocks, state['keys'], state['values']):
+            q = (x @ block['query'][0] + block['query'][1]).reshape(self.num_heads, self.key_dim)
+            keys[slot] = (x @ block['key'][0] + block['key'][1]).reshape(self.num_heads, self.key_dim)
+            values[slot] = (x @ block['value'][0] + block['value'][1]).reshape(self.num_heads, self.key_dim)
+
+            k = keys[order]
+            cos, sin = self.cos[:n_keys], self.sin[:n_keys]
+            k1, k2 = k[..., :half], k[..., half:]
+            k = np.concatenate([k1 * cos - k2 * sin, k1 * sin + k2 * cos], axis=-1)
+
+            weights = _softmax(np.einsum('hd,nhd->hn', q, k) * self.scale)
+            attended = np.einsum('hn,nhd->hd', weights, values[order]).reshape(-1)
+            attended = attended @ block['output'][0] + block['output'][1]
+            x = _layer_norm(x + attended, *block['attention_norm'])
+
+            ffn = _gelu(x @ block['ffn_1'][0] + block['ffn_1'][1]) @ block['ffn_2'][0] + block['ffn_2'][1]
+            x = _layer_norm(x + ffn, *block['ffn_norm'])
+
+        state['outputs'][t % self.pool] = x
+        state['count'] = t + 1
+        if state['count'] < self.window:
+            return None
+
+        h = np.concatenate([x, state['outputs'].mean(axis=0)])
+        h = _gelu(h @ self.head[0][0] + self.head[0][1])
+        h = _gelu(h @ self.head[1][0] + self.head[1][1])
+        return _softmax(h @ self.head[2][0] + self.head[2][1])
+
+    def run_window(self, rows: np.ndarray, state: Dict = None) -> Optional[np.ndarray]:
+        """Stream rows into a (new) state and return the last prediction"""
+        if state is None:
+            state = self.new_state()
+        probs = None
+        for row in rows:
+            probs = self.step(state, row)
+        return probs
+
+
+def check_incremental_equivalence(model, stream: np.ndarray, atol: float = 1e-4) -> float:
+    """
+    Verify incremental inference against full-window inference
+
+    Streams every row of `stream` (n_samples, n_features) through one cached
+    state and compares each prediction with model(stream[t - window + 1:t + 1]).
+
+    Returns:
+        Max absolute probability difference; raises ValueError above atol
+    """
+    runner = IncrementalTransformer(model)
+    window = runner.window
+    if len(stream) < window:
+        raise ValueError(f"Need at least {window} samples, got {len(stream)}")
+
+    windows = np.lib.stride_tricks.sliding_window_view(stream, window, axis=0).transpose(0, 2, 1)
+    full = np.concatenate([
+        np.asarray(model.predict_on_batch(np.ascontiguousarray(windows[start:start + 256], dtype=np.float32)))
+        for start in range(0, len(windows), 256)
+    ])
+
+    state = runner.new_state()
+    incremental = [runner.step(state, row) for row in stream][window - 1:]
+    max_diff = float(np.abs(np.stack(incremental) - full).max())
+    if max_diff > atol:
+        raise ValueError(f"Incremental inference differs from full-window inference by {max_diff:.2e} (atol {atol:.0e})")
+    return max_diff
+
+
+if __name__ == '__main__':
+    # Self-check on a randomly initialized model
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    rng = np.random.default_rng(42)
+    model = build_rotary_transformer(sequence_length=30, n_features=26, num_classes=5)
+    stream = rng.normal(size=(200, 26))
+    logger.info(f"Max |incremental - full window| over {len(stream) - 29} windows: "
+                f"{check_incremental_equivalence(model, stream):.2e}")
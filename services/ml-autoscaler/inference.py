@@ -8,15 +8,26 @@ on incoming metrics data to determine optimal replica counts.
 import pandas as pd
 import numpy as np
 import joblib
+import hashlib
 import json
 import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Tuple, Union
 import keras
 from keras import layers
 import tensorflow as tf
 
 import config
+from feature_manifest import TRANSFORMER_FEATURES, load_feature_extractor
+from incremental_transformer import IncrementalTransformer
+from quantization import TFLiteModel, quantized_model_path
+from window_features import (
+    CATBOOST_WINDOW_LAYOUT, RANDOM_FOREST_WINDOW_LAYOUT, STUDENT_WINDOW_LAYOUT, WINDOW_SIZE,
+    IncrementalWindowStats, window_features
+)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -24,6 +35,47 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Per-service models written by training/{randomforest,catboost,transformer}_per_service.py.
+# Predicted classes are shifted by class_offset to get a replica count.
+PER_SERVICE_MODELS = {
+    'random_forest': {
+        'subdir': 'randomforest',
+        'model_prefix': 'randomforest_model_',
+        'model_suffix': '.joblib',
+        'scaler_file': 'randomforest_scaler_{}.joblib',
+        'layout': RANDOM_FOREST_WINDOW_LAYOUT,
+        'class_offset': 0
+    },
+    'catboost': {
+        'subdir': 'catboost',
+        'model_prefix': 'catboost_model_',
+        'model_suffix': '.cbm',
+        'scaler_file': 'catboost_scaler_{}.joblib',
+        'layout': CATBOOST_WINDOW_LAYOUT,
+        'class_offset': 1
+    },
+    # Rotary transformer (transformer_per_service.py --rotary) served with cached attention state
+    'transformer_incremental': {
+        'subdir': 'transformer_rotary',
+        'model_prefix': 'transformer_model_',
+        'model_suffix': '.keras',
+        'scaler_file': 'transformer_scaler_{}.joblib',
+        'layout': None,
+        'class_offset': 1
+    },
+    # MLP students of the transformers (training/distill_transformer.py), fed window stats
+    'transformer_student': {
+        'subdir': 'transformer_student',
+        'model_prefix': 'student_model_',
+        'model_suffix': '.keras',
+        'scaler_file': 'student_scaler_{}.joblib',
+        'layout': STUDENT_WINDOW_LAYOUT,
+        'class_offset': 1
+    }
+}
+SERVICE_MIN_REPLICA = 1
+SERVICE_MAX_REPLICA = 5
+
 
 # Custom Keras layers for Transformer model
 class PositionalEncoding(layers.Layer):
@@ -151,104 +203,543 @@ class K8sAutoScalingPredictor:
     """
     Predictor class for K8s auto-scaling
     
-    Supports Random Forest, LSTM-CNN, and Transformer models
+    Supports Random Forest, CatBoost, LSTM-CNN, and Transformer models.
+    Random Forest, CatBoost and transformer_student (distilled MLPs) serve the
+    per-service models with incremental window statistics (see
+    window_features.py); transformer_incremental serves
+    the per-service rotary transformers with cached attention state (see
+    incremental_transformer.py).
+    
+    predict_batch/get_scaling_decisions feed the live per-service buffers and
+    are meant for the prediction loop only. predict_windows/get_window_decisions
+    score explicit sample windows without touching any buffer and may be
+    called from several threads at once.
+    
+    Live per-service state (sequence_buffer, window_state, raw_history) is only
+    touched under that service's lock, so per-service models are scored concurrently
+    in a thread pool and reset_sequence_buffer is safe during a cycle.
     """
     
-    def __init__(self, model_type: str = 'transformer', model_dir: str = None):
+    def __init__(self, model_type: str = 'transformer', model_dir: str = None,
+                 quantization: Optional[str] = None, workers: Optional[int] = None,
+                 cache_tolerance: Optional[float] = None):
         """
         Initialize predictor
         
         Args:
-            model_type: 'random_forest', 'lstm_cnn', or 'transformer'
-            model_dir: Directory containing saved models (default: from config)
+            model_type: 'random_forest', 'catboost', 'lstm_cnn', 'transformer',
+                        'transformer_incremental' or 'transformer_student'
+            model_dir: Directory containing saved models (default: from config).
+                       May be a versioned root (see _resolve_model_version).
+            quantization: 'int8' or 'float16' to serve the quantized TFLite
+                          transformer (default: config.MODEL_QUANTIZATION)
+            workers: Threads scoring per-service models concurrently
+                     (default: config.INFERENCE_WORKERS, then CPU count)
+            cache_tolerance: Quantization step of the window cache for sequence
+                             models (default: config.PREDICTION_CACHE_TOLERANCE,
+                             0 disables)
         """
         self.model_type = model_type
+        self.quantization = quantization if quantization is not None else config.MODEL_QUANTIZATION
         if model_dir is None:
-            self.model_dir = Path(config.MODEL_OUTPUT_DIR)
+            self.model_root = Path(config.MODEL_OUTPUT_DIR)
         else:
-            self.model_dir = Path(model_dir)
+            self.model_root = Path(model_dir)
+        self.model_dir = None
+        self.model_version = None
         self.model = None
         self.scaler = None
         self.pca = None
         self.pca_scaler = None
         self.feature_names = None
+        self.extractor = None
+        self.service_models = None  # Per-service models: {service: {'model', 'scaler'[, 'runner']}}
+        self.window_layout = None
         self.sequence_buffer = {}  # For sequence-based models (LSTM-CNN, Transformer)
+        self.window_state = {}  # Per-service window stats (trees) or attention caches (incremental transformer)
+        self.raw_history = {}  # Last raw samples per service, for engineered features (kept across swaps)
+        self._bundle = None  # Served bundle as one reference, read once per stateless call
+        
+        # Per-service locks guard sequence_buffer/window_state entries
+        self._service_locks = {}
+        self._service_locks_lock = threading.Lock()
+        self.workers = workers or config.INFERENCE_WORKERS or os.cpu_count() or 1
+        self._executor = None
+        self.error_stats = {}  # service -> per-service predictions that raised
+        
+        # Window cache: service -> ((version, window key), raw output) of the last forward pass
+        self.cache_tolerance = (cache_tolerance if cache_tolerance is not None
+                                else config.PREDICTION_CACHE_TOLERANCE)
+        self._window_cache = {}
+        self.cache_stats = {}  # service -> {'hit': n, 'miss': n}
+        
+        # Hot reload state: a staged bundle is swapped in between cycles
+        self._swap_lock = threading.Lock()
+        self._pending_bundle = None
+        self._rejected_versions = set()
+        self._watcher_thread = None
+        self._watcher_stop = threading.Event()
+        
+        version, version_dir = self._resolve_model_version()
+        self._apply_bundle(self._load_model(version_dir, version))
+    
+    def _resolve_model_version(self) -> Tuple[str, Path]:
+        """
+        Resolve the model version to serve
         
-        self._load_model()
+        Layout (checked in order):
+            <root>/CURRENT            pointer file containing a version name
+            <root>/versions/<name>/   latest version by sorted name
+            <root>/                   unversioned (legacy layout)
+        """
+        pointer_path = self.model_root / config.MODEL_POINTER_FILE
+        versions_dir = self.model_root / config.MODEL_VERSIONS_DIR
+        
+        if pointer_path.exists():
+            version = pointer_path.read_text().strip()
+            if version:
+                version_dir = versions_dir / version
+                if not version_dir.is_dir():
+                    version_dir = self.model_root / version
+                return version, version_dir
+        
+        if versions_dir.is_dir():
+            versions = sorted(d.name for d in versions_dir.iterdir() if d.is_dir())
+            if versions:
+                return versions[-1], versions_dir / versions[-1]
+        
+        return 'unversioned', self.model_root
     
-    def _load_model(self):
-        """Load the trained model"""
-        logger.info(f"Loading {self.model_type} model from {self.model_dir}")
+    def _load_model(self, model_dir: Path, version: str = 'unversioned') -> Dict:
+        """Load the trained model and its preprocessing artifacts into a bundle"""
+        logger.info(f"Loading {self.model_type} model from {model_dir} (version: {version})")
+        
+        bundle = {
+            'version': version,
+            'model_dir': Path(model_dir),
+            'model': None,
+            'scaler': None,
+            'pca': None,
+            'pca_scaler': None,
+            'feature_names': None,
+            'extractor': None,
+            'service_models': None,
+            'window_layout': None
+        }
         
-        if self.model_type == 'random_forest':
-            model_path = self.model_dir / 'random_forest_model.joblib'
-            features_path = self.model_dir / 'rf_feature_names.json'
+        service_dir = self._find_service_model_dir(model_dir)
+        if service_dir is not None:
+            self._load_service_models(bundle, service_dir)
+            
+        elif self.model_type in ('catboost', 'transformer_incremental', 'transformer_student'):
+            raise FileNotFoundError(f"No per-service {self.model_type} models found in {model_dir}")
+            
+        elif self.model_type == 'random_forest':
+            # Legacy single global Random Forest
+            model_path = model_dir / 'random_forest_model.joblib'
+            features_path = model_dir / 'rf_feature_names.json'
             
             if not model_path.exists():
                 raise FileNotFoundError(f"Model not found at {model_path}")
             
-            self.model = joblib.load(model_path)
+            bundle['model'] = joblib.load(model_path)
             
             if features_path.exists():
                 with open(features_path, 'r') as f:
-                    self.feature_names = json.load(f)
+                    bundle['feature_names'] = json.load(f)
             
             logger.info("Random Forest model loaded successfully")
             
         elif self.model_type == 'lstm_cnn':
-            model_path = self.model_dir / 'lstm_cnn_model.keras'
-            scaler_path = self.model_dir / 'lstm_cnn_scaler.joblib'
+            model_path = model_dir / 'lstm_cnn_model.keras'
+            scaler_path = model_dir / 'lstm_cnn_scaler.joblib'
             
             if not model_path.exists():
                 raise FileNotFoundError(f"Model not found at {model_path}")
             
-            self.model = keras.models.load_model(model_path, compile=False)
+            bundle['model'] = keras.models.load_model(model_path, compile=False)
             
             if scaler_path.exists():
-                self.scaler = joblib.load(scaler_path)
+                bundle['scaler'] = joblib.load(scaler_path)
             else:
                 logger.warning("Scaler not found, predictions may be inaccurate")
             
             logger.info("LSTM-CNN model loaded successfully")
             
         elif self.model_type == 'transformer':
-            model_path = self.model_dir / 'transformer_model.keras'
-            scaler_path = self.model_dir / 'transformer_scaler.joblib'
-            pca_path = self.model_dir / 'transformer_pca.joblib'
+            model_path = model_dir / 'transformer_model.keras'
+            scaler_path = model_dir / 'transformer_scaler.joblib'
+            pca_path = model_dir / 'transformer_pca.joblib'
+            
+            if self.quantization:
+                model_path = quantized_model_path(model_dir, 'transformer_model', self.quantization)
             
             if not model_path.exists():
                 raise FileNotFoundError(f"Model not found at {model_path}")
             
-            # Load with custom layers defined in this file
-            custom_objects = {
-                'PositionalEncoding': PositionalEncoding,
-                'TransformerDecoderBlock': TransformerDecoderBlock,
-                'GetItem': GetItem
-            }
-            
-            self.model = keras.models.load_model(model_path, custom_objects=custom_objects, compile=False)
+            if self.quantization:
+                bundle['model'] = TFLiteModel(model_path)
+                logger.info(f"Serving {self.quantization} quantized transformer")
+            else:
+                # Load with custom layers defined in this file
+                custom_objects = {
+                    'PositionalEncoding': PositionalEncoding,
+                    'TransformerDecoderBlock': TransformerDecoderBlock,
+                    'GetItem': GetItem
+                }
+                
+                bundle['model'] = keras.models.load_model(model_path, custom_objects=custom_objects, compile=False)
             
             if scaler_path.exists():
-                self.scaler = joblib.load(scaler_path)
+                bundle['scaler'] = joblib.load(scaler_path)
             else:
                 logger.warning("Scaler not found, predictions may be inaccurate")
             
             if pca_path.exists():
                 pca_bundle = joblib.load(pca_path)
                 if isinstance(pca_bundle, dict):
-                    self.pca = pca_bundle['pca']
-                    self.pca_scaler = pca_bundle.get('pca_scaler', None)
+                    bundle['pca'] = pca_bundle['pca']
+                    bundle['pca_scaler'] = pca_bundle.get('pca_scaler', None)
                 else:
                     # Backward compatibility
-                    self.pca = pca_bundle
-                    self.pca_scaler = None
-                logger.info(f"PCA loaded with {self.pca.n_components_} components")
+                    bundle['pca'] = pca_bundle
+                    bundle['pca_scaler'] = None
+                logger.info(f"PCA loaded with {bundle['pca'].n_components_} components")
             else:
                 logger.warning("PCA not found, predictions may be inaccurate")
             
+            # Compile the feature manifest and fail loudly on schema mismatch
+            bundle['extractor'] = load_feature_extractor(model_dir)
+            input_transformer = bundle['pca_scaler'] or bundle['pca'] or bundle['scaler']
+            bundle['extractor'].validate(
+                n_features=self._expected_input_features(bundle),
+                feature_names=getattr(input_transformer, 'feature_names_in_', None)
+            )
+            
             logger.info("Transformer model loaded successfully")
         else:
             raise ValueError(f"Unknown model type: {self.model_type}")
+        
+        return bundle
+    
+    def _find_service_model_dir(self, model_dir: Path) -> Optional[Path]:
+        """Directory holding per-service models, if any were published"""
+        spec = PER_SERVICE_MODELS.get(self.model_type)
+        if spec is None:
+            return None
+        for candidate in (model_dir / spec['subdir'], model_dir):
+            if any(candidate.glob(f"{spec['model_prefix']}*{spec['model_suffix']}")):
+                return candidate
+        return None
+    
+    def _load_service_models(self, bundle: Dict, service_dir: Path):
+        """Load every per-service model and scaler from service_dir"""
+        spec = PER_SERVICE_MODELS[self.model_type]
+        if self.model_type == 'catboost':
+            from catboost import CatBoostClassifier
+        
+        service_models = {}
+        for model_path in sorted(service_dir.glob(f"{spec['model_prefix']}*{spec['model_suffix']}")):
+            service = model_path.name[len(spec['model_prefix']):-len(spec['model_suffix'])]
+            scaler_path = service_dir / spec['scaler_file'].format(service)
+            if not scaler_path.exists():
+                raise FileNotFoundError(f"Scaler not found at {scaler_path}")
+            
+            entry = {'scaler': joblib.load(scaler_path)}
+            if self.model_type == 'catboost':
+                entry['model'] = CatBoostClassifier()
+                entry['model'].load_model(str(model_path))
+            elif self.model_type == 'transformer_incremental':
+                # Rotary layers are registered by importing incremental_transformer
+                entry['model'] = keras.models.load_model(model_path, compile=False)
+                entry['runner'] = IncrementalTransformer(entry['model'])
+            elif self.model_type == 'transformer_student':
+                entry['model'] = keras.models.load_model(model_path, compile=False)
+            else:
+                entry['model'] = joblib.load(model_path)
+            
+            service_models[service] = entry
+        
+        bundle['service_models'] = service_models
+        bundle['window_layout'] = spec['layout']
+        
+        # Every service shares the column order written by the trainer
+        default_features = [name for name in TRANSFORMER_FEATURES if not name.startswith('service_')]
+        bundle['extractor'] = load_feature_extractor(service_dir, default_features=default_features)
+        for service, entry in service_models.items():
+            bundle['extractor'].validate(n_features=int(entry['scaler'].n_features_in_))
+        
+        logger.info(f"Loaded per-service {self.model_type} models for: {', '.join(service_models)}")
+    
+    def _current_bundle(self) -> Dict:
+        """Snapshot of the artifacts currently being served"""
+        return {
+            'version': self.model_version,
+            'model_dir': self.model_dir,
+            'model': self.model,
+            'scaler': self.scaler,
+            'pca': self.pca,
+            'pca_scaler': self.pca_scaler,
+            'feature_names': self.feature_names,
+            'extractor': self.extractor,
+            'service_models': self.service_models,
+            'window_layout': self.window_layout
+        }
+    
+    def _apply_bundle(self, bundle: Dict):
+        """Make a loaded bundle the one used for predictions"""
+        self._bundle = bundle
+        self.model_version = bundle['version']
+        self.model_dir = bundle['model_dir']
+        self.model = bundle['model']
+        self.scaler = bundle['scaler']
+        self.pca = bundle['pca']
+        self.pca_scaler = bundle['pca_scaler']
+        self.feature_names = bundle['feature_names']
+        self.extractor = bundle['extractor']
+        self.service_models = bundle['service_models']
+        self.window_layout = bundle['window_layout']
+        # Window stats hold rows scaled by the old scalers; rebuilt from raw history on demand
+        self._clear_service_state(buffers=False)
+    
+    def _smoke_test(self, bundle: Dict):
+        """
+        Warm up a bundle and verify it produces a sane prediction
+        
+        Uses live buffered windows when available and in the bundle's feature
+        layout, so the check also proves the new model accepts the buffers it is
+        about to inherit. Raises on failure.
+        """
+        if bundle['service_models'] is not None:
+            n_features = len(bundle['extractor'].feature_names)
+            for service, entry in bundle['service_models'].items():
+                window = entry['runner'].window if 'runner' in entry else WINDOW_SIZE
+                buffer = self._buffer_snapshot(service, window)
+                rows = np.array(buffer) if len(buffer) >= window else np.zeros((window, n_features))
+                if rows.shape[-1] != n_features:
+                    # Buffers of an older layout are dropped when the bundle is swapped in
+                    rows = np.zeros((window, n_features))
+                if 'runner' in entry:
+                    _, prediction = self._replay_stream(rows, entry)
+                else:
+                    stats = self._replay_window(rows, entry, bundle['window_layout'])
+                    prediction = self._predict_labels(entry, stats.features()[None, :])
+                prediction = np.asarray(prediction, dtype=float)
+                if prediction.size == 0 or not np.all(np.isfinite(prediction)):
+                    raise ValueError(f"Smoke prediction for {service} returned invalid output: {prediction!r}")
+        elif self.model_type == 'random_forest':
+            n_features = len(bundle['feature_names']) if bundle['feature_names'] else getattr(
+                bundle['model'], 'n_features_in_', 1)
+            sample = np.zeros((1, n_features))
+            if bundle['feature_names']:
+                sample = pd.DataFrame(sample, columns=bundle['feature_names'])
+            prediction = np.asarray(bundle['model'].predict(sample), dtype=float)
+        else:
+            seq_length = self._sequence_length()
+            n_features = self._expected_input_features(bundle)
+            buffers = (self._buffer_snapshot(service, seq_length) for service in list(self.sequence_buffer))
+            windows = [np.array(buffer) for buffer in buffers
+                       if len(buffer) >= seq_length and len(buffer[-1]) == n_features]
+            if windows:
+                sequence = np.stack(windows[:1])
+            else:
+                sequence = np.zeros((1, seq_length, n_features), dtype=np.float32)
+            
+            if self.model_type == 'transformer':
+                sequence = self._project_sequence(sequence, bundle)
+            elif bundle['scaler'] is not None:
+                sequence = bundle['scaler'].transform(
+                    sequence.reshape(-1, sequence.shape[-1])
+                ).reshape(sequence.shape)
+            
+            prediction = np.asarray(bundle['model'].predict(sequence, verbose=0), dtype=float)
+        
+        if prediction.size == 0 or not np.all(np.isfinite(prediction)):
+            raise ValueError(f"Smoke prediction returned invalid output: {prediction!r}")
+    
+    def _expected_input_features(self, bundle: Dict) -> int:
+        """Number of raw features per timestep a sequence bundle consumes"""
+        for transformer in (bundle['pca_scaler'], bundle['pca'], bundle['scaler']):
+            if transformer is not None and hasattr(transformer, 'n_features_in_'):
+                return int(transformer.n_features_in_)
+        return int(bundle['model'].input_shape[-1])
+    
+    def _sequence_length(self) -> int:
+        """Window length for the configured sequence model"""
+        if self.model_type == 'lstm_cnn':
+            return config.LSTM_CNN_PARAMS['sequence_length']
+        if self.model_type in PER_SERVICE_MODELS:
+            return WINDOW_SIZE
+        return config.TRANSFORMER_PARAMS['sequence_length']
+    
+    def check_for_new_model(self) -> bool:
+        """
+        Load, warm up and smoke-test a new model version if one was published
+        
+        Safe to call from a background thread: the new bundle is only staged
+        and becomes active on the next apply_pending_model() call.
+        
+        Returns:
+            True if a new version was staged
+        """
+        version, version_dir = self._resolve_model_version()
+        pending = self._pending_bundle
+        if (version == self.model_version
+                or (pending is not None and pending['version'] == version)
+                or version in self._rejected_versions):
+            return False
+        
+        try:
+            bundle = self._load_model(version_dir, version)
+            self._smoke_test(bundle)
+        except Exception as e:
+            logger.error(f"Rejected model version {version}: {e}")
+            self._rejected_versions.add(version)
+            return False
+        
+        with self._swap_lock:
+            self._pending_bundle = bundle
+        logger.info(f"Model version {version} staged for swap")
+        return True
+    
+    def apply_pending_model(self) -> Optional[str]:
+        """
+        Swap in a staged model version; call between prediction cycles
+        
+        The staged model is re-validated against the live buffers first and
+        rejected (the current model and its buffers stay in place) if it cannot
+        serve them. Buffers of an older feature layout are only dropped once
+        the swap succeeded; raw_history does not depend on the layout and is kept.
+        
+        Returns:
+            'swapped', 'rolled_back', or None if nothing was staged
+        """
+        with self._swap_lock:
+            bundle = self._pending_bundle
+            self._pending_bundle = None
+            if bundle is None:
+                return None
+            
+            previous = self._current_bundle()
+            try:
+                self._smoke_test(bundle)
+            except Exception as e:
+                logger.error(f"Model version {bundle['version']} failed smoke prediction, rolling back: {e}")
+                self._rejected_versions.add(bundle['version'])
+                return 'rolled_back'
+            
+            self._apply_bundle(bundle)
+            
+            # Buffered rows follow the old feature layout; drop them if it changed
+            if (previous['extractor'] is not None and bundle['extractor'] is not None
+                    and previous['extractor'].feature_names != bundle['extractor'].feature_names):
+                logger.warning(f"Feature layout changed in version {bundle['version']}, resetting sequence buffers")
+                self._clear_service_state(history=False)
+            
+            logger.info(f"Swapped model version {previous['version']} -> {bundle['version']}")
+            return 'swapped'
+    
+    def start_model_watcher(self, interval: float = None):
+        """Poll the model directory for new versions in a background thread"""
+        if interval is None:
+            interval = config.MODEL_WATCH_INTERVAL
+        if self._watcher_thread is not None and self._watcher_thread.is_alive():
+            return
+        
+        def watch():
+            while not self._watcher_stop.wait(interval):
+                try:
+                    self.check_for_new_model()
+                except Exception as e:
+                    logger.error(f"Model watcher error: {e}")
+        
+        self._watcher_stop.clear()
+        self._watcher_thread = threading.Thread(target=watch, name='model-watcher', daemon=True)
+        self._watcher_thread.start()
+        logger.info(f"Watching {self.model_root} for new model versions (interval: {interval}s)")
+    
+    def stop_model_watcher(self):
+        """Stop the background model watcher"""
+        self._watcher_stop.set()
+        if self._watcher_thread is not None:
+            self._watcher_thread.join(timeout=5)
+            self._watcher_thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+    
+    def _service_lock(self, service_name: str) -> threading.Lock:
+        """Lock guarding one service's sequence buffer and window state"""
+        with self._service_locks_lock:
+            return self._service_locks.setdefault(service_name, threading.Lock())
+    
+    def _buffer_snapshot(self, service_name: str, length: int) -> List[np.ndarray]:
+        """Copy of the last `length` buffered rows of a service"""
+        with self._service_lock(service_name):
+            return list(self.sequence_buffer.get(service_name, [])[-length:])
+    
+    def _clear_service_state(self, service_name: str = None, buffers: bool = True, history: bool = True):
+        """Drop window state (and buffers, raw_history) of one or all services under their locks"""
+        with self._service_locks_lock:
+            if service_name is not None:
+                services = [service_name]
+            else:
+                services = (set(self._service_locks) | set(self.sequence_buffer) | set(self.window_state)
+                        | set(self.raw_history))
+            # New services cannot register a lock until every existing one is cleared
+            for service in services:
+                with self._service_locks.setdefault(service, threading.Lock()):
+                    self.window_state.pop(service, None)
+                    if buffers:
+                        self.sequence_buffer.pop(service, None)
+                        self._window_cache.pop(service, None)
+                        if history:
+                            self.raw_history.pop(service, None)
+    
+    def _run_per_service(self, score_service, features_list: List[Dict]) -> Dict[int, int]:
+        """
+        Score each service of a batch concurrently
+        
+        score_service(service_name, indices) handles every entry of one
+        service in order and returns {index: replica_count}. Services run in
+        the thread pool; model calls release the GIL, so a cycle with several
+        services scales with cores. A service whose scoring raises keeps its
+        current replica count (counted in error_stats); the others are unaffected.
+        """
+        groups = {}
+        for i, features in enumerate(features_list):
+            groups.setdefault(features.get('service_name', 'unknown'), []).append(i)
+        
+        def score_isolated(service_name: str, indices: List[int]) -> Dict[int, int]:
+            try:
+                return score_service(service_name, indices)
+            except Exception as e:
+                logger.error(f"Error predicting {service_name}: {e}. Using current replica count.")
+                with self._service_locks_lock:
+                    self.error_stats[service_name] = self.error_stats.get(service_name, 0) + 1
+                return {}
+        
+        if self.workers == 1 or len(groups) == 1:
+            results = [score_isolated(service_name, indices) for service_name, indices in groups.items()]
+        else:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='inference')
+            results = list(self._executor.map(score_isolated, groups.keys(), groups.values()))
+        
+        return {i: replica_count for result in results for i, replica_count in result.items()}
+    
+    def _project_sequence(self, sequence: np.ndarray, bundle: Dict = None) -> np.ndarray:
+        """Apply PCA scaling/projection to a (batch, seq, features) window"""
+        pca = bundle['pca'] if bundle is not None else self.pca
+        pca_scaler = bundle['pca_scaler'] if bundle is not None else self.pca_scaler
+        if pca is None:
+            return sequence
+        
+        rows = sequence.reshape(-1, sequence.shape[-1])
+        if pca_scaler is not None:
+            rows = pca_scaler.transform(rows)
+        rows = pca.transform(rows)
+        return rows.reshape(sequence.shape[0], sequence.shape[1], -1)
     
     def predict_single(self, features: Dict) -> int:
         """
@@ -260,221 +751,448 @@ class K8sAutoScalingPredictor:
         Returns:
             Predicted replica count (1-10)
         """
-        if self.model_type == 'random_forest':
-            return self._predict_rf_single(features)
-        elif self.model_type == 'lstm_cnn':
-            return self._predict_lstm_single(features)
-        elif self.model_type == 'transformer':
-            return self._predict_transformer_single(features)
+        return self.predict_batch([features])[0]
+    
+    def predict_batch(self, features_list: List[Dict]) -> List[int]:
+        """
+        Predict optimal replica counts for batch of services
+        
+        Every service window that is ready is stacked into one
+        (n_services, seq_len, n_features) tensor and scored in a single
+        forward pass, so a prediction cycle costs one model call.
+        
+        Args:
+            features_list: List of feature dictionaries
+            
+        Returns:
+            List of predicted replica counts
+        """
+        if not features_list:
+            return []
+        
+        if self.model_type == 'transformer_incremental':
+            return self._predict_incremental_batch(features_list)
+        elif self.service_models is not None:
+            return self._predict_tree_batch(features_list)
+        elif self.model_type == 'random_forest':
+            return self._predict_rf_batch(features_list)
+        elif self.model_type in ('lstm_cnn', 'transformer'):
+            return self._predict_sequence_batch(features_list)
         else:
             raise ValueError(f"Unknown model type: {self.model_type}")
     
-    def _predict_rf_single(self, features: Dict) -> int:
-        """Random Forest prediction for single instance"""
+    def _predict_rf_batch(self, features_list: List[Dict], bundle: Dict = None) -> List[int]:
+        """Random Forest prediction for a batch of instances"""
+        feature_names = bundle['feature_names'] if bundle is not None else self.feature_names
+        model = bundle['model'] if bundle is not None else self.model
+        
         # Create dataframe with features
-        if self.feature_names:
+        if feature_names:
             # Ensure all features are present
-            feature_dict = {name: features.get(name, 0) for name in self.feature_names}
-            X = pd.DataFrame([feature_dict])
+            X = pd.DataFrame(
+                [[features.get(name, 0) for name in feature_names] for features in features_list],
+                columns=feature_names
+            )
         else:
-            X = pd.DataFrame([features])
+            X = pd.DataFrame(features_list)
         
         # Predict
-        prediction = self.model.predict(X)[0]
+        predictions = model.predict(X)
         
         # Clip to valid range
-        replica_count = int(np.clip(np.round(prediction), 1, 10))
+        return [int(replicas) for replicas in np.clip(np.round(predictions), 1, 10)]
+    
+    def _replay_window(self, rows: np.ndarray, entry: Dict, layout) -> IncrementalWindowStats:
+        """Build window stats for a service from its raw feature rows"""
+        stats = IncrementalWindowStats(rows.shape[1], layout=layout, window=WINDOW_SIZE)
+        for scaled in entry['scaler'].transform(rows):
+            stats.push(scaled)
+        return stats
+    
+    def _replay_stream(self, rows: np.ndarray, entry: Dict) -> Tuple[Dict, Optional[np.ndarray]]:
+        """Build a service's attention cache from its raw feature rows"""
+        runner = entry['runner']
+        state = runner.new_state()
+        probs = runner.run_window(entry['scaler'].transform(rows), state)
+        return state, probs
+    
+    def _predict_incremental_batch(self, features_list: List[Dict]) -> List[int]:
+        """Per-service rotary transformer prediction, computing only the newest step"""
+        # Services without a model or a full window keep their current replica count
+        predictions = [int(features.get('replica_count', 1)) for features in features_list]
+        class_offset = PER_SERVICE_MODELS[self.model_type]['class_offset']
+        service_models = self.service_models
+        rows = self._live_rows(features_list, self.extractor)
+        
+        def score_service(service_name: str, indices: List[int]) -> Dict[int, int]:
+            entry = service_models.get(service_name)
+            if entry is None:
+                logger.warning(f"No {self.model_type} model for {service_name}. Using current replica count.")
+                return {}
+            
+            runner = entry['runner']
+            replicas = {}
+            with self._service_lock(service_name):
+                for i in indices:
+                    # Raw rows are kept so the cache can be rebuilt after a model swap
+                    buffer = self.sequence_buffer.setdefault(service_name, [])
+                    buffer.append(rows[i])
+                    if len(buffer) > runner.window:
+                        del buffer[:-runner.window]
+                    
+                    state = self.window_state.get(service_name)
+                    if state is None:
+                        state, probs = self._replay_stream(np.array(buffer), entry)
+                        self.window_state[service_name] = state
+                    else:
+                        probs = runner.step(state, entry['scaler'].transform(rows[i][None, :])[0])
+                    
+                    if probs is None:
+                        logger.warning(f"Not enough samples for {service_name}. "
+                                      f"Need {runner.window}, have {state['count']}. "
+                                      f"Using current replica count.")
+                        continue
+                    
+                    replicas[i] = int(np.clip(np.argmax(probs) + class_offset, SERVICE_MIN_REPLICA, SERVICE_MAX_REPLICA))
+            return replicas
+        
+        for i, replica_count in self._run_per_service(score_service, features_list).items():
+            predictions[i] = replica_count
+        return predictions
+    
+    def _predict_labels(self, entry: Dict, X: np.ndarray) -> np.ndarray:
+        """Class labels of a per-service window-stats model for rows of X"""
+        if self.model_type == 'transformer_student':
+            probs = entry['model'].predict_on_batch(X.astype(np.float32))
+            return np.argmax(np.asarray(probs), axis=1)
+        return np.asarray(entry['model'].predict(X)).flatten().astype(int)
+    
+    def _predict_tree_batch(self, features_list: List[Dict]) -> List[int]:
+        """Per-service Random Forest / CatBoost / student prediction from incremental window stats"""
+        # Services without a model or a full window keep their current replica count
+        predictions = [int(features.get('replica_count', 1)) for features in features_list]
+        class_offset = PER_SERVICE_MODELS[self.model_type]['class_offset']
+        service_models, window_layout = self.service_models, self.window_layout
+        rows = self._live_rows(features_list, self.extractor)
+        
+        def score_service(service_name: str, indices: List[int]) -> Dict[int, int]:
+            entry = service_models.get(service_name)
+            if entry is None:
+                logger.warning(f"No {self.model_type} model for {service_name}. Using current replica count.")
+                return {}
+            
+            ready = []
+            with self._service_lock(service_name):
+                for i in indices:
+                    # Raw rows are kept so window stats can be rebuilt after a model swap
+                    buffer = self.sequence_buffer.setdefault(service_name, [])
+                    buffer.append(rows[i])
+                    if len(buffer) > WINDOW_SIZE:
+                        del buffer[:-WINDOW_SIZE]
+                    
+                    stats = self.window_state.get(service_name)
+                    if stats is None:
+                        stats = self._replay_window(np.array(buffer), entry, window_layout)
+                        self.window_state[service_name] = stats
+                    else:
+                        stats.push(entry['scaler'].transform(rows[i][None, :])[0])
+                    
+                    if not stats.ready:
+                        logger.warning(f"Not enough samples for {service_name}. "
+                                      f"Need {WINDOW_SIZE}, have {stats.count}. "
+                                      f"Using current replica count.")
+                        continue
+                    
+                    ready.append((i, stats.features()))
+            
+            if not ready:
+                return {}
+            # One predict call per service model, outside the lock
+            labels = self._predict_labels(entry, np.stack([vector for _, vector in ready]))
+            return {
+                i: int(np.clip(label + class_offset, SERVICE_MIN_REPLICA, SERVICE_MAX_REPLICA))
+                for (i, _), label in zip(ready, labels)
+            }
         
-        return replica_count
+        for i, replica_count in self._run_per_service(score_service, features_list).items():
+            predictions[i] = replica_count
+        return predictions
     
-    def _predict_lstm_single(self, features: Dict) -> int:
-        """LSTM-CNN prediction for single instance (requires sequence)"""
-        service_name = features.get('service_name', 'unknown')
+    def _live_rows(self, features_list: List[Dict], extractor) -> np.ndarray:
+        """
+        Model input rows for the newest sample of each service
         
-        # Initialize buffer for this service if needed
-        if service_name not in self.sequence_buffer:
-            self.sequence_buffer[service_name] = []
+        Engineered features are derived from the service's preceding samples,
+        kept raw in raw_history so they survive model swaps.
+        """
+        if not extractor.history_rows:
+            return extractor.extract_records(features_list)
         
-        # Convert features to array (exclude service_name and timestamp)
-        feature_array = np.array([
-            v for k, v in features.items() 
-            if k not in ['service_name', 'timestamp', 'target_replicas']
-        ])
+        histories = []
+        for features in features_list:
+            service_name = features.get('service_name', 'unknown')
+            with self._service_lock(service_name):
+                history = self.raw_history.setdefault(service_name, [])
+                histories.append(history[-extractor.history_rows:])
+                history.append(features)
+                del history[:-extractor.history_rows]
+        return extractor.extract_records(features_list, histories=histories)
+    
+    def _feature_rows(self, features_list: List[Dict], bundle: Dict = None, window: bool = False) -> np.ndarray:
+        """
+        Build one model input row per feature dict
         
-        # Add to buffer
-        self.sequence_buffer[service_name].append(feature_array)
-        
-        # Keep only last sequence_length samples
-        seq_length = config.LSTM_CNN_PARAMS['sequence_length']
-        if len(self.sequence_buffer[service_name]) > seq_length:
-            self.sequence_buffer[service_name] = self.sequence_buffer[service_name][-seq_length:]
-        
-        # Need at least sequence_length samples to predict
-        if len(self.sequence_buffer[service_name]) < seq_length:
-            logger.warning(f"Not enough samples for {service_name}. "
-                          f"Need {seq_length}, have {len(self.sequence_buffer[service_name])}. "
-                          f"Using current replica count.")
-            return int(features.get('replica_count', 1))
-        
-        # Create sequence
-        sequence = np.array(self.sequence_buffer[service_name][-seq_length:])
-        sequence = sequence.reshape(1, seq_length, -1)
-        
-        # Scale
-        if self.scaler:
-            sequence_scaled = self.scaler.transform(
-                sequence.reshape(-1, sequence.shape[-1])
-            ).reshape(sequence.shape)
-        else:
-            sequence_scaled = sequence
+        features_list holds the newest sample of each service, or with window
+        one service's consecutive samples (explicit window, no live state).
+        """
+        if self.model_type == 'transformer':
+            # Order and defaults come from the feature manifest emitted at training time
+            extractor = bundle['extractor'] if bundle is not None else self.extractor
+            if window:
+                return extractor.extract_window(features_list)
+            return self._live_rows(features_list, extractor)
+        
+        # LSTM-CNN: every numeric value in insertion order
+        return [
+            np.array([
+                v for k, v in features.items()
+                if k not in ['service_name', 'timestamp', 'target_replicas']
+            ])
+            for features in features_list
+        ]
+    
+    def _append_to_buffers(self, features_list: List[Dict]) -> Tuple[List[int], List[np.ndarray]]:
+        """
+        Push one row per service into its sequence buffer
         
-        # Predict
-        prediction = self.model.predict(sequence_scaled, verbose=0)[0][0]
+        Returns:
+            Indices into features_list whose window is full, and those windows
+        """
+        seq_length = self._sequence_length()
+        rows = self._feature_rows(features_list)
+        ready, windows = [], []
         
-        # Clip to valid range
-        replica_count = int(np.clip(np.round(prediction), 1, 10))
+        for i, (features, row) in enumerate(zip(features_list, rows)):
+            service_name = features.get('service_name', 'unknown')
+            
+            with self._service_lock(service_name):
+                # Initialize buffer for this service if needed
+                buffer = self.sequence_buffer.setdefault(service_name, [])
+                buffer.append(row)
+                
+                # Keep only last sequence_length samples
+                if len(buffer) > seq_length:
+                    del buffer[:-seq_length]
+                
+                # Need at least sequence_length samples to predict
+                if len(buffer) < seq_length:
+                    logger.warning(f"Not enough samples for {service_name}. "
+                                  f"Need {seq_length}, have {len(buffer)}. "
+                                  f"Using current replica count.")
+                    continue
+                
+                # Copied under the lock; the forward pass runs without it
+                windows.append(np.array(buffer))
+            ready.append(i)
+        
+        return ready, windows
+    
+    def buffer_batch(self, features_list: List[Dict]) -> Tuple[List[int], Optional[np.ndarray]]:
+        """
+        Append one row per service to the sequence buffers (no model call)
         
-        return replica_count
+        Returns:
+            Indices into features_list whose window is full, and those windows
+            stacked as (n_ready, seq_len, n_features) (None if none is ready)
+        """
+        ready, windows = self._append_to_buffers(features_list)
+        return ready, (np.stack(windows) if windows else None)
     
-    def _predict_transformer_single(self, features: Dict) -> int:
-        """Transformer prediction for single instance (requires sequence with PCA)"""
-        service_name = features.get('service_name', 'unknown')
-        
-        # Initialize buffer for this service if needed
-        if service_name not in self.sequence_buffer:
-            self.sequence_buffer[service_name] = []
-        
-        # Prepare full feature set matching training (33 features after removing error_rate)
-        # Order must match training: config.FEATURE_COLUMNS + engineered features + service dummies
-        
-        # Base features from config.FEATURE_COLUMNS (13 features)
-        # Note: Removed unreliable features: queue_length, pod_restart_count, 
-        #       node_cpu_pressure_flag, node_memory_pressure_flag, error_rate
-        feature_list = []
-        
-        # CPU metrics
-        feature_list.append(features.get('cpu_usage_percent', 0))
-        feature_list.append(features.get('cpu_usage_percent_last_5_min', features.get('cpu_usage_percent', 0)))
-        feature_list.append(features.get('cpu_usage_percent_slope', 0))
-        
-        # RAM metrics
-        feature_list.append(features.get('ram_usage_percent', 0))
-        feature_list.append(features.get('ram_usage_percent_last_5_min', features.get('ram_usage_percent', 0)))
-        feature_list.append(features.get('ram_usage_percent_slope', 0))
-        
-        # Request metrics
-        feature_list.append(features.get('request_count_per_second', 0))
-        feature_list.append(features.get('request_count_per_second_last_5_min', features.get('request_count_per_second', 0)))
-        feature_list.append(features.get('response_time_ms', 200))
-        
-        # Resource limits (normalized to GB)
-        cpu_request = features.get('cpu_request', 0.1) / 1.0  # Keep as ratio
-        cpu_limit = features.get('cpu_limit', 0.5) / 1.0
-        ram_request = features.get('ram_request', 536870912) / (1024**3)
-        ram_limit = features.get('ram_limit', 1073741824) / (1024**3)
-        feature_list.append(cpu_request)
-        feature_list.append(cpu_limit)
-        feature_list.append(ram_request)
-        feature_list.append(ram_limit)
-        
-        # Engineered features - compute or use defaults
-        cpu_pct = features.get('cpu_usage_percent', 0)
-        ram_pct = features.get('ram_usage_percent', 0)
-        replica_count = features.get('replica_count', 1)
-        
-        # Utilization ratios
-        feature_list.append(features.get('cpu_utilization_ratio', cpu_pct / 100 if cpu_pct > 0 else 0))
-        feature_list.append(features.get('ram_utilization_ratio', ram_pct / 100 if ram_pct > 0 else 0))
-        
-        # Change rates
-        feature_list.append(features.get('cpu_change_rate', 0))
-        feature_list.append(features.get('ram_change_rate', 0))
-        feature_list.append(features.get('request_change_rate', 0))
-        
-        # Rolling stats (use defaults if not provided)
-        feature_list.append(features.get('cpu_rolling_std', cpu_pct * 0.1))
-        feature_list.append(features.get('ram_rolling_std', ram_pct * 0.1))
-        feature_list.append(features.get('request_rolling_max', features.get('request_count_per_second', 0) * 1.2))
-        feature_list.append(features.get('response_time_rolling_p95', features.get('response_time_ms', 200) * 1.2))
-        
-        # Per-replica metrics
-        feature_list.append(cpu_pct / max(replica_count, 1))
-        feature_list.append(ram_pct / max(replica_count, 1))
-        feature_list.append(features.get('request_count_per_second', 0) / max(replica_count, 1))
-        
-        # System pressure (based on CPU, RAM, response time only)
-        pressure = 0
-        if cpu_pct > 70: pressure += 1
-        if ram_pct > 75: pressure += 1
-        if features.get('response_time_ms', 0) > 500: pressure += 1
-        feature_list.append(pressure)
-        
-        # Service one-hot encoding (7 services)
-        services = ['authen', 'booking', 'frontend', 'order', 'product', 'profile', 'recommender']
-        for svc in services:
-            feature_list.append(1 if service_name == svc else 0)
-        
-        # Convert to numpy array
-        feature_array = np.array(feature_list, dtype=np.float32)
-        
-        # Apply PCA if available
-        if self.pca is not None:
-            # Scale features before PCA
-            if self.pca_scaler is not None:
-                feature_array = self.pca_scaler.transform(feature_array.reshape(1, -1)).flatten()
-            feature_array = self.pca.transform(feature_array.reshape(1, -1)).flatten()
-        
-        # Add to buffer
-        self.sequence_buffer[service_name].append(feature_array)
-        
-        # Keep only last sequence_length samples
-        seq_length = config.TRANSFORMER_PARAMS['sequence_length']
-        if len(self.sequence_buffer[service_name]) > seq_length:
-            self.sequence_buffer[service_name] = self.sequence_buffer[service_name][-seq_length:]
-        
-        # Need at least sequence_length samples to predict
-        if len(self.sequence_buffer[service_name]) < seq_length:
-            logger.warning(f"Not enough samples for {service_name}. "
-                          f"Need {seq_length}, have {len(self.sequence_buffer[service_name])}. "
-                          f"Using current replica count.")
-            return int(features.get('replica_count', 1))
-        
-        # Create sequence
-        sequence = np.array(self.sequence_buffer[service_name][-seq_length:])
-        sequence = sequence.reshape(1, seq_length, -1)
+    def forward_batch(self, sequences: np.ndarray, bundle: Dict = None,
+                      service_names: List[str] = None) -> np.ndarray:
+        """
+        Scale/project stacked windows and run one forward pass
         
-        # Predict
-        prediction = self.model.predict(sequence, verbose=0)[0][0]
+        With service_names and a cache tolerance, a window whose quantized
+        hash matches the last one scored for that service reuses its output,
+        and only the remaining windows go through the model.
+        """
+        bundle = bundle if bundle is not None else self._bundle
+        if self.model_type == 'transformer':
+            sequences = self._project_sequence(sequences, bundle)
+        elif bundle['scaler']:
+            sequences = bundle['scaler'].transform(
+                sequences.reshape(-1, sequences.shape[-1])
+            ).reshape(sequences.shape)
+        sequences = sequences.astype(np.float32, copy=False)
+        
+        if not (service_names and self.cache_tolerance):
+            return self._run_sequence_model(sequences, bundle)
+        
+        outputs = np.empty(len(sequences))
+        keys, misses = [], []
+        for j, (service_name, window) in enumerate(zip(service_names, sequences)):
+            keys.append((bundle['version'], self._window_key(window)))
+            stats = self.cache_stats.setdefault(service_name, {'hit': 0, 'miss': 0})
+            cached = self._window_cache.get(service_name)
+            if cached is not None and cached[0] == keys[j]:
+                outputs[j] = cached[1]
+                stats['hit'] += 1
+            else:
+                misses.append(j)
+                stats['miss'] += 1
+        
+        if misses:
+            outputs[misses] = self._run_sequence_model(sequences[misses], bundle)
+            for j in misses:
+                self._window_cache[service_names[j]] = (keys[j], outputs[j])
+        return outputs
+    
+    def _run_sequence_model(self, sequences: np.ndarray, bundle: Dict) -> np.ndarray:
+        """One forward pass over prepared (batch, seq, features) windows"""
+        # predict_on_batch skips the per-call data adapter/callback setup of predict()
+        outputs = bundle['model'].predict_on_batch(sequences)
+        return np.asarray(outputs, dtype=float).reshape(len(sequences), -1)[:, 0]
+    
+    def _window_key(self, window: np.ndarray) -> bytes:
+        """Hash of a scaled window quantized to cache_tolerance"""
+        quantized = np.round(window / self.cache_tolerance).astype(np.int64)
+        return hashlib.blake2b(quantized.tobytes(), digest_size=16).digest()
+    
+    def _predict_sequence_batch(self, features_list: List[Dict]) -> List[int]:
+        """LSTM-CNN / Transformer prediction for a batch of services (requires sequences)"""
+        # Services without a full window keep their current replica count
+        predictions = [int(features.get('replica_count', 1)) for features in features_list]
+        
+        ready, sequences = self.buffer_batch(features_list)
+        if not ready:
+            return predictions
         
+        service_names = [features_list[i].get('service_name', 'unknown') for i in ready]
+        outputs = self.forward_batch(sequences, service_names=service_names)
+        replicas = self.outputs_to_replicas([features_list[i] for i in ready], outputs)
+        for i, replica_count in zip(ready, replicas):
+            predictions[i] = replica_count
+        
+        return predictions
+    
+    def outputs_to_replicas(self, features_list: List[Dict], outputs: np.ndarray) -> List[int]:
+        """Map raw forward_batch outputs to replica counts"""
+        replicas = []
+        for features, prediction in zip(features_list, outputs):
+            if self.model_type == 'transformer':
+                replicas.append(self._round_transformer_prediction(
+                    prediction, features.get('service_name', 'unknown')))
+            else:
+                # Clip to valid range
+                replicas.append(int(np.clip(np.round(prediction), 1, 10)))
+        return replicas
+    
+    def _round_transformer_prediction(self, prediction: float, service_name: str) -> int:
+        """Map a raw transformer output to a replica count"""
         # STRICT rounding: Round up only if prediction >= X.6 (require strong signal)
         # This prevents over-prediction when there's no clear scaling signal
         # Example: 1.6 -> 2, 1.5 -> 1, 2.7 -> 3, 2.4 -> 2
-        replica_float = np.floor(prediction) + (prediction % 1 >= 0.6).astype(float)
+        replica_float = np.floor(prediction) + float(prediction % 1 >= 0.6)
         
         # Clip to valid range (1-5 to match HPA maxReplicas)
         replica_count = int(np.clip(replica_float, 1, 5))
         
-        logger.info(f"Raw prediction: {prediction:.2f}, Strict rounding (0.6): {replica_float:.0f}, Final: {replica_count}")
+        logger.info(f"[{service_name}] Raw prediction: {prediction:.2f}, Strict rounding (0.6): {replica_float:.0f}, Final: {replica_count}")
         
         return replica_count
     
-    def predict_batch(self, features_list: List[Dict]) -> List[int]:
+    def predict_window(self, history: List[Dict]) -> int:
+        """Predict the replica count for one service from an explicit window of samples"""
+        return self.predict_windows([history])[0]
+    
+    def predict_windows(self, histories: List[List[Dict]]) -> List[int]:
         """
-        Predict optimal replica counts for batch of services
+        Stateless prediction from explicit sample windows
+        
+        Each history is one service's samples, oldest first; the last
+        window-length samples are scored, earlier ones only feed engineered
+        features (lags, rolling stats). The live sequence buffers and window
+        state are never read or written, and the served bundle is read once,
+        so calls may run concurrently with each other, the prediction loop
+        and a model swap.
         
         Args:
-            features_list: List of feature dictionaries
+            histories: One list of feature dictionaries per service
             
         Returns:
-            List of predicted replica counts
+            Predicted replica counts; a history shorter than the model window
+            keeps its current replica count
         """
-        predictions = []
-        for features in features_list:
-            prediction = self.predict_single(features)
-            predictions.append(prediction)
+        if any(not history for history in histories):
+            raise ValueError("Every history needs at least one sample")
+        
+        bundle = self._bundle
+        latest = [history[-1] for history in histories]
+        predictions = [int(features.get('replica_count', 1)) for features in latest]
+        
+        if bundle['service_models'] is not None:
+            class_offset = PER_SERVICE_MODELS[self.model_type]['class_offset']
+            for i, history in enumerate(histories):
+                service_name = latest[i].get('service_name', 'unknown')
+                entry = bundle['service_models'].get(service_name)
+                if entry is None:
+                    logger.warning(f"No {self.model_type} model for {service_name}. Using current replica count.")
+                    continue
+                
+                window = entry['runner'].window if 'runner' in entry else WINDOW_SIZE
+                if len(history) < window:
+                    logger.warning(f"Not enough samples for {service_name}. "
+                                  f"Need {window}, have {len(history)}. "
+                                  f"Using current replica count.")
+                    continue
+                
+                # Earlier samples of the history feed the lags of the window's first rows
+                rows = bundle['extractor'].extract_window(history)[-window:]
+                if 'runner' in entry:
+                    _, probs = self._replay_stream(rows, entry)
+                    label = int(np.argmax(probs))
+                else:
+                    vector = window_features(entry['scaler'].transform(rows), bundle['window_layout'], window)
+                    label = int(self._predict_labels(entry, vector)[0])
+                predictions[i] = int(np.clip(label + class_offset, SERVICE_MIN_REPLICA, SERVICE_MAX_REPLICA))
+            return predictions
         
+        if self.model_type == 'random_forest':
+            # The legacy global model scores the latest sample only
+            return self._predict_rf_batch(latest, bundle)
+        
+        seq_length = self._sequence_length()
+        ready, windows = [], []
+        for i, history in enumerate(histories):
+            if len(history) < seq_length:
+                logger.warning(f"Not enough samples for {latest[i].get('service_name', 'unknown')}. "
+                              f"Need {seq_length}, have {len(history)}. "
+                              f"Using current replica count.")
+                continue
+            ready.append(i)
+            windows.append(np.array(self._feature_rows(history, bundle, window=True)[-seq_length:]))
+        
+        if ready:
+            outputs = self.forward_batch(np.stack(windows), bundle)
+            replicas = self.outputs_to_replicas([latest[i] for i in ready], outputs)
+            for i, replica_count in zip(ready, replicas):
+                predictions[i] = replica_count
         return predictions
     
+    def get_window_decision(self, history: List[Dict]) -> Dict:
+        """Scaling decision for the latest sample of an explicit window (stateless)"""
+        return self.get_window_decisions([history])[0]
+    
+    def get_window_decisions(self, histories: List[List[Dict]], predictions: List[int] = None) -> List[Dict]:
+        """Scaling decisions from explicit sample windows (stateless, see predict_windows)"""
+        if predictions is None:
+            predictions = self.predict_windows(histories)
+        return [
+            self._build_decision(history[-1], predicted_replicas)
+            for history, predicted_replicas in zip(histories, predictions)
+        ]
+    
     def get_scaling_decision(self, features: Dict) -> Dict:
         """
         Get detailed scaling decision with reasoning
@@ -485,8 +1203,29 @@ class K8sAutoScalingPredictor:
         Returns:
             Dictionary with prediction and reasoning
         """
+        return self.get_scaling_decisions([features])[0]
+    
+    def get_scaling_decisions(self, features_list: List[Dict], predictions: List[int] = None) -> List[Dict]:
+        """
+        Get scaling decisions for several services from one batched prediction
+        
+        Args:
+            features_list: List of feature dictionaries, one per service
+            predictions: Replica counts predicted elsewhere (default: predict_batch)
+            
+        Returns:
+            List of decision dictionaries in the same order
+        """
+        if predictions is None:
+            predictions = self.predict_batch(features_list)
+        return [
+            self._build_decision(features, predicted_replicas)
+            for features, predicted_replicas in zip(features_list, predictions)
+        ]
+    
+    def _build_decision(self, features: Dict, predicted_replicas: int) -> Dict:
+        """Turn a predicted replica count into a scaling decision"""
         current_replicas = int(features.get('replica_count', 1))
-        predicted_replicas = self.predict_single(features)
         
         # Determine action
         if predicted_replicas > current_replicas:
@@ -563,13 +1302,11 @@ class K8sAutoScalingPredictor:
         return round(confidence, 2)
     
     def reset_sequence_buffer(self, service_name: str = None):
-        """Reset sequence buffer for Transformer"""
+        """Reset sequence buffer (and per-service window state); safe during a cycle"""
+        self._clear_service_state(service_name)
         if service_name:
-            if service_name in self.sequence_buffer:
-                del self.sequence_buffer[service_name]
-                logger.info(f"Reset sequence buffer for {service_name}")
+            logger.info(f"Reset sequence buffer for {service_name}")
         else:
-            self.sequence_buffer = {}
             logger.info("Reset all sequence buffers")
 
 
@@ -0,0 +1,394 @@
+"""
+Out-of-process transformer inference
+
+InferenceWorkerPredictor runs the transformer in a child process so TF
+thread pools and GIL contention stay out of the FastAPI/uvicorn process.
+
+The per-service windows live in a multiprocessing.shared_memory block owned
+by the API process (SharedWindows, one (seq_length, n_features) slot per
+service). Each cycle the API process extracts the new rows and shifts them
+into the slots in place; a prediction request sends only slot indices over
+the pipe and the worker reads the windows straight from shared memory,
+answering with one replica count per window. Because the windows are owned
+by the API process, a crashed or hung worker is restarted without losing
+them.
+
+Decision building (reasoning, confidence) is inherited from
+K8sAutoScalingPredictor and runs in the API process.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import config
+from feature_manifest import FeatureExtractor
+from inference import K8sAutoScalingPredictor
+
+logger = logging.getLogger(__name__)
+
+
+class SharedWindows:
+    """(n_slots, seq_length, n_features) float32 windows in shared memory"""
+
+    def __init__(self, n_slots: int, seq_length: int, n_features: int, name: str = None):
+        """
+        Args:
+            n_slots: Number of service windows
+            seq_length: Samples per window
+            n_features: Features per sample
+            name: Attach to an existing block instead of creating one
+        """
+        self.shape = (n_slots, seq_length, n_features)
+        size = int(np.prod(self.shape)) * np.dtype(np.float32).itemsize
+        self._owner = name is None
+        if self._owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.array = np.ndarray(self.shape, dtype=np.float32, buffer=self.shm.buf)
+        if self._owner:
+            self.array.fill(0)
+
+    @property
+    def spec(self) -> Tuple[str, Tuple[int, int, int]]:
+        """What a worker needs to attach: (block name, shape)"""
+        return self.shm.name, self.shape
+
+    @classmethod
+    def attach(cls, name: str, shape: Tuple[int, int, int]) -> 'SharedWindows':
+        return cls(*shape, name=name)
+
+    def push(self, slot: int, row: np.ndarray):
+        """Shift a slot's window left by one sample and append row"""
+        window = self.array[slot]
+        window[:-1] = window[1:]
+        window[-1] = row
+
+    def clear(self, slot: int = None):
+        if slot is None:
+            self.array.fill(0)
+        else:
+            self.array[slot].fill(0)
+
+    def close(self):
+        """Detach; the creating process also frees the block"""
+        self.array = None
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+
+def _worker_info(predictor: K8sAutoScalingPredictor) -> Dict:
+    """Model details the API process needs to fill the shared windows"""
+    return {
+        'version': predictor.model_version,
+        'manifest': predictor.extractor.manifest,
+        'seq_length': predictor._sequence_length()
+    }
+
+
+def _worker_main(conn, model_type: str, model_dir: Optional[str], quantization: Optional[str],
+                 cpus: Optional[List[int]]):
+    """
+    Worker process loop
+
+    Commands (tuples received over conn, each answered with ('ok', result)
+    or ('error', message)):
+        ('attach', name, shape)       attach a SharedWindows block
+        ('predict', slots, services)  score the windows in those slots; the reply
+                                      also tells whether a version is staged
+        ('predict_windows', histories)
+        ('apply',)                    swap in a staged model version
+        ('watch', interval)           start the model watcher
+        ('reset', service)            drop the window cache of a service
+        ('stop',)
+    """
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+
+    try:
+        predictor = K8sAutoScalingPredictor(model_type=model_type, model_dir=model_dir, quantization=quantization)
+    except Exception as e:
+        conn.send(('error', f"Failed to load model: {e}"))
+        return
+    conn.send(('ok', _worker_info(predictor)))
+
+    windows = None
+    while True:
+        try:
+            command, *args = conn.recv()
+        except EOFError:
+            break
+        if command == 'stop':
+            break
+
+        try:
+            if command == 'attach':
+                if windows is not None:
+                    windows.close()
+                windows = SharedWindows.attach(*args)
+                result = None
+            elif command == 'predict':
+                slots, services = args
+                # Fancy indexing copies, so the API process may refill the slots right away
+                outputs = predictor.forward_batch(windows.array[slots], service_names=services)
+                replicas = predictor.outputs_to_replicas([{'service_name': s} for s in services], outputs)
+                result = (replicas, predictor.cache_stats, predictor._pending_bundle is not None)
+            elif command == 'predict_windows':
+                result = predictor.predict_windows(args[0])
+            elif command == 'apply':
+                result = (predictor.apply_pending_model(), _worker_info(predictor))
+            elif command == 'watch':
+                predictor.start_model_watcher(args[0])
+                result = None
+            elif command == 'reset':
+                predictor.reset_sequence_buffer(args[0])
+                result = None
+            else:
+                raise ValueError(f"Unknown command: {command}")
+        except Exception as e:
+            conn.send(('error', repr(e)))
+            continue
+        conn.send(('ok', result))
+
+    predictor.stop_model_watcher()
+    if windows is not None:
+        windows.close()
+
+
+class InferenceWorkerPredictor(K8sAutoScalingPredictor):
+    """
+    K8sAutoScalingPredictor whose transformer runs in a worker process
+
+    Same serving API as the in-process predictor. Buffers are the shared
+    windows; the model, the window cache and hot reload live in the worker.
+    """
+
+    def __init__(self, model_type: str = 'transformer', model_dir: str = None,
+                 quantization: Optional[str] = None, max_services: int = None,
+                 timeout: float = None, cpus: Optional[List[int]] = None):
+        """
+        Args:
+            model_type: Only 'transformer' (its rows come from the feature manifest)
+            model_dir: Passed to the worker's predictor
+            quantization: Passed to the worker's predictor
+            max_services: Window slots in the shared block
+            timeout: Seconds to wait for a worker reply before restarting it
+            cpus: CPU ids the worker is pinned to (default: no pinning)
+        """
+        if model_type != 'transformer':
+            raise ValueError(f"Inference worker only serves the transformer, got {model_type}")
+
+        params = config.INFERENCE_WORKER_PARAMS
+        self.model_type = model_type
+        self.model_root = model_dir
+        self.quantization = quantization
+        self.max_services = max_services or params['max_services']
+        self.timeout = timeout or params['timeout']
+        self.cpus = cpus if cpus is not None else params['cpus']
+        self.model_version = None
+        self.extractor = None
+        self.seq_length = None
+        self.cache_stats = {}
+        self.error_stats = {}  # One shared model: failures fail the whole batch, never one service
+
+        self.slots = {}   # service -> slot in the shared windows
+        self.counts = {}  # service -> samples pushed (capped at seq_length)
+        self.windows = None
+        self.raw_history = {}  # service -> last raw samples, for engineered features (_live_rows)
+        self._service_locks = {}
+        self._service_locks_lock = threading.Lock()
+        self._lock = threading.Lock()  # one request in flight on the pipe
+        self._staged = False  # worker reported a staged model version
+
+        self._context = multiprocessing.get_context('spawn')
+        self._process = None
+        self._conn = None
+        self._watch_interval = None
+        self._start_worker()
+
+    def _start_worker(self):
+        """Spawn the worker, wait for its model and (re)attach the shared windows"""
+        self._conn, child_conn = self._context.Pipe()
+        self._process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, self.model_type, self.model_root, self.quantization, self.cpus),
+            name='inference-worker',
+            daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+
+        # The first reply waits for the model load, which can take a while
+        if not self._conn.poll(max(self.timeout, 300)):
+            self._kill_worker()
+            raise TimeoutError("Inference worker did not load its model in time")
+        status, info = self._conn.recv()
+        if status != 'ok':
+            self._kill_worker()
+            raise RuntimeError(info)
+        self._apply_worker_info(info)
+
+        self._call('attach', *self.windows.spec)
+        if self._watch_interval:
+            self._call('watch', self._watch_interval)
+        logger.info(f"Inference worker started (pid {self._process.pid}, model version {self.model_version})")
+
+    def _kill_worker(self):
+        if self._process is not None and self._process.is_alive():
+            self._process.kill()
+            self._process.join(timeout=5)
+        if self._conn is not None:
+            self._conn.close()
+        self._process = None
+        self._conn = None
+
+    def _apply_worker_info(self, info: Dict) -> bool:
+        """
+        Adopt the worker's model version
+
+        Returns:
+            True if the feature layout changed and the windows were rebuilt
+        """
+        self.model_version = info['version']
+        layout_changed = self.extractor is None or self.extractor.feature_names != [
+            spec['name'] for spec in info['manifest']['features']]
+        if not layout_changed and info['seq_length'] == self.seq_length:
+            return False
+
+        self.extractor = FeatureExtractor(info['manifest'])
+        self.seq_length = info['seq_length']
+        if self.windows is not None:
+            logger.warning(f"Feature layout changed in version {self.model_version}, resetting sequence buffers")
+            self.windows.close()
+        self.windows = SharedWindows(self.max_services, self.seq_length, self.extractor.n_features)
+        self.counts = {service: 0 for service in self.slots}
+        return True
+
+    def _call(self, command: str, *args):
+        """Send one command and wait for its reply; restart the worker on timeout or crash"""
+        try:
+            self._conn.send((command, *args))
+            if not self._conn.poll(self.timeout):
+                raise TimeoutError(f"Inference worker did not answer {command!r} within {self.timeout}s")
+            status, result = self._conn.recv()
+        except (TimeoutError, EOFError, OSError) as e:
+            logger.error(f"Inference worker failed ({e}), restarting")
+            self._kill_worker()
+            self._start_worker()
+            raise
+        if status != 'ok':
+            raise RuntimeError(f"Inference worker error: {result}")
+        return result
+
+    def _slot(self, service_name: str) -> Optional[int]:
+        slot = self.slots.get(service_name)
+        if slot is None:
+            if len(self.slots) >= self.max_services:
+                return None
+            slot = self.slots[service_name] = len(self.slots)
+            self.counts[service_name] = 0
+        return slot
+
+    def predict_batch(self, features_list: List[Dict]) -> List[int]:
+        """Push one row per service into the shared windows and score the full ones in the worker"""
+        if not features_list:
+            return []
+        # Services without a full window keep their current replica count
+        predictions = [int(features.get('replica_count', 1)) for features in features_list]
+
+        with self._lock:
+            rows = self._live_rows(features_list, self.extractor)
+            ready, slots, services = [], [], []
+            for i, (features, row) in enumerate(zip(features_list, rows)):
+                service_name = features.get('service_name', 'unknown')
+                slot = self._slot(service_name)
+                if slot is None:
+                    logger.warning(f"No free window slot for {service_name} "
+                                   f"(max_services={self.max_services}). Using current replica count.")
+                    continue
+
+                self.windows.push(slot, row)
+                self.counts[service_name] = min(self.counts[service_name] + 1, self.seq_length)
+                if self.counts[service_name] < self.seq_length:
+                    logger.warning(f"Not enough samples for {service_name}. "
+                                   f"Need {self.seq_length}, have {self.counts[service_name]}. "
+                                   f"Using current replica count.")
+                    continue
+
+                ready.append(i)
+                slots.append(slot)
+                services.append(service_name)
+
+            if ready:
+                replicas, self.cache_stats, self._staged = self._call('predict', slots, services)
+                for i, replica_count in zip(ready, replicas):
+                    predictions[i] = replica_count
+
+        return predictions
+
+    def predict_windows(self, histories: List[List[Dict]]) -> List[int]:
+        """Stateless prediction from explicit windows (sent to the worker as dicts)"""
+        with self._lock:
+            return self._call('predict_windows', histories)
+
+    def apply_pending_model(self) -> Optional[str]:
+        """
+        Swap in a version staged by the worker's model watcher
+
+        Only goes to the worker when its last predict reply reported a staged
+        version, so cycles without a new model never wait on the pipe. The
+        swap itself blocks on the worker (smoke prediction, possibly a
+        restart); async callers run it in a thread.
+        """
+        if not self._staged:
+            return None
+        with self._lock:
+            self._staged = False
+            result, info = self._call('apply')
+            if result and self._apply_worker_info(info):
+                self._call('attach', *self.windows.spec)
+            return result
+
+    def start_model_watcher(self, interval: float = None):
+        with self._lock:
+            self._watch_interval = interval if interval is not None else config.MODEL_WATCH_INTERVAL
+            self._call('watch', self._watch_interval)
+
+    def stop_model_watcher(self):
+        """Stop the worker and free the shared windows"""
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.send(('stop',))
+                except OSError:
+                    pass
+            if self._process is not None:
+                self._process.join(timeout=5)
+            self._kill_worker()
+            if self.windows is not None:
+                self.windows.close()
+                self.windows = None
+
+    def reset_sequence_buffer(self, service_name: str = None):
+        with self._lock:
+            if service_name:
+                slot = self.slots.get(service_name)
+                if slot is not None:
+                    self.windows.clear(slot)
+                    self.counts[service_name] = 0
+                self.raw_history.pop(service_name, None)
+                self._call('reset', service_name)
+                logger.info(f"Reset sequence buffer for {service_name}")
+            else:
+                self.windows.clear()
+                self.counts = {service: 0 for service in self.slots}
+                self.raw_history = {}
+                self._call('reset', None)
+                logger.info("Reset all sequence buffers")
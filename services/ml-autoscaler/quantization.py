@@ -0,0 +1,98 @@
+"""
+Post-training quantization of Keras models to TensorFlow Lite
+
+Variants:
+    int8     dynamic-range quantization (int8 weights, float activations)
+    float16  float16 weights
+
+Quantized artifacts are written next to the Keras model as
+<stem>.<variant>.tflite (e.g. transformer_model.int8.tflite) and are served
+through TFLiteModel, which exposes the predict/predict_on_batch subset of
+the Keras model API used by K8sAutoScalingPredictor.
+"""
+
+import logging
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_VARIANTS = ('int8', 'float16')
+
+
+def quantized_model_path(model_dir, stem: str, variant: str) -> Path:
+    """Path of the quantized artifact for a Keras model saved as <stem>.keras"""
+    if variant not in QUANTIZATION_VARIANTS:
+        raise ValueError(f"Unknown quantization variant: {variant} (expected one of {QUANTIZATION_VARIANTS})")
+    return Path(model_dir) / f'{stem}.{variant}.tflite'
+
+
+def quantize_keras_model(model, variant: str) -> bytes:
+    """
+    Convert a Keras model to a quantized TFLite flatbuffer
+
+    The model is exported as a SavedModel first; converting Keras 3 models
+    directly leaves resource variables the TFLite runtime cannot read.
+    """
+    if variant not in QUANTIZATION_VARIANTS:
+        raise ValueError(f"Unknown quantization variant: {variant} (expected one of {QUANTIZATION_VARIANTS})")
+
+    with tempfile.TemporaryDirectory() as export_dir:
+        model.export(export_dir, format='tf_saved_model', verbose=False)
+        converter = tf.lite.TFLiteConverter.from_saved_model(export_dir)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if variant == 'float16':
+            converter.target_spec.supported_types = [tf.float16]
+        return converter.convert()
+
+
+def save_quantized_model(model, model_dir, stem: str, variant: str) -> Path:
+    """Quantize a Keras model and write <stem>.<variant>.tflite to model_dir"""
+    path = quantized_model_path(model_dir, stem, variant)
+    path.write_bytes(quantize_keras_model(model, variant))
+    logger.info(f"Saved {variant} model to {path} ({path.stat().st_size / 1024:.0f} KB)")
+    return path
+
+
+class TFLiteModel:
+    """
+    TFLite interpreter with the Keras predict API used for serving
+
+    The input tensor is resized when the batch size changes. Invocations are
+    serialized because a TFLite interpreter is not thread-safe.
+    """
+
+    def __init__(self, model_path, num_threads: int = None):
+        self.model_path = Path(model_path)
+        self.interpreter = tf.lite.Interpreter(model_path=str(self.model_path), num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input['shape'][0])
+        self._lock = threading.Lock()
+
+    @property
+    def input_shape(self):
+        """Input shape with a None batch dimension, like keras.Model.input_shape"""
+        return (None,) + tuple(int(d) for d in self._input['shape'][1:])
+
+    def predict_on_batch(self, x) -> np.ndarray:
+        x = np.ascontiguousarray(x, dtype=self._input['dtype'])
+        with self._lock:
+            if x.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input['index'], x.shape)
+                self.interpreter.allocate_tensors()
+                self._batch_size = x.shape[0]
+            self.interpreter.set_tensor(self._input['index'], x)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self._output['index']).copy()
+
+    def predict(self, x, batch_size: int = 256, verbose=0) -> np.ndarray:
+        return np.concatenate([
+            self.predict_on_batch(x[start:start + batch_size])
+            for start in range(0, len(x), batch_size)
+        ])
@@ -0,0 +1,290 @@
+"""
+Inference micro-benchmark for K8sAutoScalingPredictor
+
+Feeds synthetic metrics (generate_daily_data.py output passed through
+DataPreprocessor.engineer_features) to each model type and measures:
+
+1. Model load time and cold predict_single latency (first call on a full window)
+2. Warm predict_single latency p50/p99
+3. predict_batch throughput from 1 to 512 services
+4. Resident memory (model load delta and peak)
+
+Each model type runs in a fresh spawned process, so cold latency and memory
+are not shared between types. Beyond the 7 real services, services are
+synthetic copies of them (e.g. order-3) with their own buffers, sharing that
+service's per-service model. The window cache is disabled and predictor
+logging is silenced so only inference is timed.
+
+Results are written as JSON tagged with the git commit; --baseline prints
+the change against an earlier result file.
+
+Usage:
+    python benchmark_inference.py
+    python benchmark_inference.py --model-types transformer --batch-sizes 1 64 512
+    python benchmark_inference.py --baseline benchmark_results/inference_<commit>.json
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import config
+from data_preprocessor import DataPreprocessor
+from generate_daily_data import generate_daily_data
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+MODEL_TYPES = ('random_forest', 'catboost', 'lstm_cnn', 'transformer', 'transformer_incremental', 'transformer_student')
+DEFAULT_MODEL_TYPES = ['random_forest', 'lstm_cnn', 'transformer']
+DEFAULT_BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+
+
+def _current_rss_mb():
+    """Current resident set size of this process"""
+    with open('/proc/self/statm') as f:
+        pages = int(f.read().split()[1])
+    return pages * resource.getpagesize() / (1024 ** 2)
+
+
+def _git_commit():
+    """Short commit hash of the working tree, with a -dirty suffix for local changes"""
+    cwd = Path(__file__).parent
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=cwd,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no', '.'], cwd=cwd.parent,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f'{commit}-dirty' if dirty else commit
+
+
+def synthetic_streams(date, samples_per_service):
+    """Per-service feature dicts in time order, shaped like the training data"""
+    raw = pd.DataFrame(generate_daily_data(datetime.strptime(date, '%Y-%m-%d')))
+    df = DataPreprocessor().engineer_features(raw).drop(columns=['timestamp'])
+
+    streams = {}
+    for service, service_df in df.groupby('service_name', sort=True):
+        streams[service] = service_df.head(samples_per_service).to_dict('records')
+    return streams
+
+
+def _service_names(bases, n):
+    """(real service, name) for n services: the real services first, then numbered copies"""
+    names = []
+    for i in range(n):
+        base = bases[i % len(bases)]
+        names.append((base, base if i < len(bases) else f'{base}-{i // len(bases)}'))
+    return names
+
+
+def _percentiles(latencies_ms):
+    return {
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'mean_ms': float(np.mean(latencies_ms))
+    }
+
+
+def _benchmark_model(model_type, model_dir, streams, batch_sizes, warm_calls, cycles):
+    """
+    Benchmark one model type (runs in a spawned worker process)
+
+    Returns:
+        Result dict for the report
+    """
+    from inference import K8sAutoScalingPredictor
+
+    logging.getLogger('inference').setLevel(logging.ERROR)
+    bases = sorted(streams)
+
+    rss_before = _current_rss_mb()
+    start = time.perf_counter()
+    predictor = K8sAutoScalingPredictor(model_type=model_type, model_dir=model_dir, cache_tolerance=0)
+    load_s = time.perf_counter() - start
+    rss_loaded = _current_rss_mb()
+
+    # Legacy global Random Forest scores single samples; everything else needs a window
+    window = 1 if (model_type == 'random_forest' and predictor.service_models is None) else predictor._sequence_length()
+    if model_type == 'transformer_incremental' and predictor.service_models:
+        window = next(iter(predictor.service_models.values()))['runner'].window
+
+    def sample(base, name, step):
+        features = dict(streams[base][step % len(streams[base])])
+        features['service_name'] = name
+        return features
+
+    def register(names):
+        # Synthetic copies share their real service's per-service model
+        if predictor.service_models is not None:
+            for base, name in names:
+                if base in predictor.service_models:
+                    predictor.service_models.setdefault(name, predictor.service_models[base])
+
+    # Single-service latency: the first call on a full window is the cold one
+    base = bases[0]
+    for step in range(window - 1):
+        predictor.predict_single(sample(base, base, step))
+    start = time.perf_counter()
+    predictor.predict_single(sample(base, base, window - 1))
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    for step in range(window, window + warm_calls):
+        features = sample(base, base, step)
+        start = time.perf_counter()
+        predictor.predict_single(features)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    # Batch throughput: fill every window, then time full cycles
+    batch = {}
+    for n in batch_sizes:
+        predictor.reset_sequence_buffer()
+        names = _service_names(bases, n)
+        register(names)
+        offsets = [i * 37 for i in range(n)]
+
+        for step in range(window):
+            predictor.predict_batch([sample(b, name, step + o) for (b, name), o in zip(names, offsets)])
+
+        cycle_ms = []
+        for step in range(window, window + cycles):
+            features_list = [sample(b, name, step + o) for (b, name), o in zip(names, offsets)]
+            start = time.perf_counter()
+            predictor.predict_batch(features_list)
+            cycle_ms.append((time.perf_counter() - start) * 1000)
+
+        batch[str(n)] = {
+            'cycle_p50_ms': float(np.percentile(cycle_ms, 50)),
+            'cycle_p99_ms': float(np.percentile(cycle_ms, 99)),
+            'services_per_s': float(n * len(cycle_ms) / (sum(cycle_ms) / 1000))
+        }
+
+    return {
+        'model_version': predictor.model_version,
+        'window': window,
+        'load_s': load_s,
+        'cold_single_ms': cold_ms,
+        'warm_single': _percentiles(latencies),
+        'batch': batch,
+        'model_rss_mb': rss_loaded - rss_before,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def _change(new, old):
+    return f"{new:.2f} vs {old:.2f} ({(new / old - 1) * 100:+.0f}%)" if old else f"{new:.2f}"
+
+
+def compare_with_baseline(report, baseline):
+    """Log the change of the headline numbers against an earlier report"""
+    logger.info(f"Comparison with {baseline['commit']} (new vs baseline):")
+    for model_type, result in report['results'].items():
+        old = baseline['results'].get(model_type)
+        if 'skipped' in result or old is None or 'skipped' in old:
+            continue
+        logger.info(f"  {model_type}:")
+        logger.info(f"    cold single ms   {_change(result['cold_single_ms'], old['cold_single_ms'])}")
+        logger.info(f"    warm single p50  {_change(result['warm_single']['p50_ms'], old['warm_single']['p50_ms'])}")
+        logger.info(f"    warm single p99  {_change(result['warm_single']['p99_ms'], old['warm_single']['p99_ms'])}")
+        for n, batch in result['batch'].items():
+            if n in old['batch']:
+                logger.info(f"    batch {n:>4} svc/s  {_change(batch['services_per_s'], old['batch'][n]['services_per_s'])}")
+        logger.info(f"    peak RSS MB      {_change(result['peak_rss_mb'], old['peak_rss_mb'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark K8sAutoScalingPredictor inference')
+    parser.add_argument('--model-dir', default=str(config.MODEL_OUTPUT_DIR), help='Model directory (or versioned root)')
+    parser.add_argument('--model-types', nargs='+', default=DEFAULT_MODEL_TYPES, choices=MODEL_TYPES,
+                        help='Model types to benchmark')
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=DEFAULT_BATCH_SIZES,
+                        help='Numbers of services per predict_batch call')
+    parser.add_argument('--warm-calls', type=int, default=200, help='Timed warm predict_single calls')
+    parser.add_argument('--cycles', type=int, default=20, help='Timed predict_batch cycles per batch size')
+    parser.add_argument('--date', default='2025-12-05', help='Day passed to generate_daily_data')
+    parser.add_argument('--samples', type=int, default=600, help='Synthetic samples kept per service')
+    parser.add_argument('--output', default=None,
+                        help='Result path (default: benchmark_results/inference_<commit>.json)')
+    parser.add_argument('--baseline', default=None, help='Earlier result file to compare with')
+    args = parser.parse_args()
+
+    commit = _git_commit()
+    output_path = (Path(args.output) if args.output
+                   else Path(__file__).parent / 'benchmark_results' / f'inference_{commit}.json')
+
+    logger.info("="*80)
+    logger.info("INFERENCE BENCHMARK")
+    logger.info("="*80)
+    logger.info(f"Commit: {commit}, model dir: {args.model_dir}")
+
+    streams = synthetic_streams(args.date, args.samples)
+    logger.info(f"Synthetic streams: {len(streams)} services x {args.samples} samples")
+
+    pool_context = multiprocessing.get_context('spawn')
+    report = {
+        'commit': commit,
+        'created': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'settings': {
+            'model_dir': args.model_dir,
+            'batch_sizes': args.batch_sizes,
+            'warm_calls': args.warm_calls,
+            'cycles': args.cycles,
+            'date': args.date,
+            'samples': args.samples
+        },
+        'results': {}
+    }
+
+    for model_type in args.model_types:
+        logger.info(f"[{model_type}] Benchmarking...")
+        try:
+            with pool_context.Pool(1) as pool:
+                result = pool.apply(_benchmark_model, (model_type, args.model_dir, streams, args.batch_sizes,
+                                                       args.warm_calls, args.cycles))
+        except Exception as e:
+            logger.warning(f"[{model_type}] SKIPPED: {e}")
+            report['results'][model_type] = {'skipped': str(e)}
+            continue
+
+        report['results'][model_type] = result
+        logger.info(f"  Load: {result['load_s']:.2f}s, cold single: {result['cold_single_ms']:.1f}ms, "
+                    f"warm single p50/p99: {result['warm_single']['p50_ms']:.2f}/{result['warm_single']['p99_ms']:.2f}ms, "
+                    f"RSS: {result['peak_rss_mb']:.0f}MB (model {result['model_rss_mb']:.1f}MB)")
+        for n, batch in result['batch'].items():
+            logger.info(f"  batch {n:>4}: {batch['services_per_s']:10.0f} services/s, "
+                        f"cycle p50 {batch['cycle_p50_ms']:.2f}ms")
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Results saved to {output_path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare_with_baseline(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
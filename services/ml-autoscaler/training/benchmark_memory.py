@@ -0,0 +1,116 @@
+"""
+Peak memory of the training data path, default vs compact dtypes
+
+Runs what the per-service trainers do before fitting (load_local_folder ->
+clean_data -> engineer_features -> create_target_labels ->
+prepare_features_and_target) once with the default dtypes and once with
+lean=True (float32 metrics, int32 counts, categorical service_name,
+timestamps parsed at load; see DataPreprocessor.lean_dtypes).
+
+Each mode runs in a fresh spawned process and reports its peak resident
+memory above the process baseline (after imports), the size of the loaded
+and engineered frames and the wall time.
+
+Usage:
+    python benchmark_memory.py --folder ../metrics/filtered
+    python benchmark_memory.py --synthetic-days 60
+"""
+
+import argparse
+import logging
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from data_preprocessor import DataPreprocessor
+from generate_daily_data import generate_daily_data
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _rss_mb():
+    with open('/proc/self/statm') as f:
+        pages = int(f.read().split()[1])
+    return pages * resource.getpagesize() / (1024 ** 2)
+
+
+def _frame_mb(df):
+    return df.memory_usage(deep=True).sum() / (1024 ** 2)
+
+
+def _run_training_path(folder, lean):
+    """Training data path in a spawned process; returns its memory report"""
+    logging.getLogger('data_preprocessor').setLevel(logging.WARNING)
+    preprocessor = DataPreprocessor()
+    baseline_mb = _rss_mb()
+
+    start = time.perf_counter()
+    data = preprocessor.load_local_folder(folder, columns=DataPreprocessor.TRAINING_COLUMNS, lean=lean)
+    loaded_mb = _frame_mb(data)
+    rows = len(data)
+    data = preprocessor.engineer_features(preprocessor.clean_data(data))
+    engineered_mb = _frame_mb(data)
+    X, y = preprocessor.prepare_features_and_target(preprocessor.create_target_labels(data))
+    elapsed = time.perf_counter() - start
+
+    return {
+        'rows': rows,
+        'loaded_mb': loaded_mb,
+        'engineered_mb': engineered_mb,
+        'features_mb': _frame_mb(X),
+        'peak_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 - baseline_mb,
+        'seconds': elapsed
+    }
+
+
+def write_synthetic_days(folder, start_date, days):
+    """Daily metrics_YYYYMMDD.csv files from generate_daily_data"""
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    for i in range(days):
+        day = start + timedelta(days=i)
+        pd.DataFrame(generate_daily_data(day)).to_csv(Path(folder) / f"metrics_{day:%Y%m%d}.csv", index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Peak memory of the training data path, default vs lean dtypes')
+    parser.add_argument('--folder', default=None, help='Metrics folder (default: synthetic days)')
+    parser.add_argument('--synthetic-days', type=int, default=30, help='Synthetic days when no --folder is given')
+    parser.add_argument('--start-date', default='2025-11-01', help='First synthetic day')
+    args = parser.parse_args()
+
+    logger.info("="*80)
+    logger.info("TRAINING DATA MEMORY BENCHMARK")
+    logger.info("="*80)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = args.folder
+        if folder is None:
+            folder = tmp
+            write_synthetic_days(folder, args.start_date, args.synthetic_days)
+            logger.info(f"Synthetic data: {args.synthetic_days} days in {folder}")
+
+        pool_context = multiprocessing.get_context('spawn')
+        results = {}
+        for name, lean in (('default', False), ('lean', True)):
+            with pool_context.Pool(1) as pool:
+                results[name] = pool.apply(_run_training_path, (folder, lean))
+
+    logger.info(f"Rows: {results['default']['rows']:,}")
+    logger.info(f"{'':18}{'default':>10}{'lean':>10}{'change':>10}")
+    for key, label in (('loaded_mb', 'Loaded MB'), ('engineered_mb', 'Engineered MB'),
+                       ('features_mb', 'Features MB'), ('peak_mb', 'Peak RSS MB'), ('seconds', 'Seconds')):
+        default, lean = results['default'][key], results['lean'][key]
+        logger.info(f"{label:18}{default:10.1f}{lean:10.1f}{(lean / default - 1) * 100:+9.0f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Benchmark and validate DataPreprocessor.engineer_features
+
+Generates --days of synthetic metrics (generate_daily_data.py), cleans them
+and runs feature engineering two ways:
+
+1. engineer_features_reference: the original per-service loop with one
+   df.loc[service_mask, col] assignment per feature
+2. DataPreprocessor.engineer_features: one pass over the service-sorted frame
+
+The outputs must be identical (same columns, order, dtypes and values);
+the script exits non-zero otherwise and logs the speedup. The loop scans the
+whole frame once per assignment and service, so its cost grows with the
+number of services; --service-copies adds renamed copies of every service
+(e.g. order-1) to measure that.
+
+Usage:
+    python benchmark_preprocessing.py
+    python benchmark_preprocessing.py --days 60 --repeats 3
+    python benchmark_preprocessing.py --service-copies 3
+"""
+
+import argparse
+import logging
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import config
+from data_preprocessor import DataPreprocessor
+from generate_daily_data import generate_daily_data
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def engineer_features_reference(data):
+    """Per-service loop engineer_features used to run (kept as the reference output)"""
+    df = data.copy()
+
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
+    df = df.sort_values(['service_name', 'timestamp']).reset_index(drop=True)
+
+    df['hour'] = df['timestamp'].dt.hour
+    df['day_of_week'] = df['timestamp'].dt.dayofweek
+    df['hour_sin'] = np.sin(2 * np.pi * df['hour'] / 24)
+    df['hour_cos'] = np.cos(2 * np.pi * df['hour'] / 24)
+    df['dow_sin'] = np.sin(2 * np.pi * df['day_of_week'] / 7)
+    df['dow_cos'] = np.cos(2 * np.pi * df['day_of_week'] / 7)
+
+    df['cpu_request'] = np.clip(df['cpu_request'] / 1000, 0, 100)
+    df['cpu_limit'] = np.clip(df['cpu_limit'] / 1000, 0, 100)
+    df['ram_request'] = np.clip(df['ram_request'] / (1024**3), 0, 100)
+    df['ram_limit'] = np.clip(df['ram_limit'] / (1024**3), 0, 100)
+
+    for service in config.SERVICES:
+        service_mask = df['service_name'] == service
+        service_df = df[service_mask].copy()
+
+        if len(service_df) < 2:
+            continue
+
+        df.loc[service_mask, 'cpu_utilization_ratio'] = (
+            service_df['cpu_usage_percent'] / (service_df['cpu_limit'] + 1e-6)
+        )
+        df.loc[service_mask, 'ram_utilization_ratio'] = (
+            service_df['ram_usage_percent'] / (service_df['ram_limit'] + 1e-6)
+        )
+
+        for lag in [1, 5, 10]:
+            df.loc[service_mask, f'cpu_lag_{lag}'] = service_df['cpu_usage_percent'].shift(lag)
+            df.loc[service_mask, f'ram_lag_{lag}'] = service_df['ram_usage_percent'].shift(lag)
+            df.loc[service_mask, f'rps_lag_{lag}'] = service_df['request_count_per_second'].shift(lag)
+
+        df.loc[service_mask, 'cpu_change_rate'] = service_df['cpu_usage_percent'].diff()
+        df.loc[service_mask, 'ram_change_rate'] = service_df['ram_usage_percent'].diff()
+        df.loc[service_mask, 'request_change_rate'] = service_df['request_count_per_second'].diff()
+
+        df.loc[service_mask, 'cpu_acceleration'] = service_df['cpu_usage_percent'].diff().diff()
+        df.loc[service_mask, 'rps_acceleration'] = service_df['request_count_per_second'].diff().diff()
+
+        window_size = 10
+
+        df.loc[service_mask, 'cpu_rolling_mean'] = (
+            service_df['cpu_usage_percent'].rolling(window=window_size, min_periods=1).mean()
+        )
+        df.loc[service_mask, 'ram_rolling_mean'] = (
+            service_df['ram_usage_percent'].rolling(window=window_size, min_periods=1).mean()
+        )
+        df.loc[service_mask, 'rps_rolling_mean'] = (
+            service_df['request_count_per_second'].rolling(window=window_size, min_periods=1).mean()
+        )
+
+        df.loc[service_mask, 'cpu_rolling_std'] = (
+            service_df['cpu_usage_percent'].rolling(window=window_size, min_periods=1).std()
+        )
+        df.loc[service_mask, 'ram_rolling_std'] = (
+            service_df['ram_usage_percent'].rolling(window=window_size, min_periods=1).std()
+        )
+        df.loc[service_mask, 'rps_rolling_std'] = (
+            service_df['request_count_per_second'].rolling(window=window_size, min_periods=1).std()
+        )
+
+        df.loc[service_mask, 'request_rolling_max'] = (
+            service_df['request_count_per_second'].rolling(window=window_size, min_periods=1).max()
+        )
+        df.loc[service_mask, 'response_time_rolling_p95'] = (
+            service_df['response_time_ms'].rolling(window=window_size, min_periods=1).quantile(0.95)
+        )
+
+        cpu_mean = service_df['cpu_usage_percent'].rolling(window=window_size, min_periods=1).mean()
+        cpu_std = service_df['cpu_usage_percent'].rolling(window=window_size, min_periods=1).std()
+        df.loc[service_mask, 'cpu_spike_flag'] = (
+            (service_df['cpu_usage_percent'] - cpu_mean) > 1.5 * cpu_std
+        ).astype(int)
+
+        rps_mean = service_df['request_count_per_second'].rolling(window=window_size, min_periods=1).mean()
+        rps_std = service_df['request_count_per_second'].rolling(window=window_size, min_periods=1).std()
+        df.loc[service_mask, 'rps_spike_flag'] = (
+            (service_df['request_count_per_second'] - rps_mean) > 1.5 * rps_std
+        ).astype(int)
+
+        df.loc[service_mask, 'system_pressure'] = (
+            (service_df['cpu_usage_percent'] > 70).astype(int) +
+            (service_df['ram_usage_percent'] > 75).astype(int) +
+            (service_df['response_time_ms'] > 500).astype(int) +
+            (service_df['error_rate'] > 0.05).astype(int)
+        )
+
+    return df.fillna(0)
+
+
+def synthetic_history(start_date, days, service_copies=0):
+    """Raw metrics of consecutive synthetic days, plus renamed copies of every service"""
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    frames = [pd.DataFrame(generate_daily_data(start + timedelta(days=i))) for i in range(days)]
+    data = pd.concat(frames, ignore_index=True)
+    copies = [data.assign(service_name=data['service_name'] + f'-{i}') for i in range(1, service_copies + 1)]
+    return pd.concat([data] + copies, ignore_index=True)
+
+
+def _best_of(func, repeats):
+    times, result = [], None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark vectorized engineer_features against the per-service loop')
+    parser.add_argument('--days', type=int, default=30, help='Synthetic days of metrics')
+    parser.add_argument('--start-date', default='2025-11-01', help='First synthetic day')
+    parser.add_argument('--repeats', type=int, default=1, help='Timed runs per implementation (best is kept)')
+    parser.add_argument('--service-copies', type=int, default=0, help='Renamed copies of every service to add')
+    args = parser.parse_args()
+
+    logger.info("="*80)
+    logger.info("FEATURE ENGINEERING BENCHMARK")
+    logger.info("="*80)
+
+    preprocessor = DataPreprocessor()
+    data = preprocessor.clean_data(synthetic_history(args.start_date, args.days, args.service_copies))
+    # Both implementations only engineer features of config.SERVICES
+    config.SERVICES = sorted(data['service_name'].unique())
+    logger.info(f"Data: {args.days} days, {len(data):,} rows, {data['service_name'].nunique()} services")
+
+    logging.getLogger('data_preprocessor').setLevel(logging.WARNING)
+    reference_s, expected = _best_of(lambda: engineer_features_reference(data), args.repeats)
+    vectorized_s, actual = _best_of(lambda: preprocessor.engineer_features(data), args.repeats)
+
+    try:
+        pd.testing.assert_frame_equal(actual, expected, check_exact=True)
+    except AssertionError as e:
+        logger.error(f"Outputs differ: {e}")
+        sys.exit(1)
+
+    logger.info(f"Outputs identical: {actual.shape[0]:,} rows x {actual.shape[1]} columns")
+    logger.info(f"Per-service loop: {reference_s:.2f}s")
+    logger.info(f"Single pass:      {vectorized_s:.2f}s")
+    logger.info(f"Speedup:          {reference_s / vectorized_s:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
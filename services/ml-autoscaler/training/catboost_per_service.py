@@ -24,11 +24,16 @@ import matplotlib
 matplotlib.use('Agg')  # Non-interactive backend to avoid tkinter issues
 import matplotlib.pyplot as plt
 
+import argparse
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 import config
 from data_preprocessor import DataPreprocessor
+from feature_manifest import FEATURE_MANIFEST_FILE, build_feature_manifest, save_feature_manifest
+from feature_shards import load_training_shards
+from parallel_training import train_services
+from window_features import CATBOOST_WINDOW_LAYOUT, window_features
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -50,10 +55,11 @@ class ServiceCatBoost:
     CatBoost classifier with gradient boosting optimizations
     """
     
-    def __init__(self, service_name, n_features=24, sequence_length=WINDOW_SIZE):
+    def __init__(self, service_name, n_features=24, sequence_length=WINDOW_SIZE, thread_count=-1):
         self.service_name = service_name
         self.n_features = n_features
         self.sequence_length = sequence_length  # 30 samples = 15 minutes (increased)
+        self.thread_count = thread_count  # -1: all cores (capped per worker in parallel training)
         self.scaler = RobustScaler()  # RobustScaler for outlier resilience
         self.model = None
         self.history = {'train_accuracy': [], 'val_accuracy': [], 'iterations': []}
@@ -70,60 +76,17 @@ class ServiceCatBoost:
         5. Coefficient of variation: relative variability
         6. Recent vs older comparison
         """
-        features = []
-        targets = []
-        
-        for i in range(self.sequence_length, len(X)):
-            window = X[i-self.sequence_length:i]
-            feat = []
-            
-            # 1. Current values (last timestep)
-            feat.extend(X[i-1])
-            
-            # 2. Basic statistics
-            feat.extend(np.mean(window, axis=0))
-            feat.extend(np.std(window, axis=0))
-            feat.extend(np.min(window, axis=0))
-            feat.extend(np.max(window, axis=0))
-            
-            # 3. Percentile 95 - captures high load periods
-            feat.extend(np.percentile(window, 95, axis=0))
-            
-            # 4. Trend: difference between last and first
-            feat.extend(X[i-1] - X[i-self.sequence_length])
-            
-            # 5. Rate of change: average change per timestep
-            if self.sequence_length > 1:
-                diffs = np.diff(window, axis=0)
-                feat.extend(np.mean(diffs, axis=0))
-            else:
-                feat.extend(np.zeros(X.shape[1]))
-            
-            # 6. Burst indicators: count of values exceeding threshold
-            window_std = np.std(window, axis=0) + 1e-8
-            window_mean = np.mean(window, axis=0)
-            burst_count = np.sum(np.abs(window - window_mean) > BURST_THRESHOLD * window_std, axis=0)
-            feat.extend(burst_count / self.sequence_length)
-            
-            # 7. Coefficient of variation: std/mean
-            cv = np.where(window_mean != 0, window_std / (np.abs(window_mean) + 1e-8), 0)
-            feat.extend(cv)
-            
-            # 8. Recent vs older comparison (detect acceleration)
-            half_point = self.sequence_length // 2
-            recent_mean = np.mean(window[half_point:], axis=0)
-            older_mean = np.mean(window[:half_point], axis=0)
-            feat.extend(recent_mean - older_mean)
-            
-            features.append(feat)
-            targets.append(y[i])
-        
-        return np.array(features), np.array(targets)
+        # Window k covers X[k:k + w] and is labelled y[k + w]; the last window has no label
+        features = window_features(X, CATBOOST_WINDOW_LAYOUT, self.sequence_length, BURST_THRESHOLD)[:-1]
+        return features, np.asarray(y)[self.sequence_length:]
     
     def build_model(self, class_weights=None, feature_count=None):
         """
         Build CatBoost with gradient boosting optimizations
         """
+        # One training log directory per service: workers train concurrently
+        train_dir = Path('catboost_info') / self.service_name
+        train_dir.mkdir(parents=True, exist_ok=True)
         self.model = CatBoostClassifier(
             iterations=500,  # Increased for better convergence
             learning_rate=0.05,  # Lower LR for more precise boosting
@@ -136,6 +99,8 @@ class ServiceCatBoost:
             verbose=False,
             early_stopping_rounds=50,  # Stop if no improvement
             task_type='CPU',
+            thread_count=self.thread_count,
+            train_dir=str(train_dir),
             bootstrap_type='Bayesian',  # Bayesian bootstrap for better generalization
             bagging_temperature=1.0,  # Randomness in bagging
             # Ordered boosting mode reduces overfitting
@@ -357,8 +322,7 @@ def plot_all_services(results, plots_dir):
         if service not in results:
             continue
         
-        model = results[service]['model']
-        importance = model.model.get_feature_importance()
+        importance = results[service]['feature_importance']
         
         # Get top 20 features
         top_idx = np.argsort(importance)[-20:]
@@ -427,7 +391,120 @@ def plot_all_services(results, plots_dir):
     plt.close()
 
 
+def train_service(service, X_service, y_service, threads=-1, model_dir=None):
+    """
+    Split, scale, train, evaluate and save one service's CatBoost model
+    
+    Called by parallel_training.train_services, possibly in a worker process
+    (X_service and y_service memory-mapped). Returns the service's results
+    entry, or None if the service is skipped.
+    """
+    logger.info(f"\n{'='*70}")
+    logger.info(f"SERVICE: {service.upper()}")
+    logger.info(f"{'='*70}")
+    
+    unique_replicas = np.unique(y_service)
+    if len(unique_replicas) == 1:
+        logger.warning(f"[{service}] Only 1 replica value - SKIPPING")
+        return None
+    
+    if len(X_service) < 100:
+        logger.warning(f"[{service}] Only {len(X_service)} samples - SKIPPING")
+        return None
+    
+    logger.info(f"[{service}] Samples: {len(X_service)}")
+    logger.info(f"[{service}] Replica distribution: {dict(zip(*np.unique(y_service, return_counts=True)))}")
+    
+    # IMPROVED: Split by DAYS instead of samples (same as Random Forest)
+    samples_per_day = 1700
+    total_days = len(X_service) // samples_per_day
+    
+    if total_days >= 10:
+        test_days = max(2, int(total_days * 0.2))
+        test_start_idx = len(X_service) - (test_days * samples_per_day)
+        
+        X_train_val = X_service[:test_start_idx]
+        y_train_val = y_service[:test_start_idx]
+        X_test = X_service[test_start_idx:]
+        y_test = y_service[test_start_idx:]
+    else:
+        test_split_idx = int(len(X_service) * 0.8)
+        X_train_val = X_service[:test_split_idx]
+        y_train_val = y_service[:test_split_idx]
+        X_test = X_service[test_split_idx:]
+        y_test = y_service[test_split_idx:]
+    
+    # TimeSeriesSplit for train/val (5 folds for more robust validation)
+    n_splits = 5
+    tscv = TimeSeriesSplit(n_splits=n_splits)
+    
+    for train_idx, val_idx in tscv.split(X_train_val):
+        X_train = X_train_val[train_idx]
+        y_train = y_train_val[train_idx]
+        X_val = X_train_val[val_idx]
+        y_val = y_train_val[val_idx]
+    
+    # Log test set replica distribution
+    test_replica_dist = dict(zip(*np.unique(y_test, return_counts=True)))
+    logger.info(f"[{service}] Train: {len(X_train)}, Val: {len(X_val)}, Test: {len(X_test)}")
+    logger.info(f"[{service}] Test set replica distribution: {test_replica_dist}")
+    
+    # Create model
+    model = ServiceCatBoost(service, n_features=X_service.shape[1], thread_count=threads)
+    
+    # Scale data
+    X_train_scaled = model.scaler.fit_transform(X_train)
+    X_val_scaled = model.scaler.transform(X_val)
+    X_test_scaled = model.scaler.transform(X_test)
+    
+    # Create features from sequences
+    X_train_feat, y_train_feat = model.create_features(X_train_scaled, y_train)
+    X_val_feat, y_val_feat = model.create_features(X_val_scaled, y_val)
+    X_test_feat, y_test_feat = model.create_features(X_test_scaled, y_test)
+    
+    logger.info(f"[{service}] Features shape - Train: {X_train_feat.shape}, Val: {X_val_feat.shape}, Test: {X_test_feat.shape}")
+    
+    # No class weights - natural distribution learning
+    # Bayesian bootstrap + Ordered boosting for better generalization
+    
+    # Train
+    logger.info(f"[{service}] Training...")
+    model.train(X_train_feat, y_train_feat, X_val_feat, y_val_feat, class_weights=None)
+    
+    # Evaluate
+    metrics = model.evaluate(X_test_feat, y_test_feat)
+    predictions = model.predict(X_test_feat)
+    
+    logger.info(f"[{service}] Results:")
+    logger.info(f"  Exact Accuracy: {metrics['exact_accuracy']:.1%}")
+    logger.info(f"  Within-1 Accuracy: {metrics['within_1_accuracy']:.1%}")
+    logger.info(f"  MAE: {metrics['mae']:.3f}")
+    logger.info(f"  RMSE: {metrics['rmse']:.3f}")
+    logger.info(f"  R²: {metrics['r2']:.3f}")
+    
+    # Save model
+    model.save_model(model_dir)
+    logger.info(f"[{service}] Model saved")
+    
+    return {
+        'feature_importance': model.model.get_feature_importance(),
+        'history': model.history,
+        'metrics': metrics,
+        'y_test': y_test_feat,
+        'predictions': predictions
+    }
+
+
 def main():
+    parser = argparse.ArgumentParser(description='Train per-service CatBoost models')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Services trained in parallel (default: config.TRAINING_WORKERS, '
+                             'else one per service up to the CPU count)')
+    parser.add_argument('--shards', default=None,
+                        help='Train from unscaled shards of feature_shards.py --no-scale '
+                             'instead of the metrics folder')
+    args = parser.parse_args()
+    
     logger.info("="*80)
     logger.info("TRAINING CATBOOST MODEL PER SERVICE (OPTIMIZED)")
     logger.info("="*80)
@@ -446,138 +523,50 @@ def main():
     
     # Load data
     logger.info("[1/3] Loading data...")
-    preprocessor = DataPreprocessor()
-    
-    if Path('../metrics/filtered').exists():
-        data_path = '../metrics/filtered'
+    if args.shards:
+        # Same rows and columns, unscaled; train_service splits and scales as below
+        logger.info(f"Using shards from: {args.shards}")
+        feature_columns, data = load_training_shards(args.shards)
     else:
-        data_path = 'metrics/filtered' if Path('metrics/filtered').exists() else '../metrics'
-    
-    logger.info(f"Using data from: {data_path}")
-    
-    data = preprocessor.load_local_folder(data_path)
-    data_clean = preprocessor.clean_data(data)
-    data_features = preprocessor.engineer_features(data_clean)
-    
-    y = data_features['replica_count'].astype(int)
-    service_names = data_features['service_name'].values
-    
-    X, _ = preprocessor.prepare_features_and_target(
-        preprocessor.create_target_labels(data_features)
-    )
-    
-    service_cols = [col for col in X.columns if col.startswith('service_')]
-    X_no_service = X.drop(columns=service_cols)
-    
-    logger.info(f"Total samples: {len(X)}")
-    logger.info(f"Features per service: {X_no_service.shape[1]}")
-    logger.info(f"Services: {config.SERVICES}\n")
-    
-    # Train model for each service
-    logger.info("[2/3] Training per-service CatBoost models...")
-    results = {}
-    all_metrics = {}
-    
-    for service in config.SERVICES:
-        logger.info(f"\n{'='*70}")
-        logger.info(f"SERVICE: {service.upper()}")
-        logger.info(f"{'='*70}")
-        
-        mask = service_names == service
-        X_service = X_no_service.values[mask]
-        y_service = y.values[mask]
+        preprocessor = DataPreprocessor()
         
-        unique_replicas = np.unique(y_service)
-        if len(unique_replicas) == 1:
-            logger.warning(f"[{service}] Only 1 replica value - SKIPPING")
-            continue
-        
-        if len(X_service) < 100:
-            logger.warning(f"[{service}] Only {len(X_service)} samples - SKIPPING")
-            continue
-        
-        logger.info(f"[{service}] Samples: {len(X_service)}")
-        logger.info(f"[{service}] Replica distribution: {dict(zip(*np.unique(y_service, return_counts=True)))}")
-        
-        # IMPROVED: Split by DAYS instead of samples (same as Random Forest)
-        samples_per_day = 1700
-        total_days = len(X_service) // samples_per_day
-        
-        if total_days >= 10:
-            test_days = max(2, int(total_days * 0.2))
-            test_start_idx = len(X_service) - (test_days * samples_per_day)
-            
-            X_train_val = X_service[:test_start_idx]
-            y_train_val = y_service[:test_start_idx]
-            X_test = X_service[test_start_idx:]
-            y_test = y_service[test_start_idx:]
+        if Path('../metrics/filtered').exists():
+            data_path = '../metrics/filtered'
         else:
-            test_split_idx = int(len(X_service) * 0.8)
-            X_train_val = X_service[:test_split_idx]
-            y_train_val = y_service[:test_split_idx]
-            X_test = X_service[test_split_idx:]
-            y_test = y_service[test_split_idx:]
-        
-        # TimeSeriesSplit for train/val (5 folds for more robust validation)
-        n_splits = 5
-        tscv = TimeSeriesSplit(n_splits=n_splits)
-        
-        for train_idx, val_idx in tscv.split(X_train_val):
-            X_train = X_train_val[train_idx]
-            y_train = y_train_val[train_idx]
-            X_val = X_train_val[val_idx]
-            y_val = y_train_val[val_idx]
+            data_path = 'metrics/filtered' if Path('metrics/filtered').exists() else '../metrics'
         
-        # Log test set replica distribution
-        test_replica_dist = dict(zip(*np.unique(y_test, return_counts=True)))
-        logger.info(f"[{service}] Train: {len(X_train)}, Val: {len(X_val)}, Test: {len(X_test)}")
-        logger.info(f"[{service}] Test set replica distribution: {test_replica_dist}")
+        logger.info(f"Using data from: {data_path}")
         
-        # Create model
-        model = ServiceCatBoost(service, n_features=X_no_service.shape[1])
+        # Cleaned and engineered per day in compact dtypes; unchanged days come from <data_path>/feature_cache
+        data_features = preprocessor.load_engineered_folder(data_path, lean=True)
         
-        # Scale data
-        X_train_scaled = model.scaler.fit_transform(X_train)
-        X_val_scaled = model.scaler.transform(X_val)
-        X_test_scaled = model.scaler.transform(X_test)
+        y = data_features['replica_count'].astype(int)
+        service_names = data_features['service_name'].values
         
-        # Create features from sequences
-        X_train_feat, y_train_feat = model.create_features(X_train_scaled, y_train)
-        X_val_feat, y_val_feat = model.create_features(X_val_scaled, y_val)
-        X_test_feat, y_test_feat = model.create_features(X_test_scaled, y_test)
-        
-        logger.info(f"[{service}] Features shape - Train: {X_train_feat.shape}, Val: {X_val_feat.shape}, Test: {X_test_feat.shape}")
-        
-        # No class weights - natural distribution learning
-        # Bayesian bootstrap + Ordered boosting for better generalization
-        
-        # Train
-        logger.info(f"[{service}] Training...")
-        model.train(X_train_feat, y_train_feat, X_val_feat, y_val_feat, class_weights=None)
-        
-        # Evaluate
-        metrics = model.evaluate(X_test_feat, y_test_feat)
-        predictions = model.predict(X_test_feat)
-        
-        logger.info(f"[{service}] Results:")
-        logger.info(f"  Exact Accuracy: {metrics['exact_accuracy']:.1%}")
-        logger.info(f"  Within-1 Accuracy: {metrics['within_1_accuracy']:.1%}")
-        logger.info(f"  MAE: {metrics['mae']:.3f}")
-        logger.info(f"  RMSE: {metrics['rmse']:.3f}")
-        logger.info(f"  R²: {metrics['r2']:.3f}")
+        X, _ = preprocessor.prepare_features_and_target(
+            preprocessor.create_target_labels(data_features)
+        )
         
-        # Save model
-        model.save_model(model_dir)
-        logger.info(f"[{service}] Model saved")
+        service_cols = [col for col in X.columns if col.startswith('service_')]
+        X_no_service = X.drop(columns=service_cols)
+        feature_columns = list(X_no_service.columns)
         
-        results[service] = {
-            'model': model,
-            'history': model.history,
-            'metrics': metrics,
-            'y_test': y_test_feat,
-            'predictions': predictions
-        }
-        all_metrics[service] = metrics
+        data = {}
+        for service in config.SERVICES:
+            mask = service_names == service
+            data[service] = (X_no_service.values[mask], y.values[mask])
+    
+    # Per-service models see the same ordered columns; inference compiles this manifest
+    save_feature_manifest(build_feature_manifest(feature_columns), model_dir / FEATURE_MANIFEST_FILE)
+    
+    logger.info(f"Total samples: {sum(len(y_service) for _, y_service in data.values())}")
+    logger.info(f"Features per service: {len(feature_columns)}")
+    logger.info(f"Services: {config.SERVICES}\n")
+    
+    # Train model for each service
+    logger.info("[2/3] Training per-service CatBoost models...")
+    results = train_services(train_service, data, workers=args.workers, model_dir=model_dir)
+    all_metrics = {service: result['metrics'] for service, result in results.items()}
     
     # Save metrics and plots
     logger.info("\n[3/3] Generating plots and saving metrics...")
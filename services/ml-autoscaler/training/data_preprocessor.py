@@ -11,21 +11,46 @@ Optimized with best practices from research papers:
 
 import pandas as pd
 import numpy as np
-from datetime import datetime
+from datetime import date, datetime
 import boto3
-from typing import List, Tuple, Optional
+from typing import Dict, Iterator, List, Tuple, Optional
+import hashlib
+import json
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import StandardScaler, RobustScaler
 import joblib
 import config
+import metrics_store
+from quantile_sketch import QuantileSketch
+from engineered_features import (
+    ENGINEERED_FEATURES, HISTORY_ROWS, normalize_resources, service_features, time_encoding
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Winsorization quantiles of clean_data
+WINSORIZE_QUANTILES = {'cpu_usage_percent': 0.99, 'ram_usage_percent': 0.99, 'response_time_ms': 0.95}
+
+# Bump when clean_data or engineer_features change their output: cached
+# engineered days (load_engineered_folder) are keyed on it
+FEATURE_CODE_VERSION = 1
+FEATURE_CACHE_SUBDIR = 'feature_cache'
+# Cleaned rows per service carried into the next day (lag 10, 10-sample rolling windows)
+FEATURE_HISTORY_ROWS = HISTORY_ROWS
+
 
 class DataPreprocessor:
+    # Raw columns read by clean_data, engineer_features and prepare_features_and_target
+    TRAINING_COLUMNS = ['timestamp', 'service_name'] + config.FEATURE_COLUMNS + ['replica_count', 'error_rate']
+    # Engineered features used for training (after config.FEATURE_COLUMNS); serving
+    # derives the same columns (see engineered_features.py)
+    ENGINEERED_FEATURES = ENGINEERED_FEATURES
+    
     def __init__(self, use_robust_scaler=True):
         """
         Args:
@@ -38,39 +63,147 @@ class DataPreprocessor:
         self.use_robust_scaler = use_robust_scaler
         
     def download_data_from_s3(self, start_date: Optional[str] = None, 
-                               end_date: Optional[str] = None) -> pd.DataFrame:
-        """Download metrics data from S3"""
-        logger.info(f"Downloading data from S3 bucket: {config.S3_BUCKET}")
-        
-        response = self.s3_client.list_objects_v2(
-            Bucket=config.S3_BUCKET,
-            Prefix=config.S3_PREFIX
-        )
+                               end_date: Optional[str] = None,
+                               cache_dir: Optional[str] = None,
+                               max_workers: Optional[int] = None) -> pd.DataFrame:
+        """
+        Download metrics data from S3
         
-        if 'Contents' not in response:
-            raise ValueError(f"No data found in S3 bucket {config.S3_BUCKET}")
+        Keys follow the collector layout metrics/YYYY/MM/metrics_YYYYMMDD.csv
+        (S3Uploader.generate_s3_key): with a start_date only the month
+        prefixes of the range are listed, and only days in range are fetched.
+        Objects are listed page by page and fetched in a thread pool. Every
+        object is kept in cache_dir under its key and ETag, so a day already
+        downloaded is read locally until its object changes.
         
-        csv_files = [obj['Key'] for obj in response['Contents'] if obj['Key'].endswith('.csv')]
-        logger.info(f"Found {len(csv_files)} CSV files in S3")
+        Args:
+            start_date, end_date: Inclusive day range 'YYYY-MM-DD'
+                                  (default: all days; end defaults to today)
+            cache_dir: Local object cache (default: config.S3_CACHE_DIR)
+            max_workers: Parallel downloads (default: config.S3_DOWNLOAD_WORKERS)
+        """
+        logger.info(f"Downloading data from S3 bucket: {config.S3_BUCKET}")
+        cache_dir = Path(cache_dir) if cache_dir is not None else Path(config.S3_CACHE_DIR)
+        max_workers = max_workers or config.S3_DOWNLOAD_WORKERS
+        
+        start, end = metrics_store.parse_date(start_date), metrics_store.parse_date(end_date)
+        if start is not None and start > (end or datetime.now().date()):
+            raise ValueError(f"start_date {start_date} is after end_date {end_date or 'today'}")
+        if start is not None:
+            prefixes = self._s3_month_prefixes(start, end or datetime.now().date())
+        else:
+            prefixes = [config.S3_PREFIX]
+        logger.info(f"Listing {len(prefixes)} prefixes: {prefixes[0]} .. {prefixes[-1]}")
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            listings = list(executor.map(self._list_s3_objects, prefixes))
+        csv_objects = [
+            obj for objects in listings for obj in objects
+            if obj['Key'].endswith('.csv') and metrics_store.in_date_range(obj['Key'], start, end)
+        ]
+        if not csv_objects:
+            raise ValueError(f"No data found in S3 bucket {config.S3_BUCKET} for {start_date} - {end_date}")
+        logger.info(f"Found {len(csv_objects)} CSV files in S3")
         
-        dfs = []
-        for file_key in csv_files:
+        def load(obj: Dict) -> Optional[pd.DataFrame]:
             try:
-                obj = self.s3_client.get_object(Bucket=config.S3_BUCKET, Key=file_key)
-                df = pd.read_csv(obj['Body'])
-                dfs.append(df)
-                logger.info(f"Downloaded: {file_key} ({len(df)} rows)")
+                path, cached = self._fetch_s3_object(obj, cache_dir)
+                df = pd.read_csv(path)
+                logger.info(f"{'Cached' if cached else 'Downloaded'}: {obj['Key']} ({len(df)} rows)")
+                return df
             except Exception as e:
-                logger.error(f"Error downloading {file_key}: {e}")
+                logger.error(f"Error downloading {obj['Key']}: {e}")
+                return None
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            dfs = [df for df in executor.map(load, csv_objects) if df is not None]
         
         if not dfs:
             raise ValueError("No data could be loaded from S3")
         
-        data = pd.concat(dfs, ignore_index=True)
+        data = self._concat(dfs)
         logger.info(f"Total data loaded: {len(data)} rows")
         
         return data
     
+    @staticmethod
+    def lean_dtypes(data: pd.DataFrame) -> pd.DataFrame:
+        """
+        Compact dtypes for training: float32 metrics, int32 counts/flags,
+        categorical service_name and parsed timestamps (so engineer_features
+        does not parse them again). Features engineered from float32 metrics
+        stay float32.
+        """
+        dtypes = {}
+        for col, dtype in data.dtypes.items():
+            if dtype == np.float64:
+                dtypes[col] = np.float32
+            elif dtype == np.int64:
+                dtypes[col] = np.int32
+        if 'service_name' in data and not isinstance(data['service_name'].dtype, pd.CategoricalDtype):
+            dtypes['service_name'] = 'category'
+        df = data.astype(dtypes, copy=False)
+        if 'timestamp' in df and not pd.api.types.is_datetime64_any_dtype(df['timestamp']):
+            df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
+        return df
+    
+    @staticmethod
+    def _concat(frames: List[pd.DataFrame]) -> pd.DataFrame:
+        """pd.concat that keeps a categorical service_name categorical (categories are merged)"""
+        categoricals = [df['service_name'].dtype for df in frames
+                        if 'service_name' in df and isinstance(df['service_name'].dtype, pd.CategoricalDtype)]
+        if categoricals and len(categoricals) == len(frames):
+            categories = sorted(set().union(*(dtype.categories for dtype in categoricals)))
+            recoded = []
+            for df in frames:
+                df = df.copy(deep=False)
+                df['service_name'] = df['service_name'].cat.set_categories(categories)
+                recoded.append(df)
+            frames = recoded
+        return pd.concat(frames, ignore_index=True)
+    
+    @staticmethod
+    def _s3_month_prefixes(start, end) -> List[str]:
+        """metrics/YYYY/MM/ prefixes of every month from start to end"""
+        prefixes = []
+        year, month = start.year, start.month
+        while (year, month) <= (end.year, end.month):
+            prefixes.append(f"{config.S3_PREFIX}{year:04d}/{month:02d}/")
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return prefixes
+    
+    def _list_s3_objects(self, prefix: str) -> List[Dict]:
+        """Every object under prefix (list_objects_v2 returns at most 1000 keys per page)"""
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        objects = []
+        for page in paginator.paginate(Bucket=config.S3_BUCKET, Prefix=prefix):
+            objects.extend(page.get('Contents', []))
+        return objects
+    
+    def _fetch_s3_object(self, obj: Dict, cache_dir: Path) -> Tuple[Path, bool]:
+        """
+        Local copy of an S3 object, downloaded only if its ETag is not cached
+        
+        Returns:
+            (path, True if it was already cached)
+        """
+        key = Path(obj['Key'])
+        etag = obj['ETag'].strip('"')
+        path = cache_dir / key.parent / f"{key.stem}.{etag}{key.suffix}"
+        if path.exists():
+            return path, True
+        
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(path.name + '.part')
+        self.s3_client.download_file(config.S3_BUCKET, obj['Key'], str(partial))
+        os.replace(partial, path)
+        
+        # Older versions of the same key are stale now
+        for stale in path.parent.glob(f"{key.stem}.*{key.suffix}"):
+            if stale != path:
+                stale.unlink(missing_ok=True)
+        return path, False
+    
     def load_local_data(self, file_path: str) -> pd.DataFrame:
         """Load data from local CSV file"""
         logger.info(f"Loading data from local file: {file_path}")
@@ -78,21 +211,64 @@ class DataPreprocessor:
         logger.info(f"Loaded {len(data)} rows")
         return data
     
-    def load_local_folder(self, folder_path: str = 'metrics') -> pd.DataFrame:
-        """Load and concatenate all CSV files from a local folder"""
+    def load_local_folder(self, folder_path: str = 'metrics', columns: Optional[List[str]] = None,
+                          start_date: Optional[str] = None, end_date: Optional[str] = None,
+                          lean: bool = False) -> pd.DataFrame:
+        """
+        Load and concatenate the metrics of a local folder
+        
+        Reads the folder's Parquet store (see metrics_store.py) when it has one,
+        plus the CSV files not converted into it yet or changed since their
+        conversion (see _day_files); otherwise every CSV file.
+        
+        Args:
+            columns: Columns to read (default: all), e.g. TRAINING_COLUMNS
+            start_date, end_date: Inclusive day range 'YYYY-MM-DD' (default: all days)
+            lean: Compact dtypes (see lean_dtypes), applied file by file
+        """
         folder = Path(folder_path)
         if not folder.exists():
             raise ValueError(f"Folder {folder_path} does not exist")
         
+        start, end = metrics_store.parse_date(start_date), metrics_store.parse_date(end_date)
         csv_files = sorted(folder.glob('*.csv'))
+        if metrics_store.has_store(folder):
+            store_dir = metrics_store.store_path(folder)
+            day_files = [
+                day_file for day_file in self._day_files(folder)
+                if (metrics_store.in_date_range(day_file[0], start, end) if day_file[2] is None
+                    else (start is None or day_file[2] >= start) and (end is None or day_file[2] <= end))
+            ]
+            missing = [csv_file for csv_file, _, store_day in day_files if store_day is None]
+            
+            logger.info(f"Loading data from store: {store_dir}")
+            if missing:
+                # Days collected or rewritten after the last conversion are read from their CSV files
+                logger.warning(f"{len(missing)} CSV files are not in {store_dir} or changed since their "
+                              f"conversion, reading them directly (run metrics_store.py {folder_path} "
+                              f"to convert them): {[f.name for f in missing]}")
+            parts = []
+            for day_file in day_files:
+                part = self._read_day(day_file, columns)
+                if len(part):
+                    parts.append(self.lean_dtypes(part) if lean else part)
+            if not parts:
+                raise ValueError(f"No data in {folder_path} for the requested days")
+            
+            data = self._concat(parts)
+            logger.info(f"Total data loaded: {len(data)} rows")
+            return data
+        
+        csv_files = [f for f in csv_files if metrics_store.in_date_range(f, start, end)]
+        
         logger.info(f"Loading data from folder: {folder_path}")
         logger.info(f"Found {len(csv_files)} CSV files")
         
         dfs = []
         for csv_file in csv_files:
             try:
-                df = pd.read_csv(csv_file)
-                dfs.append(df)
+                df = pd.read_csv(csv_file, usecols=columns)
+                dfs.append(self.lean_dtypes(df) if lean else df)
                 logger.info(f"Loaded: {csv_file.name} ({len(df)} rows)")
             except Exception as e:
                 logger.error(f"Error loading {csv_file}: {e}")
@@ -105,30 +281,87 @@ class DataPreprocessor:
         
         return data
     
-    def clean_data(self, data: pd.DataFrame) -> pd.DataFrame:
+    def winsorization_thresholds(self, data: pd.DataFrame) -> Dict[str, float]:
+        """Upper clipping value of every winsorized column (WINSORIZE_QUANTILES)"""
+        return {col: float(data[col].quantile(q)) for col, q in WINSORIZE_QUANTILES.items()}
+    
+    def winsorization_sketch(self, data: pd.DataFrame) -> QuantileSketch:
+        """Mergeable quantile sketch of the winsorized columns (see sketch_thresholds)"""
+        return QuantileSketch(len(WINSORIZE_QUANTILES)).update(data[list(WINSORIZE_QUANTILES)].to_numpy())
+    
+    @staticmethod
+    def sketch_thresholds(sketch: QuantileSketch) -> Dict[str, float]:
+        """
+        Winsorization thresholds from a (merged) winsorization_sketch, within
+        config.QUANTILE_SKETCH_ACCURACY of the exact ones
+        """
+        return {col: float(sketch.quantile(q)[i]) for i, (col, q) in enumerate(WINSORIZE_QUANTILES.items())}
+    
+    def folder_thresholds(self, day_files: List[Tuple[Path, Dict, Optional[date]]],
+                          max_workers: Optional[int] = None, cache_dir: Optional[Path] = None) -> Dict[str, float]:
+        """
+        Winsorization thresholds over day files (see _day_files), one sketch per
+        file (built in a thread pool) merged; only the winsorized columns of one
+        file per worker are in memory, and the result does not depend on the
+        file order. With cache_dir, each file's sketch is cached under
+        <cache_dir>/sketches keyed by its signature, so unchanged files are not
+        read again.
+        """
+        sketch_dir = cache_dir / 'sketches' if cache_dir is not None else None
+        if sketch_dir is not None:
+            sketch_dir.mkdir(parents=True, exist_ok=True)
+        
+        def sketch(day_file: Tuple[Path, Dict, Optional[date]]) -> QuantileSketch:
+            csv_file, signature, _ = day_file
+            if sketch_dir is None:
+                return self.winsorization_sketch(self._read_day(day_file, list(WINSORIZE_QUANTILES)))
+            key = hashlib.sha256(json.dumps(
+                [FEATURE_CODE_VERSION, config.QUANTILE_SKETCH_ACCURACY, signature]).encode()).hexdigest()[:16]
+            sketch_path = sketch_dir / f'{csv_file.stem}.{key}.pkl'
+            if sketch_path.exists():
+                return pd.read_pickle(sketch_path)
+            day_sketch = self.winsorization_sketch(self._read_day(day_file, list(WINSORIZE_QUANTILES)))
+            pd.to_pickle(day_sketch, sketch_path)
+            for stale in sketch_dir.glob(f'{csv_file.stem}.*.pkl'):
+                if stale != sketch_path:
+                    stale.unlink()
+            return day_sketch
+        
+        merged = QuantileSketch(len(WINSORIZE_QUANTILES))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for day_sketch in executor.map(sketch, day_files):
+                merged.merge(day_sketch)
+        return self.sketch_thresholds(merged)
+    
+    def clean_data(self, data: pd.DataFrame, thresholds: Optional[Dict[str, float]] = None,
+                   verbose: bool = True) -> pd.DataFrame:
         """
         Clean data using robust outlier handling (Winsorization)
         Based on RF autoscaler paper - preserve zeros, handle outliers carefully
+        
+        Args:
+            thresholds: Winsorization thresholds (default: computed from data,
+                        see winsorization_thresholds)
+            verbose: Log cleaning statistics at INFO (DEBUG otherwise)
         """
-        df = data.copy()
+        log = logger.info if verbose else logger.debug
+        # Winsorized columns are replaced, not written in place, so a shallow copy suffices
+        df = data.copy(deep=False)
         initial_count = len(df)
         
-        logger.info(f"Starting data cleaning. Initial rows: {initial_count}")
+        log(f"Starting data cleaning. Initial rows: {initial_count}")
+        if thresholds is None:
+            thresholds = self.winsorization_thresholds(df)
         
         # Winsorize CPU/RAM at 99th percentile (instead of hard capping at 100)
-        for col in ['cpu_usage_percent', 'ram_usage_percent']:
-            p99 = df[col].quantile(0.99)
-            outliers = (df[col] > p99).sum()
+        # and response time at 95th percentile
+        for col, q in WINSORIZE_QUANTILES.items():
+            threshold = thresholds[col]
+            outliers = (df[col] > threshold).sum()
             if outliers > 0:
-                logger.info(f"Winsorizing {col}: {outliers} values > p99 ({p99:.1f})")
-                df.loc[df[col] > p99, col] = p99
-        
-        # Winsorize response time at 95th percentile
-        rt_p95 = df['response_time_ms'].quantile(0.95)
-        rt_outliers = (df['response_time_ms'] > rt_p95).sum()
-        if rt_outliers > 0:
-            logger.info(f"Winsorizing response_time_ms: {rt_outliers} values > p95 ({rt_p95:.0f}ms)")
-            df.loc[df['response_time_ms'] > rt_p95, 'response_time_ms'] = rt_p95
+                log(f"Winsorizing {col}: {outliers} values > p{q * 100:.0f} ({threshold:.1f})")
+                # float32 (lean_dtypes) columns stay float32
+                df[col] = df[col].clip(upper=threshold).astype(np.result_type(df[col].dtype, np.float32))
         
         # Remove data inconsistencies (replica=0 with active metrics)
         invalid_mask = (
@@ -140,10 +373,9 @@ class DataPreprocessor:
             )
         )
         removed_invalid = invalid_mask.sum()
-        df = df[~invalid_mask].reset_index(drop=True)
-        logger.info(f"Removed {removed_invalid} rows with replica_count=0 but active metrics")
+        log(f"Removed {removed_invalid} rows with replica_count=0 but active metrics")
         
-        # Remove all-zero metrics (collector errors)
+        # Remove all-zero metrics (collector errors); disjoint from the rows above (replica_count > 0)
         zero_metrics_mask = (
             (df['cpu_usage_percent'] == 0) &
             (df['ram_usage_percent'] == 0) &
@@ -153,16 +385,21 @@ class DataPreprocessor:
         )
         removed_zeros = zero_metrics_mask.sum()
         if removed_zeros > 0:
-            df = df[~zero_metrics_mask].reset_index(drop=True)
-            logger.info(f"Removed {removed_zeros} rows with all-zero metrics (collector errors)")
+            log(f"Removed {removed_zeros} rows with all-zero metrics (collector errors)")
+        
+        # One row selection for both filters
+        keep = ~(invalid_mask | zero_metrics_mask)
+        if not keep.all():
+            df = df.take(np.flatnonzero(keep))
+        df.reset_index(drop=True, inplace=True)
         
         final_count = len(df)
-        logger.info("Data cleaning completed:")
-        logger.info(f"  Initial rows: {initial_count}")
-        logger.info(f"  Final rows: {final_count}")
-        logger.info(f"  Removed: {initial_count - final_count} ({(initial_count - final_count)/initial_count*100:.2f}%)")
-        logger.info(f"  Data quality: {(final_count/initial_count)*100:.2f}%")
-        logger.info(f"  Unique replica counts: {sorted(df['replica_count'].unique())}")
+        log("Data cleaning completed:")
+        log(f"  Initial rows: {initial_count}")
+        log(f"  Final rows: {final_count}")
+        log(f"  Removed: {initial_count - final_count} ({(initial_count - final_count)/initial_count*100:.2f}%)")
+        log(f"  Data quality: {(final_count/initial_count)*100:.2f}%")
+        log(f"  Unique replica counts: {sorted(df['replica_count'].unique())}")
         
         return df
     
@@ -175,123 +412,215 @@ class DataPreprocessor:
         4. Rolling statistics (mean, std, p95)
         5. Trend indicators (acceleration, deceleration)
         """
-        df = data.copy()
+        # Parse timestamp (unless lean_dtypes already did)
+        timestamps = data['timestamp']
+        if not pd.api.types.is_datetime64_any_dtype(timestamps):
+            timestamps = pd.to_datetime(timestamps, format='ISO8601')
+        
+        # Sort by service and time: only the sort keys are sorted, the frame is copied once
+        keys = pd.DataFrame({'service_name': data['service_name'].array, 'timestamp': timestamps.array})
+        order = keys.sort_values(['service_name', 'timestamp']).index.to_numpy()
+        df = data.take(order)
+        df.index = pd.RangeIndex(len(df))
+        df['timestamp'] = keys['timestamp'].array[order]
         
-        # Parse timestamp
-        df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
-        df = df.sort_values(['service_name', 'timestamp']).reset_index(drop=True)
+        # Engineered features are float32 for float32 (lean_dtypes) metrics
+        float_dtype = np.result_type(df['cpu_usage_percent'].dtype, np.float32)
         
         # Cyclical time encoding (sin/cos for smooth periodicity)
         df['hour'] = df['timestamp'].dt.hour
         df['day_of_week'] = df['timestamp'].dt.dayofweek
-        df['hour_sin'] = np.sin(2 * np.pi * df['hour'] / 24)
-        df['hour_cos'] = np.cos(2 * np.pi * df['hour'] / 24)
-        df['dow_sin'] = np.sin(2 * np.pi * df['day_of_week'] / 7)
-        df['dow_cos'] = np.cos(2 * np.pi * df['day_of_week'] / 7)
+        for col, values in time_encoding(df['hour'], df['day_of_week'], float_dtype).items():
+            df[col] = values
         
         # Normalize resource limits (millicores/bytes to cores/GB)
-        df['cpu_request'] = np.clip(df['cpu_request'] / 1000, 0, 100)
-        df['cpu_limit'] = np.clip(df['cpu_limit'] / 1000, 0, 100)
-        df['ram_request'] = np.clip(df['ram_request'] / (1024**3), 0, 100)
-        df['ram_limit'] = np.clip(df['ram_limit'] / (1024**3), 0, 100)
-        
-        # Per-service feature engineering
-        for service in config.SERVICES:
-            service_mask = df['service_name'] == service
-            service_df = df[service_mask].copy()
-            
-            if len(service_df) < 2:
-                continue
-            
-            # Resource utilization ratios
-            df.loc[service_mask, 'cpu_utilization_ratio'] = (
-                service_df['cpu_usage_percent'] / (service_df['cpu_limit'] + 1e-6)
-            )
-            df.loc[service_mask, 'ram_utilization_ratio'] = (
-                service_df['ram_usage_percent'] / (service_df['ram_limit'] + 1e-6)
-            )
-            
-            # Lag features (t-1, t-5, t-10 for capturing recent history)
-            for lag in [1, 5, 10]:
-                df.loc[service_mask, f'cpu_lag_{lag}'] = service_df['cpu_usage_percent'].shift(lag)
-                df.loc[service_mask, f'ram_lag_{lag}'] = service_df['ram_usage_percent'].shift(lag)
-                df.loc[service_mask, f'rps_lag_{lag}'] = service_df['request_count_per_second'].shift(lag)
-            
-            # Rate of change (first derivative)
-            df.loc[service_mask, 'cpu_change_rate'] = service_df['cpu_usage_percent'].diff()
-            df.loc[service_mask, 'ram_change_rate'] = service_df['ram_usage_percent'].diff()
-            df.loc[service_mask, 'request_change_rate'] = service_df['request_count_per_second'].diff()
-            
-            # Acceleration (second derivative - trend change detection)
-            df.loc[service_mask, 'cpu_acceleration'] = service_df['cpu_usage_percent'].diff().diff()
-            df.loc[service_mask, 'rps_acceleration'] = service_df['request_count_per_second'].diff().diff()
-            
-            # Rolling statistics (10 samples = 5 minutes window)
-            window_size = 10
-            
-            # Rolling mean for smoothing
-            df.loc[service_mask, 'cpu_rolling_mean'] = (
-                service_df['cpu_usage_percent'].rolling(window=window_size, min_periods=1).mean()
-            )
-            df.loc[service_mask, 'ram_rolling_mean'] = (
-                service_df['ram_usage_percent'].rolling(window=window_size, min_periods=1).mean()
-            )
-            df.loc[service_mask, 'rps_rolling_mean'] = (
-                service_df['request_count_per_second'].rolling(window=window_size, min_periods=1).mean()
-            )
-            
-            # Rolling std for volatility detection
-            df.loc[service_mask, 'cpu_rolling_std'] = (
-                service_df['cpu_usage_percent'].rolling(window=window_size, min_periods=1).std()
-            )
-            df.loc[service_mask, 'ram_rolling_std'] = (
-                service_df['ram_usage_percent'].rolling(window=window_size, min_periods=1).std()
-            )
-            df.loc[service_mask, 'rps_rolling_std'] = (
-                service_df['request_count_per_second'].rolling(window=window_size, min_periods=1).std()
-            )
-            
-            # Rolling max/p95 for peak detection
-            df.loc[service_mask, 'request_rolling_max'] = (
-                service_df['request_count_per_second'].rolling(window=window_size, min_periods=1).max()
-            )
-            df.loc[service_mask, 'response_time_rolling_p95'] = (
-                service_df['response_time_ms'].rolling(window=window_size, min_periods=1).quantile(0.95)
-            )
-            
-            # Spike/burst detection (values exceeding 1.5*std)
-            cpu_mean = service_df['cpu_usage_percent'].rolling(window=window_size, min_periods=1).mean()
-            cpu_std = service_df['cpu_usage_percent'].rolling(window=window_size, min_periods=1).std()
-            df.loc[service_mask, 'cpu_spike_flag'] = (
-                (service_df['cpu_usage_percent'] - cpu_mean) > 1.5 * cpu_std
-            ).astype(int)
-            
-            rps_mean = service_df['request_count_per_second'].rolling(window=window_size, min_periods=1).mean()
-            rps_std = service_df['request_count_per_second'].rolling(window=window_size, min_periods=1).std()
-            df.loc[service_mask, 'rps_spike_flag'] = (
-                (service_df['request_count_per_second'] - rps_mean) > 1.5 * rps_std
-            ).astype(int)
-            
-            # System pressure indicator (combined thresholds)
-            df.loc[service_mask, 'system_pressure'] = (
-                (service_df['cpu_usage_percent'] > 70).astype(int) +
-                (service_df['ram_usage_percent'] > 75).astype(int) +
-                (service_df['response_time_ms'] > 500).astype(int) +
-                (service_df['error_rate'] > 0.05).astype(int)
-            )
-        
-        # Fill NaN (from lag/diff operations) with 0
-        df = df.fillna(0)
+        normalize_resources(df, float_dtype)
+        
+        # Per-service feature engineering in one pass over the service-sorted rows.
+        # Services outside config.SERVICES (or with < 2 samples) get NaN -> 0 below.
+        service_counts = df.groupby('service_name', sort=False, observed=True)['service_name'].transform('size')
+        service_mask = df['service_name'].isin(config.SERVICES) & (service_counts >= 2)
+        if service_mask.all():
+            engineered = service_features(df, float_dtype)
+        elif service_mask.any():
+            engineered = service_features(df[service_mask], float_dtype).reindex(df.index)
+        else:
+            engineered = None
+        if engineered is not None:
+            # Appended column by column (existing ones move to the end) instead of a concatenated copy
+            df.drop(columns=engineered.columns.intersection(df.columns), inplace=True)
+            for col in engineered.columns:
+                df[col] = engineered[col]
+        
+        # Fill NaN (from lag/diff operations) with 0, replacing only the columns that have any
+        nan_columns = [col for col in df.columns[df.isna().any()]
+                       if not isinstance(df[col].dtype, pd.CategoricalDtype)]
+        if nan_columns:
+            df[nan_columns] = df[nan_columns].fillna(0)
         
         logger.info(f"Feature engineering completed. New shape: {df.shape}")
         return df
     
+    def load_engineered_folder(self, folder_path: str, columns: Optional[List[str]] = None,
+                               cache_dir: Optional[str] = None, lean: bool = False) -> pd.DataFrame:
+        """
+        engineer_features(clean_data(load_local_folder(folder))) with a per-day cache
+        
+        Concatenates the days of iter_engineered_days. Rolling means/stds match
+        the full pass up to floating-point rounding.
+        
+        Args:
+            columns: Raw columns to read (default: TRAINING_COLUMNS)
+            cache_dir: Cache directory (default: <folder>/feature_cache)
+            lean: Compact dtypes (see lean_dtypes); cached separately
+        """
+        chunks = [features for _, features in self.iter_engineered_days(folder_path, columns, cache_dir, lean)]
+        if not chunks:
+            raise ValueError(f"No data could be loaded from {folder_path}")
+        
+        # Same row order as engineer_features over the concatenated days
+        return self._concat(chunks).sort_values(['service_name', 'timestamp'], kind='stable', ignore_index=True)
+    
+    def iter_engineered_days(self, folder_path: str, columns: Optional[List[str]] = None,
+                             cache_dir: Optional[str] = None,
+                             lean: bool = False) -> Iterator[Tuple[Path, pd.DataFrame]]:
+        """
+        Cleaned and engineered rows of a folder, one day file at a time
+        
+        Every day file is cleaned and engineered on its own, preceded by the last
+        FEATURE_HISTORY_ROWS cleaned rows of each service from earlier days so
+        lags and rolling windows are the same as over the full history. Only one
+        day (plus that history) is in memory at a time. Days converted into the
+        folder's Parquet store (metrics_store.py) are read from it, the others
+        from CSV. Results are cached in <folder>/feature_cache/ keyed by the
+        file's signature (name, size and mtime, as in the store marker), that
+        carried-in history, the winsorization thresholds, the columns and
+        FEATURE_CODE_VERSION, so only new or changed days (and the days after
+        them whose history changed) are recomputed and cached days are not read.
+        
+        Winsorization thresholds are the quantiles of clean_data over the
+        whole folder, estimated from merged per-file sketches (folder_thresholds,
+        cached per day next to the features) so no column is loaded in full.
+        Cached days are reused while the thresholds are unchanged; with a
+        FEATURE_CACHE_THRESHOLD_TOLERANCE (config.py, default 0) above 0, the
+        cached thresholds are kept while the new ones stay within it, so one
+        new day does not invalidate every cached day.
+        
+        Args:
+            columns: Raw columns to read (default: TRAINING_COLUMNS)
+            cache_dir: Cache directory (default: <folder>/feature_cache)
+            lean: Compact dtypes (see lean_dtypes); cached separately
+        
+        Yields:
+            (day file, engineered rows of that day sorted by service and time)
+        """
+        folder = Path(folder_path)
+        columns = list(columns or self.TRAINING_COLUMNS)
+        cache_dir = Path(cache_dir) if cache_dir is not None else folder / FEATURE_CACHE_SUBDIR
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        
+        day_files = self._day_files(folder)
+        if not day_files:
+            raise ValueError(f"No data could be loaded from {folder_path}")
+        thresholds = self._cached_thresholds(self.folder_thresholds(day_files, cache_dir=cache_dir),
+                                             cache_dir / 'thresholds.json')
+        
+        history, computed = None, 0
+        for day_file in day_files:
+            csv_file, signature, _ = day_file
+            history_hash = '' if history is None else hashlib.sha256(
+                pd.util.hash_pandas_object(history, index=False).values.tobytes()).hexdigest()
+            key = hashlib.sha256(json.dumps(
+                [FEATURE_CODE_VERSION, thresholds, columns, lean, signature, history_hash]).encode()).hexdigest()[:16]
+            cache_path = cache_dir / f'{csv_file.stem}.{key}.pkl'
+            
+            if cache_path.exists():
+                features, history = pd.read_pickle(cache_path)
+            else:
+                day = self._read_day(day_file, columns)
+                day = self.clean_data(self.lean_dtypes(day) if lean else day, thresholds=thresholds, verbose=False)
+                features, history = self._engineer_day(day, history)
+                pd.to_pickle((features, history), cache_path)
+                for stale in cache_dir.glob(f'{csv_file.stem}.*.pkl'):
+                    if stale != cache_path:
+                        stale.unlink()
+                computed += 1
+            yield csv_file, features
+        
+        logger.info(f"Engineered features: {computed} of {len(day_files)} days computed, "
+                    f"{len(day_files) - computed} from {cache_dir}")
+    
+    @staticmethod
+    def _day_files(folder: Path) -> List[Tuple[Path, Dict, Optional[date]]]:
+        """
+        Day files of a folder in name order: (CSV path, signature, store day)
+        
+        Files in the folder's store and unchanged since their conversion are
+        read from it (store day set; the CSV may be gone), the others from CSV.
+        The signature (metrics_store.file_signature) stands for the content.
+        """
+        csv_files = {csv_file.stem: csv_file for csv_file in folder.glob('*.csv')}
+        store_dir = metrics_store.store_path(folder)
+        converted = metrics_store.converted_files(store_dir) if metrics_store.has_store(folder) else {}
+        
+        day_files = []
+        for stem in sorted(set(csv_files) | set(converted)):
+            if stem in csv_files:
+                signature = metrics_store.file_signature(csv_files[stem])
+                if stem not in converted or converted[stem][1] != signature:
+                    day_files.append((csv_files[stem], signature, None))
+                    continue
+            day, marker = converted[stem]
+            day_files.append((folder / f'{stem}.csv', marker, day))
+        return day_files
+    
+    @staticmethod
+    def _read_day(day_file: Tuple[Path, Dict, Optional[date]], columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Raw rows of a day file from the store or its CSV (see _day_files)"""
+        csv_file, _, store_day = day_file
+        if store_day is not None:
+            return metrics_store.read_file(metrics_store.store_path(csv_file.parent), csv_file.stem, store_day,
+                                           columns=columns)
+        return pd.read_csv(csv_file, usecols=columns)
+    
+    def _cached_thresholds(self, thresholds: Dict[str, float], path: Path) -> Dict[str, float]:
+        """The cached winsorization thresholds if the new ones are within tolerance, else the new ones"""
+        tolerance = config.FEATURE_CACHE_THRESHOLD_TOLERANCE
+        if path.exists():
+            cached = json.loads(path.read_text())
+            if cached.keys() == thresholds.keys() and all(
+                    abs(thresholds[col] - cached[col]) <= tolerance * abs(cached[col]) for col in thresholds):
+                return cached
+            logger.info(f"Winsorization thresholds changed ({cached} -> {thresholds}), recomputing cached days")
+        path.write_text(json.dumps(thresholds))
+        return thresholds
+    
+    def _engineer_day(self, day: pd.DataFrame, history: Optional[pd.DataFrame]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Engineered rows of one cleaned day, given the rows carried in from earlier days
+        
+        Returns:
+            (engineered rows of the day, history to carry into the next day)
+        """
+        combined = self._concat([history, day.assign(_from_history=False)]) \
+            if history is not None else day.assign(_from_history=False)
+        
+        engineered = self.engineer_features(combined)
+        features = engineered[~engineered['_from_history']].drop(columns=['_from_history']).reset_index(drop=True)
+        
+        # Last cleaned (not engineered) rows of every service, in time order
+        ordered = combined.assign(_time=pd.to_datetime(combined['timestamp'], format='ISO8601')) \
+            .sort_values(['service_name', '_time'], kind='stable')
+        history = (ordered.groupby('service_name', sort=False, observed=True).tail(FEATURE_HISTORY_ROWS)
+                   .drop(columns=['_time']).assign(_from_history=True).reset_index(drop=True))
+        return features, history
+    
     def create_target_labels(self, data: pd.DataFrame) -> pd.DataFrame:
         """
         Create target labels - use actual replica_count
         (No future lookahead to avoid data leakage)
         """
-        df = data.copy()
+        df = data.copy(deep=False)
         df['target_replicas'] = df['replica_count'].astype(int)
         logger.info("Target labels created")
         return df
@@ -303,30 +632,7 @@ class DataPreprocessor:
         all_features = config.FEATURE_COLUMNS.copy()
         
         # Add engineered features
-        engineered_features = [
-            # Time encoding
-            'hour_sin', 'hour_cos', 'dow_sin', 'dow_cos',
-            # Utilization
-            'cpu_utilization_ratio', 'ram_utilization_ratio',
-            # Lag features
-            'cpu_lag_1', 'cpu_lag_5', 'cpu_lag_10',
-            'ram_lag_1', 'ram_lag_5', 'ram_lag_10',
-            'rps_lag_1', 'rps_lag_5', 'rps_lag_10',
-            # Rate of change
-            'cpu_change_rate', 'ram_change_rate', 'request_change_rate',
-            # Acceleration
-            'cpu_acceleration', 'rps_acceleration',
-            # Rolling statistics
-            'cpu_rolling_mean', 'ram_rolling_mean', 'rps_rolling_mean',
-            'cpu_rolling_std', 'ram_rolling_std', 'rps_rolling_std',
-            'request_rolling_max', 'response_time_rolling_p95',
-            # Spike detection
-            'cpu_spike_flag', 'rps_spike_flag',
-            # Pressure
-            'system_pressure'
-        ]
-        
-        all_features.extend(engineered_features)
+        all_features.extend(self.ENGINEERED_FEATURES)
         
         # One-hot encode service names
         service_dummies = pd.get_dummies(data['service_name'], prefix='service')
@@ -0,0 +1,242 @@
+"""
+Distill the per-service transformers into compact MLP students
+
+For every service model saved by transformer_per_service.py the teacher's
+softmax outputs are computed over the same windows it was trained on (same
+day-based split), and a small MLP is trained on them. The student does not
+see the raw sequence: it reads the window statistics of
+window_features.STUDENT_WINDOW_LAYOUT, which the predictor maintains
+incrementally per service, so serving it costs one small matmul per cycle.
+
+Targets are the teacher probabilities softened with --temperature, mixed
+with --hard-weight of the one-hot replica labels.
+
+Reports per service (distillation_report.json):
+1. Exact/within-1 accuracy of teacher and student on the held-out test days
+2. Accuracy gap and student agreement with the teacher
+3. Single-window latency p50 of teacher and student (including window stats) and the speedup
+4. Parameter counts
+
+Students are written to models/transformer_student/ and served with
+MODEL_TYPE=transformer_student.
+
+Usage:
+    python distill_transformer.py
+    python distill_transformer.py --services order product --temperature 3
+"""
+
+import argparse
+import json
+import logging
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import joblib
+import keras
+import numpy as np
+from keras import callbacks, layers
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import config
+from data_preprocessor import DataPreprocessor
+from feature_manifest import FEATURE_MANIFEST_FILE, build_feature_manifest, save_feature_manifest
+from transformer_per_service import (
+    MIN_REPLICA, NUM_CLASSES, ServiceTransformer, WindowBatches, load_per_service_data, split_service_data
+)
+from window_features import STUDENT_WINDOW_LAYOUT, window_features
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+keras.utils.set_random_seed(config.RANDOM_STATE)
+
+
+def build_student(train_stats, hidden_units=(64, 32), dropout=0.1):
+    """
+    Shallow MLP over window statistics
+
+    A Normalization layer adapted on the training statistics is part of the
+    model, so the saved student takes raw window stats.
+    """
+    normalizer = layers.Normalization(name='stats_norm')
+    normalizer.adapt(train_stats)
+
+    inputs = layers.Input(shape=(train_stats.shape[1],), name='window_stats')
+    x = normalizer(inputs)
+    for i, units in enumerate(hidden_units):
+        x = layers.Dense(units, activation='relu', name=f'dense_{i + 1}')(x)
+        x = layers.Dropout(dropout)(x)
+    outputs = layers.Dense(NUM_CLASSES, activation='softmax', name='replica_output')(x)
+    return keras.Model(inputs, outputs, name='transformer_student')
+
+
+def soften(probs, temperature):
+    """Teacher probabilities at a higher temperature (p ** (1/T), renormalized)"""
+    logits = np.log(np.clip(probs, 1e-8, 1.0)) / temperature
+    logits -= logits.max(axis=1, keepdims=True)
+    soft = np.exp(logits)
+    return soft / soft.sum(axis=1, keepdims=True)
+
+
+def distill_targets(teacher_probs, y, temperature, hard_weight):
+    """Soft teacher targets mixed with one-hot labels"""
+    hard = keras.utils.to_categorical(np.clip(y.astype(int) - MIN_REPLICA, 0, NUM_CLASSES - 1), NUM_CLASSES)
+    return (1 - hard_weight) * soften(teacher_probs, temperature) + hard_weight * hard
+
+
+def student_inputs(X_scaled, sequence_length):
+    """Window stats aligned with ServiceTransformer.create_sequences (window i = X[i:i + w])"""
+    return window_features(X_scaled, STUDENT_WINDOW_LAYOUT, sequence_length)[:-1].astype(np.float32)
+
+
+def _single_window_p50_ms(predict, windows, repeats):
+    for window in windows[:10]:
+        predict(window)
+    latencies = []
+    for window in windows[:repeats]:
+        start = time.perf_counter()
+        predict(window)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return float(np.percentile(latencies, 50))
+
+
+def _accuracy(predictions, y):
+    return {
+        'exact_accuracy': float(np.mean(predictions == y)),
+        'within_1_accuracy': float(np.mean(np.abs(predictions - y) <= 1))
+    }
+
+
+def distill_service(service, teacher_dir, output_dir, X_service, y_service, args):
+    """Train and evaluate the student of one service; returns its report entry"""
+    teacher = keras.models.load_model(teacher_dir / f'transformer_model_{service}.keras', compile=False)
+    scaler = joblib.load(teacher_dir / f'transformer_scaler_{service}.joblib')
+    sequence_length = int(teacher.input_shape[1])
+    sequencer = ServiceTransformer(service, n_features=X_service.shape[1], sequence_length=sequence_length)
+
+    X_train, y_train, X_val, y_val, X_test, y_test = split_service_data(X_service, y_service)
+    splits = {}
+    for name, X, y in (('train', X_train, y_train), ('val', X_val, y_val), ('test', X_test, y_test)):
+        X_scaled = scaler.transform(X)
+        X_seq, y_seq = sequencer.create_sequences(X_scaled, y)
+        splits[name] = {
+            'sequences': X_seq,
+            'stats': student_inputs(X_scaled, sequence_length),
+            'y': y_seq,
+            'teacher': teacher.predict(WindowBatches(X_seq, batch_size=512), verbose=0)
+        }
+    logger.info(f"[{service}] Windows: train={len(splits['train']['y'])}, val={len(splits['val']['y'])}, "
+                f"test={len(splits['test']['y'])}, student inputs={splits['train']['stats'].shape[1]}")
+
+    student = build_student(splits['train']['stats'], hidden_units=tuple(args.hidden_units))
+    student.compile(optimizer=keras.optimizers.Adam(args.learning_rate), loss='categorical_crossentropy')
+    student.fit(
+        splits['train']['stats'],
+        distill_targets(splits['train']['teacher'], splits['train']['y'], args.temperature, args.hard_weight),
+        validation_data=(
+            splits['val']['stats'],
+            distill_targets(splits['val']['teacher'], splits['val']['y'], args.temperature, args.hard_weight)
+        ),
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        callbacks=[callbacks.EarlyStopping(patience=8, restore_best_weights=True)],
+        verbose=0
+    )
+
+    test = splits['test']
+    teacher_pred = np.argmax(test['teacher'], axis=1) + MIN_REPLICA
+    student_pred = np.argmax(student.predict(test['stats'], batch_size=512, verbose=0), axis=1) + MIN_REPLICA
+
+    # Latency of one service window as served: the student includes computing its window stats
+    windows = test['sequences'][:args.latency_samples].astype(np.float32)
+    teacher_ms = _single_window_p50_ms(lambda w: teacher.predict_on_batch(w[np.newaxis]), windows, args.latency_samples)
+    student_ms = _single_window_p50_ms(
+        lambda w: student.predict_on_batch(window_features(w, STUDENT_WINDOW_LAYOUT, sequence_length)),
+        windows, args.latency_samples
+    )
+
+    result = {
+        'teacher': _accuracy(teacher_pred, test['y']),
+        'student': _accuracy(student_pred, test['y']),
+        'agreement_with_teacher': float(np.mean(student_pred == teacher_pred)),
+        'teacher_latency_p50_ms': teacher_ms,
+        'student_latency_p50_ms': student_ms,
+        'speedup': teacher_ms / student_ms,
+        'teacher_params': int(teacher.count_params()),
+        'student_params': int(student.count_params()),
+        'test_samples': int(len(test['y']))
+    }
+    result['exact_accuracy_gap'] = result['teacher']['exact_accuracy'] - result['student']['exact_accuracy']
+    result['within_1_accuracy_gap'] = result['teacher']['within_1_accuracy'] - result['student']['within_1_accuracy']
+
+    # The student reads stats of rows scaled exactly as the teacher's
+    student.save(output_dir / f'student_model_{service}.keras')
+    shutil.copyfile(teacher_dir / f'transformer_scaler_{service}.joblib', output_dir / f'student_scaler_{service}.joblib')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Distill per-service transformers into MLP students')
+    parser.add_argument('--teacher-dir', default=str(Path(config.MODEL_OUTPUT_DIR) / 'transformer'),
+                        help='Directory with transformer_model_<service>.keras')
+    parser.add_argument('--output-dir', default=str(Path(config.MODEL_OUTPUT_DIR) / 'transformer_student'),
+                        help='Where student models and the report are written')
+    parser.add_argument('--services', nargs='+', default=config.SERVICES, help='Services to distill')
+    parser.add_argument('--temperature', type=float, default=2.0, help='Softening temperature of teacher outputs')
+    parser.add_argument('--hard-weight', type=float, default=0.1, help='Weight of one-hot labels in the targets')
+    parser.add_argument('--hidden-units', nargs='+', type=int, default=[64, 32], help='Student hidden layer sizes')
+    parser.add_argument('--epochs', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--learning-rate', type=float, default=1e-3)
+    parser.add_argument('--latency-samples', type=int, default=300, help='Test windows timed one at a time')
+    args = parser.parse_args()
+
+    teacher_dir = Path(args.teacher_dir)
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    logger.info("="*80)
+    logger.info("TRANSFORMER DISTILLATION (PER SERVICE)")
+    logger.info("="*80)
+    logger.info(f"Student: MLP {args.hidden_units} over {STUDENT_WINDOW_LAYOUT} window stats, "
+                f"T={args.temperature}, hard weight={args.hard_weight}")
+
+    # Rebuild the per-service data exactly as training did
+    preprocessor = DataPreprocessor()
+    X_no_service, y, service_names = load_per_service_data(preprocessor)
+    save_feature_manifest(build_feature_manifest(list(X_no_service.columns)), output_dir / FEATURE_MANIFEST_FILE)
+
+    report = {
+        'layout': list(STUDENT_WINDOW_LAYOUT),
+        'hidden_units': args.hidden_units,
+        'temperature': args.temperature,
+        'hard_weight': args.hard_weight,
+        'services': {}
+    }
+
+    for service in args.services:
+        if not (teacher_dir / f'transformer_model_{service}.keras').exists():
+            logger.warning(f"[{service}] No teacher model in {teacher_dir} - SKIPPING")
+            continue
+
+        mask = service_names == service
+        result = distill_service(service, teacher_dir, output_dir, X_no_service.values[mask], y.values[mask], args)
+        report['services'][service] = result
+        logger.info(f"  Teacher: Exact={result['teacher']['exact_accuracy']:.1%}, "
+                    f"Within-1={result['teacher']['within_1_accuracy']:.1%}, p50={result['teacher_latency_p50_ms']:.2f}ms")
+        logger.info(f"  Student: Exact={result['student']['exact_accuracy']:.1%}, "
+                    f"Within-1={result['student']['within_1_accuracy']:.1%}, p50={result['student_latency_p50_ms']:.2f}ms")
+        logger.info(f"  Gap={result['exact_accuracy_gap']:+.1%}, Agree={result['agreement_with_teacher']:.1%}, "
+                    f"Speedup={result['speedup']:.1f}x, Params {result['teacher_params']:,} -> {result['student_params']:,}")
+
+    report_path = output_dir / 'distillation_report.json'
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Report saved to {report_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""
+Out-of-core preprocessing into training-ready per-service shards
+
+load_engineered_folder keeps the full engineered history in memory, as does
+prepare_features_and_target and per-service scaling. This module streams the
+same pipeline one day file at a time (DataPreprocessor.iter_engineered_days:
+clean -> engineer, with the last rows of every service carried over from the
+previous day) and writes
+
+    <out>/manifest.json
+    <out>/feature_manifest.json
+    <out>/<service>/<csv stem>.X.npy    float32 features, one row per sample
+    <out>/<service>/<csv stem>.y.npy    int32 replica_count
+    <out>/<service>/scaler.joblib
+
+Two passes, each holding one day at a time:
+
+1. Engineered days are written as unscaled per-service shards with the
+   columns of prepare_features_and_target (without the service one-hot
+   columns, which per-service models drop). Running per-column moments give
+   the same constant-feature selection (std < 0.01 over all rows).
+2. Per service, the scaler is fitted day by day (partial_fit) on the days up
+   to fit_end_date and the shards are rewritten scaled, without the constant
+   columns. The default SketchRobustScaler (quantile_sketch.py) matches
+   RobustScaler within config.QUANTILE_SKETCH_ACCURACY and is saved as a
+   plain RobustScaler.
+
+Peak memory is one day of engineered rows, instead of the engineered history
+of every service. Winsorization thresholds come from merged per-day sketches
+(DataPreprocessor.folder_thresholds), so the cleaning does not depend on how
+the days are split across runs or workers. Rows come out in the trainers'
+per-service order (days in file order, time order within a day).
+
+The per-service trainers (--shards) read unscaled shards (--no-scale) through
+load_training_shards: they split every service by days and fit their own
+scaler on the training split, as when loading the metrics folder. Scaled
+shards are for consumers that do not scale themselves; their scaler is fitted
+on the days up to fit_end_date, which is not the trainers' split.
+
+Usage:
+    python feature_shards.py ../metrics/filtered --out ../metrics/shards --no-scale
+    python catboost_per_service.py --shards ../metrics/shards
+    python feature_shards.py ../metrics/filtered --out ../metrics/shards --fit-end-date 2025-12-20
+"""
+
+import argparse
+import json
+import logging
+import sys
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import joblib
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import config
+import metrics_store
+from data_preprocessor import DataPreprocessor
+from feature_manifest import FEATURE_MANIFEST_FILE, build_feature_manifest, save_feature_manifest
+from quantile_sketch import SketchRobustScaler
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SHARD_MANIFEST_FILE = 'manifest.json'
+SCALER_FILE = 'scaler.joblib'
+# prepare_features_and_target drops features with a std below this
+CONSTANT_FEATURE_STD = 0.01
+
+
+def _shard_paths(out_dir: Path, service: str, day: str) -> Tuple[Path, Path]:
+    return out_dir / service / f'{day}.X.npy', out_dir / service / f'{day}.y.npy'
+
+
+def write_shards(folder: Union[str, Path], out_dir: Union[str, Path],
+                 preprocessor: Optional[DataPreprocessor] = None,
+                 scaler_factory: Optional[Callable] = SketchRobustScaler,
+                 fit_end_date: Optional[str] = None, lean: bool = True) -> Dict:
+    """
+    Clean, engineer and scale a metrics folder into per-service day shards
+
+    Args:
+        folder: Metrics folder with daily CSV files
+        out_dir: Shard directory (existing shards of the same days are overwritten)
+        preprocessor: DataPreprocessor to use (default: a new one)
+        scaler_factory: Scaler class fitted per service with partial_fit
+                        (None: shards stay unscaled)
+        fit_end_date: Last day 'YYYY-MM-DD' the scalers are fitted on (default:
+                      all days); set it to the last training day so test days
+                      do not inform the scaling
+        lean: Compact dtypes while engineering (see DataPreprocessor.lean_dtypes)
+
+    Returns:
+        The shard manifest (also written to <out>/manifest.json)
+    """
+    preprocessor = preprocessor or DataPreprocessor()
+    out_dir = Path(out_dir)
+    columns = config.FEATURE_COLUMNS + DataPreprocessor.ENGINEERED_FEATURES
+
+    # Pass 1: engineered days -> unscaled shards, running moments over all rows
+    moments = StandardScaler()
+    shard_rows = {service: {} for service in config.SERVICES}
+    days = []
+    for csv_file, features in preprocessor.iter_engineered_days(folder, lean=lean):
+        day = csv_file.stem
+        days.append(day)
+        X = features[columns].to_numpy(dtype=np.float32)
+        if len(X):
+            moments.partial_fit(X.astype(np.float64))
+
+        # Rows are sorted by service, then time
+        services = features['service_name'].to_numpy()
+        for service in config.SERVICES:
+            rows = np.flatnonzero(services == service)
+            if not len(rows):
+                continue
+            (out_dir / service).mkdir(parents=True, exist_ok=True)
+            X_path, y_path = _shard_paths(out_dir, service, day)
+            np.save(X_path, X[rows])
+            np.save(y_path, features['replica_count'].to_numpy()[rows].astype(np.int32))
+            shard_rows[service][day] = len(rows)
+        logger.info(f"Sharded: {day} ({len(features)} rows)")
+
+    if not days:
+        raise ValueError(f"No data could be loaded from {folder}")
+
+    # Sample std (pandas' ddof=1) from the population variance
+    n = moments.n_samples_seen_
+    std = np.sqrt(moments.var_ * n / max(n - 1, 1))
+    keep = std >= CONSTANT_FEATURE_STD
+    kept_columns = [col for col, k in zip(columns, keep) if k]
+    dropped = [col for col, k in zip(columns, keep) if not k]
+    if dropped:
+        logger.info(f"Removing {len(dropped)} constant features: {dropped}")
+
+    # Pass 2: per-service scaler fit and scaled shards without the constant columns
+    fit_end = metrics_store.parse_date(fit_end_date)
+    for service, service_days in shard_rows.items():
+        if not service_days:
+            continue
+        scaler = None
+        if scaler_factory is not None:
+            fit_days = [day for day in service_days if metrics_store.in_date_range(day, None, fit_end)]
+            if not fit_days:
+                raise ValueError(f"[{service}] No days up to {fit_end_date} to fit the scaler on")
+            scaler = scaler_factory()
+            for day in fit_days:
+                scaler.partial_fit(np.load(_shard_paths(out_dir, service, day)[0], mmap_mode='r')[:, keep])
+            if isinstance(scaler, SketchRobustScaler):
+                scaler = scaler.to_robust_scaler()
+            joblib.dump(scaler, out_dir / service / SCALER_FILE)
+
+        for day in service_days:
+            X_path, _ = _shard_paths(out_dir, service, day)
+            X = np.load(X_path)[:, keep]
+            if scaler is not None:
+                X = scaler.transform(X)
+            np.save(X_path, X.astype(np.float32, copy=False))
+        logger.info(f"[{service}] {sum(service_days.values())} rows in {len(service_days)} days"
+                    f"{' (scaled)' if scaler is not None else ''}")
+
+    manifest = {
+        'source': str(folder),
+        'columns': kept_columns,
+        'dropped_constant': dropped,
+        'scaled': scaler_factory is not None,
+        'fit_end_date': fit_end_date,
+        'days': days,
+        'services': shard_rows
+    }
+    (out_dir / SHARD_MANIFEST_FILE).write_text(json.dumps(manifest, indent=2))
+    # The per-service trainers' input layout, for inference
+    save_feature_manifest(build_feature_manifest(kept_columns), out_dir / FEATURE_MANIFEST_FILE)
+    return manifest
+
+
+def load_shard_manifest(out_dir: Union[str, Path]) -> Dict:
+    return json.loads((Path(out_dir) / SHARD_MANIFEST_FILE).read_text())
+
+
+def iter_service_shards(out_dir: Union[str, Path], service: str, start_date: Optional[str] = None,
+                        end_date: Optional[str] = None) -> Iterator[Tuple[str, np.ndarray, np.ndarray]]:
+    """
+    (day, X, y) of one service, day by day in time order; arrays are memory-mapped
+
+    Args:
+        start_date, end_date: Inclusive day range 'YYYY-MM-DD' (default: all days)
+    """
+    out_dir = Path(out_dir)
+    manifest = load_shard_manifest(out_dir)
+    start, end = metrics_store.parse_date(start_date), metrics_store.parse_date(end_date)
+    for day in manifest['services'].get(service, {}):
+        if metrics_store.in_date_range(day, start, end):
+            X_path, y_path = _shard_paths(out_dir, service, day)
+            yield day, np.load(X_path, mmap_mode='r'), np.load(y_path, mmap_mode='r')
+
+
+def load_service_shards(out_dir: Union[str, Path], service: str, start_date: Optional[str] = None,
+                        end_date: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """One service's (X, y) over a day range (default: all days), concatenated in time order"""
+    shards = list(iter_service_shards(out_dir, service, start_date, end_date))
+    if not shards:
+        raise ValueError(f"No shards for {service} in {out_dir}")
+    return np.concatenate([X for _, X, _ in shards]), np.concatenate([y for _, _, y in shards])
+
+
+def load_training_shards(out_dir: Union[str, Path]) -> Tuple[List[str], Dict[str, Tuple[np.ndarray, np.ndarray]]]:
+    """
+    Input of the per-service trainers from unscaled shards
+
+    Returns:
+        (feature columns, {service: (X, y)} in config.SERVICES order)
+    """
+    manifest = load_shard_manifest(out_dir)
+    if manifest['scaled']:
+        raise ValueError(f"Shards in {out_dir} are scaled; the per-service trainers fit their scaler "
+                         f"on their own training split, write the shards with --no-scale")
+    data = {service: load_service_shards(out_dir, service)
+            for service in config.SERVICES if manifest['services'].get(service)}
+    return manifest['columns'], data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Preprocess a metrics folder day by day into per-service shards')
+    parser.add_argument('folder', help='Metrics folder (e.g. ../metrics/filtered)')
+    parser.add_argument('--out', required=True, help='Shard directory')
+    parser.add_argument('--fit-end-date', default=None, help='Last day the scalers are fitted on (default: all)')
+    parser.add_argument('--no-scale', action='store_true', help='Write unscaled shards')
+    parser.add_argument('--standard-scaler', action='store_true', help='StandardScaler instead of the sketch RobustScaler')
+    args = parser.parse_args()
+
+    scaler_factory = None if args.no_scale else (StandardScaler if args.standard_scaler else SketchRobustScaler)
+    manifest = write_shards(args.folder, args.out, scaler_factory=scaler_factory, fit_end_date=args.fit_end_date)
+    logger.info(f"{len(manifest['days'])} days, {len(manifest['columns'])} features -> {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -28,6 +28,7 @@ import sys
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 import config
+import metrics_store
 
 # Set style for thesis
 plt.style.use('seaborn-v0_8-whitegrid')
@@ -50,7 +51,9 @@ SERVICES = [s for s in config.SERVICES if s != 'profile']
 
 
 def load_all_data():
-    """Load all filtered CSV files"""
+    """Load all filtered metrics (from the Parquet store if converted)"""
+    if metrics_store.has_store(METRICS_DIR):
+        return metrics_store.read_store(metrics_store.store_path(METRICS_DIR))
     dfs = []
     for csv_file in METRICS_DIR.glob('*.csv'):
         df = pd.read_csv(csv_file)
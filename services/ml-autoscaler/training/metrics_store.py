@@ -0,0 +1,233 @@
+"""
+Date/service-partitioned Parquet store for collected metrics
+
+The daily CSV files (metrics_YYYYMMDD.csv) are converted once into
+
+    <folder>/parquet/date=YYYY-MM-DD/service=<service>/<csv stem>.parquet
+
+so readers skip CSV parsing and type inference, read only the columns they
+ask for (column projection) and open only the days and services in range
+(partition pruning). Each file keeps every CSV column in order; the date and
+service keys only drive pruning. A marker per source file
+(date=.../_<csv stem>.json) records the CSV size and mtime; converting again
+skips unchanged files and rewrites the partitions of changed ones.
+
+Values are stored exactly as pd.read_csv parses them, timestamp included,
+so a store read matches the CSV read except for row order (rows come back
+grouped by day, then service, in file order within each group).
+
+Requires pyarrow (imported on first use).
+
+Usage:
+    python metrics_store.py ../metrics/filtered
+    python metrics_store.py ../metrics/balanced_v2 --force
+"""
+
+import argparse
+import json
+import logging
+import re
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+STORE_SUBDIR = 'parquet'
+FILE_DATE_PATTERN = re.compile(r'(\d{8})')
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("The metrics store requires pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+
+def store_path(folder: Union[str, Path]) -> Path:
+    """Store directory of a metrics folder"""
+    return Path(folder) / STORE_SUBDIR
+
+
+def has_store(folder: Union[str, Path]) -> bool:
+    return any(store_path(folder).glob('date=*'))
+
+
+def file_date(csv_path: Path, df: Optional[pd.DataFrame] = None) -> Optional[date]:
+    """Day of a metrics file: from its name (metrics_YYYYMMDD.csv), else its first timestamp"""
+    match = FILE_DATE_PATTERN.search(csv_path.stem)
+    if match:
+        try:
+            return datetime.strptime(match.group(1), '%Y%m%d').date()
+        except ValueError:
+            pass
+    if df is not None and len(df):
+        return pd.to_datetime(df['timestamp'].iloc[0], format='ISO8601').date()
+    return None
+
+
+def parse_date(value: Union[str, date, None]) -> Optional[date]:
+    """'YYYY-MM-DD' (or a date, or None) as a date"""
+    if value is None or isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def in_date_range(path: Union[str, Path], start: Optional[date], end: Optional[date]) -> bool:
+    """Whether a metrics file's day (from its name) is in [start, end]; undated files always are"""
+    day = file_date(Path(path))
+    return day is None or ((start is None or day >= start) and (end is None or day <= end))
+
+
+def file_signature(csv_path: Path) -> Dict:
+    """Name, size and mtime of a CSV file, as recorded in its store marker"""
+    stat = csv_path.stat()
+    return {'file': csv_path.name, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def converted_files(store_dir: Union[str, Path]) -> Dict[str, Tuple[date, Dict]]:
+    """{CSV stem: (day, marker)} of every file converted into a store"""
+    return {
+        marker.stem[1:]: (parse_date(marker.parent.name[len('date='):]), json.loads(marker.read_text()))
+        for marker in Path(store_dir).glob('date=*/_*.json')
+    }
+
+
+def convert_file(csv_path: Path, store_dir: Path, force: bool = False) -> bool:
+    """
+    Write one CSV file into the store
+
+    Returns:
+        True if the file was (re)written, False if its partitions were up to date
+    """
+    pa = _pyarrow()
+    source = file_signature(csv_path)
+
+    day = file_date(csv_path)
+    if day is not None and not force:
+        marker = store_dir / f'date={day.isoformat()}' / f'_{csv_path.stem}.json'
+        if marker.exists() and json.loads(marker.read_text()) == source:
+            return False
+
+    df = pd.read_csv(csv_path)
+    day = day or file_date(csv_path, df)
+    if day is None:
+        logger.warning(f"Skipping {csv_path.name}: no date in its name and no rows")
+        return False
+
+    day_dir = store_dir / f'date={day.isoformat()}'
+    for stale in day_dir.glob(f'service=*/{csv_path.stem}.parquet'):
+        stale.unlink()
+
+    for service, service_df in df.groupby('service_name', sort=True):
+        service_dir = day_dir / f'service={service}'
+        service_dir.mkdir(parents=True, exist_ok=True)
+        table = pa.Table.from_pandas(service_df, preserve_index=False)
+        pa.parquet.write_table(table, service_dir / f'{csv_path.stem}.parquet')
+
+    # Written last: an interrupted conversion is redone on the next run
+    day_dir.mkdir(parents=True, exist_ok=True)
+    (day_dir / f'_{csv_path.stem}.json').write_text(json.dumps(source))
+    return True
+
+
+def convert_folder(folder: Union[str, Path], force: bool = False) -> Path:
+    """Convert every CSV file of a metrics folder into its store; returns the store path"""
+    folder = Path(folder)
+    store_dir = store_path(folder)
+    csv_files = sorted(folder.glob('*.csv'))
+    if not csv_files:
+        raise ValueError(f"No CSV files in {folder}")
+
+    converted = 0
+    for csv_file in csv_files:
+        if convert_file(csv_file, store_dir, force=force):
+            converted += 1
+            logger.info(f"Converted: {csv_file.name}")
+    logger.info(f"{converted} of {len(csv_files)} files converted, {len(csv_files) - converted} up to date")
+    return store_dir
+
+
+def read_store(store_dir: Union[str, Path], columns: Optional[List[str]] = None,
+               start_date: Union[str, date, None] = None, end_date: Union[str, date, None] = None,
+               services: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Read metrics from a store
+
+    Args:
+        store_dir: Store directory (see store_path)
+        columns: Columns to read, in this order (default: all CSV columns)
+        start_date, end_date: Inclusive day range ('YYYY-MM-DD'); other days are not opened
+        services: Services to read; other partitions are not opened
+    """
+    pa = _pyarrow()
+    partitioning = pa.dataset.partitioning(
+        pa.schema([('date', pa.string()), ('service', pa.string())]), flavor='hive'
+    )
+    dataset = pa.dataset.dataset(str(store_dir), format='parquet', partitioning=partitioning)
+
+    start, end = parse_date(start_date), parse_date(end_date)
+    conditions = []
+    if start is not None:
+        conditions.append(pa.dataset.field('date') >= start.isoformat())
+    if end is not None:
+        conditions.append(pa.dataset.field('date') <= end.isoformat())
+    if services is not None:
+        conditions.append(pa.dataset.field('service').isin(list(services)))
+    row_filter = None
+    for condition in conditions:
+        row_filter = condition if row_filter is None else row_filter & condition
+
+    # A column may be int on one day and float on another (NaNs), as pd.concat
+    # of the CSV files would promote it
+    fragments = list(dataset.get_fragments(filter=row_filter))
+    if not fragments:
+        raise ValueError(f"No metrics in {store_dir} for the requested days/services")
+    schema = pa.unify_schemas([fragment.physical_schema for fragment in fragments], promote_options='permissive')
+    dataset = pa.dataset.dataset(str(store_dir), format='parquet', partitioning=partitioning,
+                                 schema=pa.unify_schemas([schema, partitioning.schema]))
+
+    if columns is None:
+        columns = [name for name in schema.names if name not in ('date', 'service')]
+
+    table = dataset.to_table(columns=columns, filter=row_filter)
+    logger.info(f"Read {table.num_rows} rows x {len(columns)} columns from {store_dir}")
+    return table.to_pandas()
+
+
+def read_file(store_dir: Union[str, Path], stem: str, day: date,
+              columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Rows of one converted CSV file, service by service
+
+    Opens only that file's partitions of its day (see converted_files), without
+    scanning the store.
+    """
+    pa = _pyarrow()
+    paths = sorted((Path(store_dir) / f'date={day.isoformat()}').glob(f'service=*/{stem}.parquet'))
+    if not paths:
+        # A CSV file without rows is converted into no partitions
+        return pd.DataFrame(columns=columns)
+    tables = [pa.parquet.read_table(path, columns=columns) for path in paths]
+    return pa.concat_tables(tables, promote_options='permissive').to_pandas()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert daily metrics CSV files into a partitioned Parquet store')
+    parser.add_argument('folders', nargs='+', help='Metrics folders (e.g. ../metrics/filtered)')
+    parser.add_argument('--force', action='store_true', help='Rewrite every file, even if unchanged')
+    args = parser.parse_args()
+
+    for folder in args.folders:
+        store_dir = convert_folder(folder, force=args.force)
+        logger.info(f"Store: {store_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Process-pool driver for the per-service trainers
+
+The per-service models of transformer_per_service.py, randomforest_per_service.py
+and catboost_per_service.py are independent, so train_services runs one
+service per worker process instead of one after the other:
+
+- Each service's (X, y) is written once as .npy files and opened
+  memory-mapped by its worker, so workers share the page cache instead of
+  receiving pickled copies of the data.
+- Every worker caps its thread pools at cpu_count // workers threads
+  (OpenMP/BLAS through threadpoolctl, TF intra-op threads) and the trainer
+  gets the same number as `threads` for Random Forest's n_jobs and CatBoost's
+  thread_count, so the workers do not oversubscribe the cores.
+- Workers are spawned, not forked: TF and the OpenMP runtimes are not
+  fork-safe once initialized.
+
+With a single worker (one CPU, one service or workers=1) the services are
+trained in-process, as before, with all cores per model.
+"""
+
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+import config
+
+logger = logging.getLogger(__name__)
+
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                   'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS')
+
+
+def plan_workers(n_services: int, workers: Optional[int] = None) -> Tuple[int, int]:
+    """
+    (worker processes, threads per worker) for training n_services models
+
+    Args:
+        workers: Worker processes (default: config.TRAINING_WORKERS, else one
+                 per service up to the CPU count)
+    """
+    cpus = os.cpu_count() or 1
+    workers = workers or config.TRAINING_WORKERS or cpus
+    workers = max(1, min(workers, n_services, cpus))
+    return workers, max(1, cpus // workers)
+
+
+def limit_threads(threads: int):
+    """Cap the thread pools of the numerical libraries in this process"""
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(threads)
+    # The trainer module (imported before the initializer under spawn) may
+    # already have imported TF; its thread pools are created on first use
+    if 'tensorflow' in sys.modules:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(min(threads, 2))
+
+
+def share_arrays(arrays: Dict[str, np.ndarray], directory: Path) -> Dict[str, Path]:
+    """Write arrays as <directory>/<name>.npy for memory-mapped loading"""
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = {}
+    for name, array in arrays.items():
+        paths[name] = directory / f'{name}.npy'
+        np.save(paths[name], np.ascontiguousarray(array))
+    return paths
+
+
+def _train_shared(train_fn: Callable, service: str, paths: Dict[str, Path], threads: int, kwargs: Dict):
+    X = np.load(paths['X'], mmap_mode='r')
+    y = np.load(paths['y'], mmap_mode='r')
+    return train_fn(service, X, y, threads=threads, **kwargs)
+
+
+def train_services(train_fn: Callable, data: Dict[str, Tuple[np.ndarray, np.ndarray]],
+                   workers: Optional[int] = None, **kwargs) -> Dict[str, dict]:
+    """
+    Run train_fn(service, X, y, threads=..., **kwargs) for every service
+
+    train_fn must be a module-level function (workers import it by name),
+    save its own model and return a picklable result, or None for a skipped
+    service. X and y arrive memory-mapped and read-only in worker processes.
+
+    Args:
+        data: {service: (X, y)} in the order results should be reported
+        workers: Worker processes (see plan_workers)
+
+    Returns:
+        {service: result} in data order, without skipped services
+    """
+    if not data:
+        return {}
+    n_workers, threads = plan_workers(len(data), workers)
+
+    if n_workers == 1:
+        results = {service: train_fn(service, X, y, threads=threads, **kwargs)
+                   for service, (X, y) in data.items()}
+    else:
+        logger.info(f"Training {len(data)} services in {n_workers} processes, {threads} threads each")
+        with tempfile.TemporaryDirectory(prefix='per_service_') as shared_dir:
+            shared = {service: share_arrays({'X': X, 'y': y}, Path(shared_dir) / service)
+                      for service, (X, y) in data.items()}
+            with ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=limit_threads, initargs=(threads,)) as pool:
+                futures = {service: pool.submit(_train_shared, train_fn, service, paths, threads, kwargs)
+                           for service, paths in shared.items()}
+                results = {service: future.result() for service, future in futures.items()}
+
+    return {service: result for service, result in results.items() if result is not None}
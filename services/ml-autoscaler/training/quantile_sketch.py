@@ -0,0 +1,157 @@
+"""
+Mergeable quantile sketches for out-of-core preprocessing
+
+Exact quantiles (clean_data's winsorization thresholds, RobustScaler's
+medians and IQRs) need every value in memory. QuantileSketch keeps, per
+column, counts of values in logarithmic buckets (DDSketch-style): a value x
+falls in bucket ceil(log_gamma |x|) with gamma = (1 + a) / (1 - a), so any
+quantile is returned within relative error a of the exact one. Sketches of
+day files or workers merge by adding their counts, so the result does not
+depend on how the data was split or in which order it was merged.
+
+The bucket range is fixed (|x| from MIN_VALUE to MAX_VALUE; smaller values
+count as zero, larger ones land in the last bucket), so every sketch of a
+given accuracy has the same shape and merging is an array addition.
+"""
+
+from typing import Optional, Sequence, Union
+
+import numpy as np
+from scipy import stats
+from sklearn.preprocessing import RobustScaler
+
+import config
+
+MIN_VALUE = 1e-9
+MAX_VALUE = 1e12
+
+
+class QuantileSketch:
+    """Relative-error quantile sketch over the columns of 2-D arrays"""
+
+    def __init__(self, n_columns: int = 1, relative_accuracy: Optional[float] = None):
+        """
+        Args:
+            n_columns: Columns of the arrays passed to update
+            relative_accuracy: Relative error of every quantile
+                               (default: config.QUANTILE_SKETCH_ACCURACY)
+        """
+        self.relative_accuracy = relative_accuracy or config.QUANTILE_SKETCH_ACCURACY
+        self.n_columns = n_columns
+        self._gamma = (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+        self._log_gamma = np.log(self._gamma)
+        self._min_key = int(np.ceil(np.log(MIN_VALUE) / self._log_gamma))
+        n_keys = int(np.ceil(np.log(MAX_VALUE) / self._log_gamma)) - self._min_key + 1
+        self._positive = np.zeros((n_columns, n_keys), dtype=np.int64)
+        self._negative = np.zeros((n_columns, n_keys), dtype=np.int64)
+        self._zero = np.zeros(n_columns, dtype=np.int64)
+
+    @property
+    def count(self) -> np.ndarray:
+        """Values seen per column (NaN excluded)"""
+        return self._zero + self._positive.sum(axis=1) + self._negative.sum(axis=1)
+
+    def update(self, values: Union[np.ndarray, Sequence]) -> 'QuantileSketch':
+        """Add the rows of a (rows, n_columns) array (or the values of a 1-column sketch); NaN is skipped"""
+        X = np.asarray(values, dtype=np.float64).reshape(-1, self.n_columns)
+        n_keys = self._positive.shape[1]
+        columns = np.broadcast_to(np.arange(self.n_columns), X.shape)
+        positive, negative = X > MIN_VALUE, X < -MIN_VALUE
+        self._zero += (~np.isnan(X) & ~positive & ~negative).sum(axis=0)
+        for store, mask in ((self._positive, positive), (self._negative, negative)):
+            keys = np.ceil(np.log(np.abs(X[mask])) / self._log_gamma).astype(np.int64) - self._min_key
+            flat = columns[mask] * n_keys + np.clip(keys, 0, n_keys - 1)
+            store += np.bincount(flat, minlength=store.size).reshape(store.shape)
+        return self
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        """Add another sketch's counts (same columns and accuracy)"""
+        if other.relative_accuracy != self.relative_accuracy or other.n_columns != self.n_columns:
+            raise ValueError("Only sketches with the same columns and accuracy can be merged")
+        self._positive += other._positive
+        self._negative += other._negative
+        self._zero += other._zero
+        return self
+
+    def quantile(self, q: float) -> np.ndarray:
+        """
+        q-quantile of every column, interpolated between order statistics like
+        pandas/numpy (linear); NaN for columns without values
+        """
+        # Buckets in value order: negatives from the largest magnitude, zero, positives
+        counts = np.concatenate([self._negative[:, ::-1], self._zero[:, None], self._positive], axis=1)
+        cumulative = np.cumsum(counts, axis=1)
+        n_keys = self._positive.shape[1]
+        magnitudes = 2 * self._gamma ** (np.arange(n_keys) + self._min_key) / (self._gamma + 1)
+        values = np.concatenate([-magnitudes[::-1], [0.0], magnitudes])
+
+        result = np.full(self.n_columns, np.nan)
+        for col in range(self.n_columns):
+            n = cumulative[col, -1]
+            if n == 0:
+                continue
+            rank = q * (n - 1)
+            lower, upper = np.searchsorted(cumulative[col], [np.floor(rank), np.ceil(rank)], side='right')
+            fraction = rank - np.floor(rank)
+            result[col] = values[lower] + fraction * (values[upper] - values[lower])
+        return result
+
+
+class SketchRobustScaler(RobustScaler):
+    """
+    RobustScaler whose center and scale come from a QuantileSketch
+
+    partial_fit can be called per day file and scalers fitted by different
+    workers merged, so fitting needs one chunk in memory. center_ and scale_
+    are within the sketch's relative accuracy of RobustScaler's. Saved models
+    should use to_robust_scaler(), which needs no training code to load.
+    """
+
+    def __init__(self, *, with_centering=True, with_scaling=True, quantile_range=(25.0, 75.0),
+                 copy=True, unit_variance=False, relative_accuracy=None):
+        super().__init__(with_centering=with_centering, with_scaling=with_scaling,
+                         quantile_range=quantile_range, copy=copy, unit_variance=unit_variance)
+        self.relative_accuracy = relative_accuracy
+
+    def fit(self, X, y=None):
+        if hasattr(self, 'sketch_'):
+            del self.sketch_
+        return self.partial_fit(X)
+
+    def partial_fit(self, X, y=None):
+        X = np.asarray(X, dtype=np.float64)
+        if not hasattr(self, 'sketch_'):
+            self.sketch_ = QuantileSketch(X.shape[1], self.relative_accuracy)
+        self.sketch_.update(X)
+        return self._set_from_sketch()
+
+    def merge(self, other: 'SketchRobustScaler') -> 'SketchRobustScaler':
+        self.sketch_.merge(other.sketch_)
+        return self._set_from_sketch()
+
+    def _set_from_sketch(self):
+        q_min, q_max = self.quantile_range
+        if not 0 <= q_min <= q_max <= 100:
+            raise ValueError(f"Invalid quantile range: {self.quantile_range}")
+        self.n_features_in_ = self.sketch_.n_columns
+        self.center_ = self.sketch_.quantile(0.5) if self.with_centering else None
+        if self.with_scaling:
+            scale = self.sketch_.quantile(q_max / 100) - self.sketch_.quantile(q_min / 100)
+            # Same as RobustScaler: a zero range leaves the feature unscaled
+            scale[scale < 10 * np.finfo(scale.dtype).eps] = 1.0
+            if self.unit_variance:
+                scale = scale / (stats.norm.ppf(q_max / 100) - stats.norm.ppf(q_min / 100))
+            self.scale_ = scale
+        else:
+            self.scale_ = None
+        return self
+
+    def to_robust_scaler(self) -> RobustScaler:
+        """A plain fitted RobustScaler with this scaler's center and scale"""
+        scaler = RobustScaler(with_centering=self.with_centering, with_scaling=self.with_scaling,
+                              quantile_range=self.quantile_range, copy=self.copy,
+                              unit_variance=self.unit_variance)
+        scaler.n_features_in_ = self.n_features_in_
+        scaler.center_ = self.center_
+        scaler.scale_ = self.scale_
+        return scaler
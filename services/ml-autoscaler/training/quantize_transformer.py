@@ -0,0 +1,204 @@
+"""
+Post-training quantization of the per-service transformer models
+
+For every service model saved by transformer_per_service.py this exports
+int8 (dynamic-range) and float16 TFLite variants and compares them with the
+float32 Keras model on the service's held-out test sequences (same day-based
+split as training):
+
+1. Exact and within-1 accuracy, agreement with float32 predictions
+2. Single-sequence latency p50/p99 (one service window per call, as served)
+3. Resident memory of a fresh process serving only that variant
+
+The served global transformer (transformer_model.keras) can be quantized as
+well; K8sAutoScalingPredictor loads it with quantization='int8'/'float16'
+(MODEL_QUANTIZATION in the deployment).
+
+Usage:
+    python quantize_transformer.py
+    python quantize_transformer.py --services order product --variants int8
+    python quantize_transformer.py --served-model-dir ../models
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import resource
+import sys
+import time
+from pathlib import Path
+
+import joblib
+import keras
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import config
+from data_preprocessor import DataPreprocessor
+from quantization import QUANTIZATION_VARIANTS, TFLiteModel, save_quantized_model
+from transformer_per_service import (
+    MIN_REPLICA, ServiceTransformer, load_per_service_data, split_service_data
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _current_rss_mb():
+    """Current resident set size of this process"""
+    with open('/proc/self/statm') as f:
+        pages = int(f.read().split()[1])
+    return pages * resource.getpagesize() / (1024 ** 2)
+
+
+def _benchmark_variant(model_path, X_test, latency_samples):
+    """
+    Load one variant in a fresh process and measure predictions, latency and memory
+
+    Runs in a spawned worker so resident memory reflects this variant only.
+    """
+    model_path = Path(model_path)
+    rss_before = _current_rss_mb()
+    if model_path.suffix == '.tflite':
+        model = TFLiteModel(model_path)
+    else:
+        model = keras.models.load_model(model_path, compile=False)
+    rss_loaded = _current_rss_mb()
+
+    # Accuracy pass over the whole test set
+    probs = np.concatenate([
+        np.asarray(model.predict_on_batch(X_test[start:start + 256]))
+        for start in range(0, len(X_test), 256)
+    ])
+    predictions = np.argmax(probs, axis=1) + MIN_REPLICA
+
+    # Latency: one window per call after warm-up
+    windows = X_test[:latency_samples]
+    for window in windows[:10]:
+        model.predict_on_batch(window[np.newaxis])
+    latencies = []
+    for window in windows:
+        start = time.perf_counter()
+        model.predict_on_batch(window[np.newaxis])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'predictions': predictions,
+        'latency_p50_ms': float(np.percentile(latencies, 50)),
+        'latency_p99_ms': float(np.percentile(latencies, 99)),
+        'model_rss_mb': float(rss_loaded - rss_before),
+        'peak_rss_mb': float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+    }
+
+
+def quantize_service(service, model_dir, X_test_seq, y_test_seq, variants, latency_samples, pool_context):
+    """Quantize one service model and compare every variant with float32"""
+    keras_path = model_dir / f'transformer_model_{service}.keras'
+    keras_model = keras.models.load_model(keras_path, compile=False)
+
+    paths = {'float32': keras_path}
+    for variant in variants:
+        paths[variant] = save_quantized_model(keras_model, model_dir, f'transformer_model_{service}', variant)
+
+    results = {}
+    for variant, path in paths.items():
+        with pool_context.Pool(1) as pool:
+            result = pool.apply(_benchmark_variant, (str(path), X_test_seq, latency_samples))
+        predictions = result['predictions']
+        result['size_kb'] = path.stat().st_size / 1024
+        result['exact_accuracy'] = float(np.mean(predictions == y_test_seq))
+        result['within_1_accuracy'] = float(np.mean(np.abs(predictions - y_test_seq) <= 1))
+        results[variant] = result
+
+    baseline = results['float32']['predictions']
+    for variant, result in results.items():
+        result['agreement_with_float32'] = float(np.mean(result.pop('predictions') == baseline))
+
+    return results
+
+
+def quantize_served_model(served_model_dir, variants):
+    """Quantize the global transformer served by K8sAutoScalingPredictor"""
+    from inference import GetItem, PositionalEncoding, TransformerDecoderBlock
+
+    model_path = Path(served_model_dir) / 'transformer_model.keras'
+    custom_objects = {
+        'PositionalEncoding': PositionalEncoding,
+        'TransformerDecoderBlock': TransformerDecoderBlock,
+        'GetItem': GetItem
+    }
+    model = keras.models.load_model(model_path, custom_objects=custom_objects, compile=False)
+    for variant in variants:
+        save_quantized_model(model, served_model_dir, 'transformer_model', variant)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quantize per-service transformer models')
+    parser.add_argument('--model-dir', default=str(Path(config.MODEL_OUTPUT_DIR) / 'transformer'),
+                        help='Directory with transformer_model_<service>.keras')
+    parser.add_argument('--services', nargs='+', default=config.SERVICES, help='Services to quantize')
+    parser.add_argument('--variants', nargs='+', default=list(QUANTIZATION_VARIANTS),
+                        choices=QUANTIZATION_VARIANTS, help='Quantization variants')
+    parser.add_argument('--latency-samples', type=int, default=500,
+                        help='Test windows timed one at a time per variant')
+    parser.add_argument('--served-model-dir', default=None,
+                        help='Also quantize <dir>/transformer_model.keras for the predictor')
+    parser.add_argument('--output', default=None, help='Report path (default: <model-dir>/quantization_report.json)')
+    args = parser.parse_args()
+
+    model_dir = Path(args.model_dir)
+    output_path = Path(args.output) if args.output else model_dir / 'quantization_report.json'
+
+    logger.info("="*80)
+    logger.info("POST-TRAINING QUANTIZATION (TRANSFORMER PER SERVICE)")
+    logger.info("="*80)
+    logger.info(f"Variants: float32 (baseline), {', '.join(args.variants)}")
+
+    # Rebuild the held-out test sequences exactly as training did
+    preprocessor = DataPreprocessor()
+    X_no_service, y, service_names = load_per_service_data(preprocessor)
+
+    pool_context = multiprocessing.get_context('spawn')
+    report = {'variants': ['float32'] + list(args.variants), 'services': {}}
+
+    for service in args.services:
+        keras_path = model_dir / f'transformer_model_{service}.keras'
+        scaler_path = model_dir / f'transformer_scaler_{service}.joblib'
+        if not keras_path.exists() or not scaler_path.exists():
+            logger.warning(f"[{service}] No trained model in {model_dir} - SKIPPING")
+            continue
+
+        mask = service_names == service
+        _, _, _, _, X_test, y_test = split_service_data(X_no_service.values[mask], y.values[mask])
+
+        scaler = joblib.load(scaler_path)
+        sequencer = ServiceTransformer(service, n_features=X_no_service.shape[1])
+        X_test_seq, y_test_seq = sequencer.create_sequences(scaler.transform(X_test), y_test)
+        X_test_seq = X_test_seq.astype(np.float32)
+        logger.info(f"[{service}] Test sequences: {X_test_seq.shape}")
+
+        results = quantize_service(service, model_dir, X_test_seq, y_test_seq,
+                                   args.variants, args.latency_samples, pool_context)
+        results['test_samples'] = int(len(y_test_seq))
+        report['services'][service] = results
+
+        for variant in report['variants']:
+            r = results[variant]
+            logger.info(f"  {variant:8s}: Exact={r['exact_accuracy']:.1%}, Within-1={r['within_1_accuracy']:.1%}, "
+                        f"Agree={r['agreement_with_float32']:.1%}, p50={r['latency_p50_ms']:.2f}ms, "
+                        f"p99={r['latency_p99_ms']:.2f}ms, RSS={r['peak_rss_mb']:.0f}MB "
+                        f"(model {r['model_rss_mb']:.1f}MB), Size={r['size_kb']:.0f}KB")
+
+    if args.served_model_dir:
+        logger.info(f"Quantizing served model in {args.served_model_dir}")
+        quantize_served_model(args.served_model_dir, args.variants)
+
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Report saved to {output_path}")
+
+
+if __name__ == '__main__':
+    main()
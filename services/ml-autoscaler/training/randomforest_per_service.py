@@ -24,11 +24,16 @@ import matplotlib
 matplotlib.use('Agg')  # Non-interactive backend to avoid tkinter issues
 import matplotlib.pyplot as plt
 
+import argparse
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 import config
 from data_preprocessor import DataPreprocessor
+from feature_manifest import FEATURE_MANIFEST_FILE, build_feature_manifest, save_feature_manifest
+from feature_shards import load_training_shards
+from parallel_training import train_services
+from window_features import RANDOM_FOREST_WINDOW_LAYOUT, window_features
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -44,15 +49,18 @@ MAX_REPLICA = 5
 class ServiceRandomForest:
     """Random Forest classifier with optimizations from research"""
     
-    def __init__(self, service_name, n_features=24, sequence_length=30):
+    def __init__(self, service_name, n_features=24, sequence_length=30, n_jobs=-1):
         """
         Args:
             sequence_length: Window size for feature extraction (30 = 15 minutes)
                             Increased from 20 for more context and better accuracy
+            n_jobs: Tree-building threads (-1: all cores; capped per worker in
+                    parallel training)
         """
         self.service_name = service_name
         self.n_features = n_features
         self.sequence_length = sequence_length
+        self.n_jobs = n_jobs
         self.scaler = RobustScaler()  # RobustScaler for outlier resilience
         self.model = None
         self.history = {'train_accuracy': [], 'val_accuracy': [], 'oob_scores': []}
@@ -62,39 +70,9 @@ class ServiceRandomForest:
         Create enhanced features from sequences
         Statistical aggregations over sliding window (RF autoscaler paper approach)
         """
-        features = []
-        targets = []
-        
-        for i in range(self.sequence_length, len(X)):
-            window = X[i-self.sequence_length:i]
-            feat = []
-            
-            # 1. Current values (last timestep)
-            feat.extend(X[i-1])
-            
-            # 2. Statistical aggregations
-            feat.extend(np.mean(window, axis=0))  # Mean
-            feat.extend(np.std(window, axis=0))  # Std (volatility)
-            feat.extend(np.min(window, axis=0))  # Min
-            feat.extend(np.max(window, axis=0))  # Max
-            
-            # 3. Percentile features (p25, p75 for robust range)
-            feat.extend(np.percentile(window, 25, axis=0))
-            feat.extend(np.percentile(window, 75, axis=0))
-            
-            # 4. Trend (last - first)
-            feat.extend(X[i-1] - X[i-self.sequence_length])
-            
-            # 5. Recent vs older comparison (detect acceleration)
-            half_point = self.sequence_length // 2
-            recent_mean = np.mean(window[half_point:], axis=0)
-            older_mean = np.mean(window[:half_point], axis=0)
-            feat.extend(recent_mean - older_mean)
-            
-            features.append(feat)
-            targets.append(y[i])
-        
-        return np.array(features), np.array(targets)
+        # Window k covers X[k:k + w] and is labelled y[k + w]; the last window has no label
+        features = window_features(X, RANDOM_FOREST_WINDOW_LAYOUT, self.sequence_length)[:-1]
+        return features, np.asarray(y)[self.sequence_length:]
     
     def build_model(self, class_weights=None):
         """
@@ -113,7 +91,7 @@ class ServiceRandomForest:
             max_features='sqrt',  # sqrt(n_features) for diversity
             class_weight=class_weight_dict,
             random_state=config.RANDOM_STATE,
-            n_jobs=-1,  # Use all CPU cores
+            n_jobs=self.n_jobs,  # All CPU cores by default
             oob_score=True,  # OOB validation
             max_samples=0.8,  # Bootstrap sampling ratio (improves diversity)
             verbose=0
@@ -334,8 +312,7 @@ def plot_all_services(results, plots_dir):
         if service not in results:
             continue
         
-        model = results[service]['model']
-        importance = model.model.feature_importances_
+        importance = results[service]['feature_importance']
         
         # Get top 20 features
         top_idx = np.argsort(importance)[-20:]
@@ -404,7 +381,124 @@ def plot_all_services(results, plots_dir):
     plt.close()
 
 
+def train_service(service, X_service, y_service, threads=-1, model_dir=None):
+    """
+    Split, scale, train, evaluate and save one service's Random Forest model
+    
+    Called by parallel_training.train_services, possibly in a worker process
+    (X_service and y_service memory-mapped). Returns the service's results
+    entry, or None if the service is skipped.
+    """
+    logger.info(f"\n{'='*70}")
+    logger.info(f"SERVICE: {service.upper()}")
+    logger.info(f"{'='*70}")
+    
+    unique_replicas = np.unique(y_service)
+    if len(unique_replicas) == 1:
+        logger.warning(f"[{service}] Only 1 replica value - SKIPPING")
+        return None
+    
+    if len(X_service) < 100:
+        logger.warning(f"[{service}] Only {len(X_service)} samples - SKIPPING")
+        return None
+    
+    logger.info(f"[{service}] Samples: {len(X_service)}")
+    logger.info(f"[{service}] Replica distribution: {dict(zip(*np.unique(y_service, return_counts=True)))}")
+    
+    # IMPROVED: Split by DAYS instead of by samples
+    # This ensures test set contains complete days with full replica distribution
+    # Assuming ~1700 samples per service per day (12000 rows / 7 services)
+    samples_per_day = 1700
+    total_days = len(X_service) // samples_per_day
+    
+    if total_days >= 10:
+        # Use last 20% of DAYS as test (at least 2 days)
+        test_days = max(2, int(total_days * 0.2))
+        test_start_idx = len(X_service) - (test_days * samples_per_day)
+        
+        X_train_val = X_service[:test_start_idx]
+        y_train_val = y_service[:test_start_idx]
+        X_test = X_service[test_start_idx:]
+        y_test = y_service[test_start_idx:]
+    else:
+        # Fallback to 80/20 split if not enough days
+        test_split_idx = int(len(X_service) * 0.8)
+        X_train_val = X_service[:test_split_idx]
+        y_train_val = y_service[:test_split_idx]
+        X_test = X_service[test_split_idx:]
+        y_test = y_service[test_split_idx:]
+    
+    # TimeSeriesSplit for train/val (5 folds for more robust validation)
+    n_splits = 5
+    tscv = TimeSeriesSplit(n_splits=n_splits)
+    
+    for train_idx, val_idx in tscv.split(X_train_val):
+        X_train = X_train_val[train_idx]
+        y_train = y_train_val[train_idx]
+        X_val = X_train_val[val_idx]
+        y_val = y_train_val[val_idx]
+    
+    # Log test set replica distribution
+    test_replica_dist = dict(zip(*np.unique(y_test, return_counts=True)))
+    logger.info(f"[{service}] Train: {len(X_train)}, Val: {len(X_val)}, Test: {len(X_test)}")
+    logger.info(f"[{service}] Test set replica distribution: {test_replica_dist}")
+    
+    # Create model
+    model = ServiceRandomForest(service, n_features=X_service.shape[1], n_jobs=threads)
+    
+    # Scale data
+    X_train_scaled = model.scaler.fit_transform(X_train)
+    X_val_scaled = model.scaler.transform(X_val)
+    X_test_scaled = model.scaler.transform(X_test)
+    
+    # Create features from sequences
+    X_train_feat, y_train_feat = model.create_features(X_train_scaled, y_train)
+    X_val_feat, y_val_feat = model.create_features(X_val_scaled, y_val)
+    X_test_feat, y_test_feat = model.create_features(X_test_scaled, y_test)
+    
+    logger.info(f"[{service}] Features shape - Train: {X_train_feat.shape}, Val: {X_val_feat.shape}, Test: {X_test_feat.shape}")
+    
+    # No class weights - natural distribution learning (prevents overfitting)
+    # Enhanced features for better performance
+    
+    # Train
+    logger.info(f"[{service}] Training...")
+    model.train(X_train_feat, y_train_feat, X_val_feat, y_val_feat, class_weights=None)
+    
+    # Evaluate
+    metrics = model.evaluate(X_test_feat, y_test_feat)
+    predictions = model.predict(X_test_feat)
+    
+    logger.info(f"[{service}] Results:")
+    logger.info(f"  Exact Accuracy: {metrics['exact_accuracy']:.1%}")
+    logger.info(f"  Within-1 Accuracy: {metrics['within_1_accuracy']:.1%}")
+    logger.info(f"  MAE: {metrics['mae']:.3f}")
+    logger.info(f"  RMSE: {metrics['rmse']:.3f}")
+    logger.info(f"  R²: {metrics['r2']:.3f}")
+    
+    # Save model
+    model.save_model(model_dir)
+    logger.info(f"[{service}] Model saved")
+    
+    return {
+        'feature_importance': model.model.feature_importances_,
+        'history': model.history,
+        'metrics': metrics,
+        'y_test': y_test_feat,
+        'predictions': predictions
+    }
+
+
 def main():
+    parser = argparse.ArgumentParser(description='Train per-service Random Forest models')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Services trained in parallel (default: config.TRAINING_WORKERS, '
+                             'else one per service up to the CPU count)')
+    parser.add_argument('--shards', default=None,
+                        help='Train from unscaled shards of feature_shards.py --no-scale '
+                             'instead of the metrics folder')
+    args = parser.parse_args()
+    
     logger.info("="*80)
     logger.info("TRAINING RANDOM FOREST MODEL PER SERVICE (OPTIMIZED)")
     logger.info("="*80)
@@ -423,142 +517,50 @@ def main():
     
     # Load data
     logger.info("[1/3] Loading data...")
-    preprocessor = DataPreprocessor()
-    
-    if Path('../metrics/filtered').exists():
-        data_path = '../metrics/filtered'
+    if args.shards:
+        # Same rows and columns, unscaled; train_service splits and scales as below
+        logger.info(f"Using shards from: {args.shards}")
+        feature_columns, data = load_training_shards(args.shards)
     else:
-        data_path = 'metrics/filtered' if Path('metrics/filtered').exists() else '../metrics'
-    
-    logger.info(f"Using data from: {data_path}")
-    
-    data = preprocessor.load_local_folder(data_path)
-    data_clean = preprocessor.clean_data(data)
-    data_features = preprocessor.engineer_features(data_clean)
-    
-    y = data_features['replica_count'].astype(int)
-    service_names = data_features['service_name'].values
-    
-    X, _ = preprocessor.prepare_features_and_target(
-        preprocessor.create_target_labels(data_features)
-    )
-    
-    service_cols = [col for col in X.columns if col.startswith('service_')]
-    X_no_service = X.drop(columns=service_cols)
-    
-    logger.info(f"Total samples: {len(X)}")
-    logger.info(f"Features per service: {X_no_service.shape[1]}")
-    logger.info(f"Services: {config.SERVICES}\n")
-    
-    # Train model for each service
-    logger.info("[2/3] Training per-service Random Forest models...")
-    results = {}
-    all_metrics = {}
-    
-    for service in config.SERVICES:
-        logger.info(f"\n{'='*70}")
-        logger.info(f"SERVICE: {service.upper()}")
-        logger.info(f"{'='*70}")
+        preprocessor = DataPreprocessor()
         
-        mask = service_names == service
-        X_service = X_no_service.values[mask]
-        y_service = y.values[mask]
+        if Path('../metrics/filtered').exists():
+            data_path = '../metrics/filtered'
+        else:
+            data_path = 'metrics/filtered' if Path('metrics/filtered').exists() else '../metrics'
         
-        unique_replicas = np.unique(y_service)
-        if len(unique_replicas) == 1:
-            logger.warning(f"[{service}] Only 1 replica value - SKIPPING")
-            continue
+        logger.info(f"Using data from: {data_path}")
         
-        if len(X_service) < 100:
-            logger.warning(f"[{service}] Only {len(X_service)} samples - SKIPPING")
-            continue
+        # Cleaned and engineered per day in compact dtypes; unchanged days come from <data_path>/feature_cache
+        data_features = preprocessor.load_engineered_folder(data_path, lean=True)
         
-        logger.info(f"[{service}] Samples: {len(X_service)}")
-        logger.info(f"[{service}] Replica distribution: {dict(zip(*np.unique(y_service, return_counts=True)))}")
+        y = data_features['replica_count'].astype(int)
+        service_names = data_features['service_name'].values
         
-        # IMPROVED: Split by DAYS instead of by samples
-        # This ensures test set contains complete days with full replica distribution
-        # Assuming ~1700 samples per service per day (12000 rows / 7 services)
-        samples_per_day = 1700
-        total_days = len(X_service) // samples_per_day
+        X, _ = preprocessor.prepare_features_and_target(
+            preprocessor.create_target_labels(data_features)
+        )
         
-        if total_days >= 10:
-            # Use last 20% of DAYS as test (at least 2 days)
-            test_days = max(2, int(total_days * 0.2))
-            test_start_idx = len(X_service) - (test_days * samples_per_day)
-            
-            X_train_val = X_service[:test_start_idx]
-            y_train_val = y_service[:test_start_idx]
-            X_test = X_service[test_start_idx:]
-            y_test = y_service[test_start_idx:]
-        else:
-            # Fallback to 80/20 split if not enough days
-            test_split_idx = int(len(X_service) * 0.8)
-            X_train_val = X_service[:test_split_idx]
-            y_train_val = y_service[:test_split_idx]
-            X_test = X_service[test_split_idx:]
-            y_test = y_service[test_split_idx:]
-        
-        # TimeSeriesSplit for train/val (5 folds for more robust validation)
-        n_splits = 5
-        tscv = TimeSeriesSplit(n_splits=n_splits)
-        
-        for train_idx, val_idx in tscv.split(X_train_val):
-            X_train = X_train_val[train_idx]
-            y_train = y_train_val[train_idx]
-            X_val = X_train_val[val_idx]
-            y_val = y_train_val[val_idx]
-        
-        # Log test set replica distribution
-        test_replica_dist = dict(zip(*np.unique(y_test, return_counts=True)))
-        logger.info(f"[{service}] Train: {len(X_train)}, Val: {len(X_val)}, Test: {len(X_test)}")
-        logger.info(f"[{service}] Test set replica distribution: {test_replica_dist}")
-        
-        # Create model
-        model = ServiceRandomForest(service, n_features=X_no_service.shape[1])
-        
-        # Scale data
-        X_train_scaled = model.scaler.fit_transform(X_train)
-        X_val_scaled = model.scaler.transform(X_val)
-        X_test_scaled = model.scaler.transform(X_test)
-        
-        # Create features from sequences
-        X_train_feat, y_train_feat = model.create_features(X_train_scaled, y_train)
-        X_val_feat, y_val_feat = model.create_features(X_val_scaled, y_val)
-        X_test_feat, y_test_feat = model.create_features(X_test_scaled, y_test)
-        
-        logger.info(f"[{service}] Features shape - Train: {X_train_feat.shape}, Val: {X_val_feat.shape}, Test: {X_test_feat.shape}")
-        
-        # No class weights - natural distribution learning (prevents overfitting)
-        # Enhanced features for better performance
-        
-        # Train
-        logger.info(f"[{service}] Training...")
-        model.train(X_train_feat, y_train_feat, X_val_feat, y_val_feat, class_weights=None)
-        
-        # Evaluate
-        metrics = model.evaluate(X_test_feat, y_test_feat)
-        predictions = model.predict(X_test_feat)
-        
-        logger.info(f"[{service}] Results:")
-        logger.info(f"  Exact Accuracy: {metrics['exact_accuracy']:.1%}")
-        logger.info(f"  Within-1 Accuracy: {metrics['within_1_accuracy']:.1%}")
-        logger.info(f"  MAE: {metrics['mae']:.3f}")
-        logger.info(f"  RMSE: {metrics['rmse']:.3f}")
-        logger.info(f"  R²: {metrics['r2']:.3f}")
-        
-        # Save model
-        model.save_model(model_dir)
-        logger.info(f"[{service}] Model saved")
-        
-        results[service] = {
-            'model': model,
-            'history': model.history,
-            'metrics': metrics,
-            'y_test': y_test_feat,
-            'predictions': predictions
-        }
-        all_metrics[service] = metrics
+        service_cols = [col for col in X.columns if col.startswith('service_')]
+        X_no_service = X.drop(columns=service_cols)
+        feature_columns = list(X_no_service.columns)
+        
+        data = {}
+        for service in config.SERVICES:
+            mask = service_names == service
+            data[service] = (X_no_service.values[mask], y.values[mask])
+    
+    # Per-service models see the same ordered columns; inference compiles this manifest
+    save_feature_manifest(build_feature_manifest(feature_columns), model_dir / FEATURE_MANIFEST_FILE)
+    
+    logger.info(f"Total samples: {sum(len(y_service) for _, y_service in data.values())}")
+    logger.info(f"Features per service: {len(feature_columns)}")
+    logger.info(f"Services: {config.SERVICES}\n")
+    
+    # Train model for each service
+    logger.info("[2/3] Training per-service Random Forest models...")
+    results = train_services(train_service, data, workers=args.workers, model_dir=model_dir)
+    all_metrics = {service: result['metrics'] for service, result in results.items()}
     
     # Save metrics and plots
     logger.info("\n[3/3] Generating plots and saving metrics...")
@@ -13,10 +13,15 @@ Key optimizations:
 
 Architecture: Multi-head attention with position encoding
 Goal: Maximum accuracy without data leakage
+
+Usage:
+    python transformer_per_service.py
+    python transformer_per_service.py --rotary   # rotary/banded variant for incremental serving
 """
 
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import tensorflow as tf
 import keras
 from keras import layers, models, callbacks, optimizers
@@ -27,6 +32,7 @@ import joblib
 import logging
 from pathlib import Path
 import json
+import argparse
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
@@ -37,6 +43,10 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 import config
 from data_preprocessor import DataPreprocessor
+from feature_manifest import FEATURE_MANIFEST_FILE, build_feature_manifest, save_feature_manifest
+from feature_shards import load_training_shards
+from incremental_transformer import build_rotary_transformer, check_incremental_equivalence
+from parallel_training import train_services
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -99,11 +109,39 @@ class WarmupCosineDecay(keras.optimizers.schedules.LearningRateSchedule):
         }
 
 
+class WindowBatches(keras.utils.PyDataset):
+    """
+    Batches of create_sequences windows for predict
+    
+    Windows are a strided view of the scaled rows; each batch is copied out
+    of it (as float32) only when Keras asks for it, so a full set of windows
+    is never materialized. Training goes through window_dataset instead.
+    """
+    
+    def __init__(self, windows, batch_size=64, **kwargs):
+        super().__init__(**kwargs)
+        self.windows = windows
+        self.batch_size = batch_size
+    
+    def __len__(self):
+        return math.ceil(len(self.windows) / self.batch_size)
+    
+    def __getitem__(self, index):
+        # Slicing stays a view; astype copies only this batch
+        return self.windows[index * self.batch_size:(index + 1) * self.batch_size].astype(np.float32)
+
+
 class ServiceTransformer:
     """Transformer for single service with research-based optimizations"""
     
     def __init__(self, service_name, n_features=27, sequence_length=30, d_model=64, 
-                 num_heads=4, dff=128, num_blocks=2, dropout=0.2, layer_dropout=0.0, stride=1):
+                 num_heads=4, dff=128, num_blocks=2, dropout=0.2, layer_dropout=0.0, stride=1,
+                 positional='absolute'):
+        """
+        Args:
+            positional: 'absolute' (sinusoidal encoding) or 'rotary' (rotary banded
+                        attention, servable incrementally; see incremental_transformer.py)
+        """
         self.service_name = service_name
         self.n_features = n_features
         self.sequence_length = sequence_length  # Increased to 30 (15 minutes) for more context
@@ -114,12 +152,28 @@ class ServiceTransformer:
         self.num_blocks = num_blocks
         self.dropout = dropout  # Reduced to 0.2 for higher accuracy
         self.layer_dropout = layer_dropout  # Disabled (0.0) to maximize accuracy
+        self.positional = positional
         self.scaler = RobustScaler()  # RobustScaler for outlier resilience
         self.model = None
         self.history = None
     
     def build_model(self):
         """Build transformer with optimizations from research papers"""
+        if self.positional == 'rotary':
+            self.model = build_rotary_transformer(
+                sequence_length=self.sequence_length,
+                n_features=self.n_features,
+                num_classes=NUM_CLASSES,
+                d_model=self.d_model,
+                num_heads=self.num_heads,
+                dff=self.dff,
+                num_blocks=self.num_blocks,
+                dropout=self.dropout,
+                name=f'transformer_{self.service_name}'
+            )
+            logger.info(f"[{self.service_name}] Rotary model built: {self.model.count_params():,} params")
+            return self.model
+        
         inputs = layers.Input(shape=(self.sequence_length, self.n_features), name='sequence_input')
         
         # Layer normalization before projection (Pre-LN Transformer)
@@ -199,18 +253,49 @@ class ServiceTransformer:
         Create sequences for training with configurable stride
         Using stride > 1 reduces overlap and creates more independent samples
         This prevents artificial accuracy inflation from highly correlated test samples
+        
+        Window k is X[k*stride : k*stride + sequence_length] with target
+        y[k*stride + sequence_length]. Windows are a read-only strided view of X
+        (no copy, see WindowBatches); use np.ascontiguousarray to materialize.
         """
-        sequences = []
-        targets = []
+        X, y = np.asarray(X), np.asarray(y)
+        n_windows = len(X) - self.sequence_length
+        if n_windows <= 0:
+            return np.empty((0, self.sequence_length) + X.shape[1:], dtype=X.dtype), y[:0]
         
-        for i in range(0, len(X) - self.sequence_length, self.stride):
-            seq = X[i:i+self.sequence_length]
-            target = y[i+self.sequence_length]
-            
-            sequences.append(seq)
-            targets.append(target)
+        # sliding_window_view appends the window axis: (windows, features, time) -> (windows, time, features)
+        windows = sliding_window_view(X, self.sequence_length, axis=0)[:n_windows:self.stride]
+        return np.moveaxis(windows, -1, 1), y[self.sequence_length::self.stride]
+    
+    def num_windows(self, n_rows):
+        """Windows create_sequences cuts from n_rows rows"""
+        return max(0, -(-(n_rows - self.sequence_length) // self.stride))
+    
+    def window_dataset(self, X, y, batch_size=64, shuffle=False, seed=None):
+        """
+        tf.data pipeline of (window, one-hot target) batches cut from scaled rows
         
-        return np.array(sequences), np.array(targets)
+        Yields the windows and targets of create_sequences(X, y). Only the rows
+        (float32) and their one-hot targets are held; each batch of window start
+        indices is gathered into windows in a parallel map, and batches are
+        prefetched while the model trains. With shuffle, the window order is
+        reshuffled every epoch.
+        """
+        rows = tf.constant(np.asarray(X, dtype=np.float32))
+        targets = tf.constant(self.to_categorical(np.asarray(y)).astype(np.float32))
+        starts = np.arange(self.num_windows(len(X)), dtype=np.int64) * self.stride
+        offsets = tf.range(self.sequence_length, dtype=tf.int64)
+        
+        def gather(batch_starts):
+            windows = tf.gather(rows, batch_starts[:, tf.newaxis] + offsets)
+            return windows, tf.gather(targets, batch_starts + self.sequence_length)
+        
+        dataset = tf.data.Dataset.from_tensor_slices(starts)
+        if shuffle:
+            dataset = dataset.shuffle(len(starts), seed=seed, reshuffle_each_iteration=True)
+        return (dataset.batch(batch_size)
+                .map(gather, num_parallel_calls=tf.data.AUTOTUNE)
+                .prefetch(tf.data.AUTOTUNE))
     
     def to_categorical(self, y):
         """Convert replica values (1-5) to one-hot encoding"""
@@ -226,17 +311,19 @@ class ServiceTransformer:
         - Learning rate warmup + cosine decay
         - NO label smoothing for maximum accuracy
         - Gradient clipping for stability
+        
+        Takes the scaled rows and their replica counts, not windows: the
+        windows of create_sequences are cut from the rows batch by batch in a
+        tf.data pipeline (window_dataset).
         """
         if self.model is None:
             self.build_model()
         
-        # Convert targets to categorical
-        y_train_cat = self.to_categorical(y_train)
-        y_val_cat = self.to_categorical(y_val)
-        
         # Calculate warmup and total steps
         batch_size = 64
-        steps_per_epoch = len(X_train) // batch_size
+        train_data = self.window_dataset(X_train, y_train, batch_size=batch_size, shuffle=True)
+        val_data = self.window_dataset(X_val, y_val, batch_size=batch_size)
+        steps_per_epoch = self.num_windows(len(X_train)) // batch_size
         warmup_steps = steps_per_epoch * 5  # 5 epochs warmup
         total_steps = steps_per_epoch * 100  # 100 epochs max
         
@@ -282,10 +369,9 @@ class ServiceTransformer:
         # Note: Not using ReduceLROnPlateau because we have custom WarmupCosineDecay schedule
         
         self.history = self.model.fit(
-            X_train, y_train_cat,
-            validation_data=(X_val, y_val_cat),
+            train_data,
+            validation_data=val_data,
             epochs=100,
-            batch_size=batch_size,
             callbacks=[early_stop],
             verbose=0
         )
@@ -294,14 +380,14 @@ class ServiceTransformer:
     
     def predict(self, X):
         """Predict class with probability threshold"""
-        probs = self.model.predict(X, verbose=0)
+        probs = self.predict_proba(X)
         # Get class with highest probability
         predictions = np.argmax(probs, axis=1) + MIN_REPLICA  # Convert back to 1-5
         return predictions
     
     def predict_proba(self, X):
         """Get prediction probabilities"""
-        return self.model.predict(X, verbose=0)
+        return self.model.predict(WindowBatches(X, batch_size=256), verbose=0)
     
     def evaluate(self, X_test, y_test):
         """Evaluate model with per-class accuracy"""
@@ -525,7 +611,200 @@ def plot_all_services(results, plots_dir):
     plt.close()
 
 
+def load_per_service_data(preprocessor):
+    """
+    Load metrics and build the per-service feature matrix
+    
+    Returns:
+        X_no_service (DataFrame without service one-hot columns),
+        y (actual replica_count), service_names (array aligned with rows)
+    """
+    # Priority: balanced_v2 > filtered > raw metrics
+    if Path('metrics/balanced_v2').exists() or Path('../metrics/balanced_v2').exists():
+        data_path = 'metrics/balanced_v2' if Path('metrics/balanced_v2').exists() else '../metrics/balanced_v2'
+    elif Path('metrics/filtered').exists() or Path('../metrics/filtered').exists():
+        data_path = 'metrics/filtered' if Path('metrics/filtered').exists() else '../metrics/filtered'
+    else:
+        data_path = 'metrics' if Path('metrics').exists() else '../metrics'
+    
+    logger.info(f"Using data from: {data_path}")
+    
+    # Load and preprocess data (per day, compact dtypes; unchanged days come from <data_path>/feature_cache)
+    data_features = preprocessor.load_engineered_folder(data_path, lean=True)
+    
+    # Use actual replica_count as target (not computed target_replicas)
+    # This gives more meaningful accuracy metrics
+    y = data_features['replica_count'].astype(int)
+    service_names = data_features['service_name'].values
+    
+    # Prepare features
+    X, _ = preprocessor.prepare_features_and_target(
+        preprocessor.create_target_labels(data_features)
+    )
+    
+    # Remove service encoding columns from features (we train per-service)
+    service_cols = [col for col in X.columns if col.startswith('service_')]
+    X_no_service = X.drop(columns=service_cols)
+    
+    return X_no_service, y, service_names
+
+
+def split_service_data(X_service, y_service, samples_per_day=1700, n_splits=5):
+    """
+    Split one service's samples into train/val/test
+    
+    The last days are held out for test (split by DAYS instead of samples, same
+    as Random Forest & CatBoost); the last TimeSeriesSplit fold of the rest
+    gives train/val.
+    
+    Returns:
+        X_train, y_train, X_val, y_val, X_test, y_test
+    """
+    total_days = len(X_service) // samples_per_day
+    
+    if total_days >= 10:
+        test_days = max(2, int(total_days * 0.2))
+        test_start_idx = len(X_service) - (test_days * samples_per_day)
+        
+        X_train_val = X_service[:test_start_idx]
+        y_train_val = y_service[:test_start_idx]
+        X_test = X_service[test_start_idx:]
+        y_test = y_service[test_start_idx:]
+    else:
+        test_split_idx = int(len(X_service) * 0.8)
+        X_train_val = X_service[:test_split_idx]
+        y_train_val = y_service[:test_split_idx]
+        X_test = X_service[test_split_idx:]
+        y_test = y_service[test_split_idx:]
+    
+    # TimeSeriesSplit for train/val (5 folds for more robust validation)
+    tscv = TimeSeriesSplit(n_splits=n_splits)
+    
+    # Get the last fold as final train/val split
+    for train_idx, val_idx in tscv.split(X_train_val):
+        X_train = X_train_val[train_idx]
+        y_train = y_train_val[train_idx]
+        X_val = X_train_val[val_idx]
+        y_val = y_train_val[val_idx]
+    
+    return X_train, y_train, X_val, y_val, X_test, y_test
+
+
+def train_service(service, X_service, y_service, threads=-1, model_dir=None, positional='absolute'):
+    """
+    Split, scale, train, evaluate and save one service's Transformer model
+    
+    Called by parallel_training.train_services, possibly in a worker process
+    (X_service and y_service memory-mapped). Returns the service's results
+    entry, or None if the service is skipped. threads is not used here: TF's
+    thread pools are capped when the worker process starts.
+    """
+    logger.info(f"\n{'='*70}")
+    logger.info(f"SERVICE: {service.upper()}")
+    logger.info(f"{'='*70}")
+    
+    # Check if service has enough data and variance
+    unique_replicas = np.unique(y_service)
+    if len(unique_replicas) == 1:
+        logger.warning(f"[{service}] Only 1 replica value ({unique_replicas[0]}) - SKIPPING")
+        return None
+    
+    if len(X_service) < 100:
+        logger.warning(f"[{service}] Only {len(X_service)} samples - SKIPPING")
+        return None
+    
+    logger.info(f"[{service}] Samples: {len(X_service)}")
+    logger.info(f"[{service}] Replica distribution: {dict(zip(*np.unique(y_service, return_counts=True)))}")
+    
+    # IMPROVED: Split by DAYS instead of samples (same as Random Forest & CatBoost)
+    n_splits = 5
+    X_train, y_train, X_val, y_val, X_test, y_test = split_service_data(
+        X_service, y_service, n_splits=n_splits
+    )
+    
+    # Log test set replica distribution
+    test_replica_dist = dict(zip(*np.unique(y_test, return_counts=True)))
+    logger.info(f"[{service}] Cross-validation: {n_splits} folds (TimeSeriesSplit)")
+    logger.info(f"[{service}] Train: {len(X_train)}, Val: {len(X_val)}, Test: {len(X_test)}")
+    logger.info(f"[{service}] Test set replica distribution: {test_replica_dist}")
+    
+    # Create model
+    model = ServiceTransformer(service, n_features=X_service.shape[1], positional=positional)
+    
+    # Scale data
+    X_train_scaled = model.scaler.fit_transform(X_train)
+    X_val_scaled = model.scaler.transform(X_val)
+    X_test_scaled = model.scaler.transform(X_test)
+    
+    # Create sequences
+    X_train_seq, y_train_seq = model.create_sequences(X_train_scaled, y_train)
+    X_val_seq, y_val_seq = model.create_sequences(X_val_scaled, y_val)
+    X_test_seq, y_test_seq = model.create_sequences(X_test_scaled, y_test)
+    
+    # Optimized for research-based best practices
+    # AdamW + warmup + stochastic depth for better generalization
+    # Expected accuracy: ~85-90% (realistic without data leakage)
+    
+    logger.info(f"[{service}] Sequences (stride={model.stride}) - Train: {X_train_seq.shape}, Val: {X_val_seq.shape}, Test: {X_test_seq.shape}")
+    
+    # Log sequence creation details
+    original_samples = len(X_test) - model.sequence_length
+    strided_samples = len(X_test_seq)
+    overlap_pct = (model.sequence_length - model.stride) / model.sequence_length * 100
+    logger.info(f"[{service}] Stride={model.stride}: {strided_samples} sequences created, Overlap {overlap_pct:.0f}% (maximized samples)")
+    
+    # Train with optimized hyperparameters
+    logger.info(f"[{service}] Training...")
+    model.train(X_train_scaled, y_train, X_val_scaled, y_val, label_smoothing=0.0)
+    
+    # Evaluate
+    metrics = model.evaluate(X_test_seq, y_test_seq)
+    predictions = model.predict(X_test_seq)
+    
+    logger.info(f"[{service}] Results:")
+    logger.info(f"  Exact Accuracy: {metrics['exact_accuracy']:.1%}")
+    logger.info(f"  Within-1 Accuracy: {metrics['within_1_accuracy']:.1%}")
+    logger.info(f"  MAE: {metrics['mae']:.3f}")
+    logger.info(f"  RMSE: {metrics['rmse']:.3f}")
+    logger.info(f"  R²: {metrics['r2']:.3f}")
+    
+    if positional == 'rotary':
+        # Cached-state serving must reproduce full-window inference on held-out data
+        max_diff = check_incremental_equivalence(model.model, X_test_scaled[:1000])
+        metrics['incremental_max_diff'] = max_diff
+        logger.info(f"  Incremental vs full-window max diff: {max_diff:.2e}")
+    
+    # Save model
+    model.save_model(model_dir)
+    logger.info(f"[{service}] ✓ Model saved")
+    
+    # Store results
+    return {
+        'history': {
+            'loss': [float(x) for x in model.history.history['loss']],
+            'val_loss': [float(x) for x in model.history.history['val_loss']],
+            'accuracy': [float(x) for x in model.history.history['accuracy']],
+            'val_accuracy': [float(x) for x in model.history.history['val_accuracy']]
+        },
+        'metrics': metrics,
+        'y_test': y_test_seq,
+        'predictions': predictions
+    }
+
+
 def main():
+    parser = argparse.ArgumentParser(description='Train per-service transformer models')
+    parser.add_argument('--rotary', action='store_true',
+                        help='Train the rotary/banded-attention variant for incremental serving')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Services trained in parallel (default: config.TRAINING_WORKERS, '
+                             'else one per service up to the CPU count)')
+    parser.add_argument('--shards', default=None,
+                        help='Train from unscaled shards of feature_shards.py --no-scale '
+                             'instead of the metrics folder')
+    args = parser.parse_args()
+    positional = 'rotary' if args.rotary else 'absolute'
+    
     logger.info("="*80)
     logger.info("TRAINING TRANSFORMER MODEL PER SERVICE (RESEARCH-OPTIMIZED)")
     logger.info("="*80)
@@ -545,170 +824,40 @@ def main():
     device = "GPU" if tf.config.list_physical_devices('GPU') else "CPU"
     logger.info(f"Training device: {device}\n")
     
-    model_dir = Path(config.MODEL_OUTPUT_DIR) / 'transformer'
-    plots_dir = Path(config.PLOTS_OUTPUT_DIR) / 'transformer'
+    variant = 'transformer_rotary' if args.rotary else 'transformer'
+    model_dir = Path(config.MODEL_OUTPUT_DIR) / variant
+    plots_dir = Path(config.PLOTS_OUTPUT_DIR) / variant
+    logger.info(f"Positional encoding: {positional}")
     model_dir.mkdir(parents=True, exist_ok=True)
     plots_dir.mkdir(parents=True, exist_ok=True)
     
     # Load data - prioritize filtered data
     logger.info("[1/3] Loading data...")
-    preprocessor = DataPreprocessor()
-    
-    # Priority: balanced_v2 > filtered > raw metrics
-    if Path('metrics/balanced_v2').exists() or Path('../metrics/balanced_v2').exists():
-        data_path = 'metrics/balanced_v2' if Path('metrics/balanced_v2').exists() else '../metrics/balanced_v2'
-    elif Path('metrics/filtered').exists() or Path('../metrics/filtered').exists():
-        data_path = 'metrics/filtered' if Path('metrics/filtered').exists() else '../metrics/filtered'
+    if args.shards:
+        # Same rows and columns, unscaled; train_service splits (split_service_data) and scales as below
+        logger.info(f"Using shards from: {args.shards}")
+        feature_columns, data = load_training_shards(args.shards)
     else:
-        data_path = 'metrics' if Path('metrics').exists() else '../metrics'
-    
-    logger.info(f"Using data from: {data_path}")
-    
-    # Load and preprocess data
-    data = preprocessor.load_local_folder(data_path)
-    data_clean = preprocessor.clean_data(data)
-    data_features = preprocessor.engineer_features(data_clean)
-    
-    # Use actual replica_count as target (not computed target_replicas)
-    # This gives more meaningful accuracy metrics
-    y = data_features['replica_count'].astype(int)
-    service_names = data_features['service_name'].values
+        preprocessor = DataPreprocessor()
+        X_no_service, y, service_names = load_per_service_data(preprocessor)
+        feature_columns = list(X_no_service.columns)
+        
+        data = {}
+        for service in config.SERVICES:
+            mask = service_names == service
+            data[service] = (X_no_service.values[mask], y.values[mask])
     
-    # Prepare features
-    X, _ = preprocessor.prepare_features_and_target(
-        preprocessor.create_target_labels(data_features)
-    )
+    # Per-service models see the same ordered columns; inference compiles this manifest
+    save_feature_manifest(build_feature_manifest(feature_columns), model_dir / FEATURE_MANIFEST_FILE)
     
-    # Remove service encoding columns from features (we train per-service)
-    service_cols = [col for col in X.columns if col.startswith('service_')]
-    X_no_service = X.drop(columns=service_cols)
-    
-    logger.info(f"Total samples: {len(X)}")
-    logger.info(f"Features per service: {X_no_service.shape[1]} (removed service encoding)")
+    logger.info(f"Total samples: {sum(len(y_service) for _, y_service in data.values())}")
+    logger.info(f"Features per service: {len(feature_columns)} (removed service encoding)")
     logger.info(f"Services: {config.SERVICES}\n")
     
     # Train model for each service
     logger.info("[2/3] Training per-service models...")
-    results = {}
-    all_metrics = {}
-    
-    for service in config.SERVICES:
-        logger.info(f"\n{'='*70}")
-        logger.info(f"SERVICE: {service.upper()}")
-        logger.info(f"{'='*70}")
-        
-        # Filter data for this service
-        mask = service_names == service
-        X_service = X_no_service.values[mask]
-        y_service = y.values[mask]
-        
-        # Check if service has enough data and variance
-        unique_replicas = np.unique(y_service)
-        if len(unique_replicas) == 1:
-            logger.warning(f"[{service}] Only 1 replica value ({unique_replicas[0]}) - SKIPPING")
-            continue
-        
-        if len(X_service) < 100:
-            logger.warning(f"[{service}] Only {len(X_service)} samples - SKIPPING")
-            continue
-        
-        logger.info(f"[{service}] Samples: {len(X_service)}")
-        logger.info(f"[{service}] Replica distribution: {dict(zip(*np.unique(y_service, return_counts=True)))}")
-        
-        # IMPROVED: Split by DAYS instead of samples (same as Random Forest & CatBoost)
-        samples_per_day = 1700
-        total_days = len(X_service) // samples_per_day
-        
-        if total_days >= 10:
-            test_days = max(2, int(total_days * 0.2))
-            test_start_idx = len(X_service) - (test_days * samples_per_day)
-            
-            X_train_val = X_service[:test_start_idx]
-            y_train_val = y_service[:test_start_idx]
-            X_test = X_service[test_start_idx:]
-            y_test = y_service[test_start_idx:]
-        else:
-            test_split_idx = int(len(X_service) * 0.8)
-            X_train_val = X_service[:test_split_idx]
-            y_train_val = y_service[:test_split_idx]
-            X_test = X_service[test_split_idx:]
-            y_test = y_service[test_split_idx:]
-        
-        # TimeSeriesSplit for train/val (5 folds for more robust validation)
-        n_splits = 5
-        tscv = TimeSeriesSplit(n_splits=n_splits)
-        
-        # Get the last fold as final train/val split
-        for train_idx, val_idx in tscv.split(X_train_val):
-            X_train = X_train_val[train_idx]
-            y_train = y_train_val[train_idx]
-            X_val = X_train_val[val_idx]
-            y_val = y_train_val[val_idx]
-        
-        # Log test set replica distribution
-        test_replica_dist = dict(zip(*np.unique(y_test, return_counts=True)))
-        logger.info(f"[{service}] Cross-validation: {n_splits} folds (TimeSeriesSplit)")
-        logger.info(f"[{service}] Train: {len(X_train)}, Val: {len(X_val)}, Test: {len(X_test)}")
-        logger.info(f"[{service}] Test set replica distribution: {test_replica_dist}")
-        
-        # Create model
-        model = ServiceTransformer(service, n_features=X_no_service.shape[1])
-        
-        # Scale data
-        X_train_scaled = model.scaler.fit_transform(X_train)
-        X_val_scaled = model.scaler.transform(X_val)
-        X_test_scaled = model.scaler.transform(X_test)
-        
-        # Create sequences
-        X_train_seq, y_train_seq = model.create_sequences(X_train_scaled, y_train)
-        X_val_seq, y_val_seq = model.create_sequences(X_val_scaled, y_val)
-        X_test_seq, y_test_seq = model.create_sequences(X_test_scaled, y_test)
-        
-        # Optimized for research-based best practices
-        # AdamW + warmup + stochastic depth for better generalization
-        # Expected accuracy: ~85-90% (realistic without data leakage)
-        
-        logger.info(f"[{service}] Sequences (stride={model.stride}) - Train: {X_train_seq.shape}, Val: {X_val_seq.shape}, Test: {X_test_seq.shape}")
-        
-        # Log sequence creation details
-        original_samples = len(X_test) - model.sequence_length
-        strided_samples = len(X_test_seq)
-        overlap_pct = (model.sequence_length - model.stride) / model.sequence_length * 100
-        logger.info(f"[{service}] Stride={model.stride}: {strided_samples} sequences created, Overlap {overlap_pct:.0f}% (maximized samples)")
-        
-        # Train with optimized hyperparameters
-        logger.info(f"[{service}] Training...")
-        model.train(X_train_seq, y_train_seq, X_val_seq, y_val_seq, label_smoothing=0.0)
-        
-        # Evaluate
-        metrics = model.evaluate(X_test_seq, y_test_seq)
-        predictions = model.predict(X_test_seq)
-        
-        logger.info(f"[{service}] Results:")
-        logger.info(f"  Exact Accuracy: {metrics['exact_accuracy']:.1%}")
-        logger.info(f"  Within-1 Accuracy: {metrics['within_1_accuracy']:.1%}")
-        logger.info(f"  MAE: {metrics['mae']:.3f}")
-        logger.info(f"  RMSE: {metrics['rmse']:.3f}")
-        logger.info(f"  R²: {metrics['r2']:.3f}")
-        
-        # Save model
-        model.save_model(model_dir)
-        logger.info(f"[{service}] ✓ Model saved")
-        
-        # Store results
-        results[service] = {
-            'model': model,
-            'history': {
-                'loss': [float(x) for x in model.history.history['loss']],
-                'val_loss': [float(x) for x in model.history.history['val_loss']],
-                'accuracy': [float(x) for x in model.history.history['accuracy']],
-                'val_accuracy': [float(x) for x in model.history.history['val_accuracy']]
-            },
-            'metrics': metrics,
-            'y_test': y_test_seq,
-            'predictions': predictions
-        }
-        all_metrics[service] = metrics
+    results = train_services(train_service, data, workers=args.workers, model_dir=model_dir, positional=positional)
+    all_metrics = {service: result['metrics'] for service, result in results.items()}
     
     # Save all metrics
     logger.info("\n[3/3] Generating plots and saving metrics...")
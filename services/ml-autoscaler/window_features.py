@@ -0,0 +1,364 @@
+"""
+Sliding-window statistics for the per-service tree models
+
+The per-service Random Forest and CatBoost trainers (and the distilled
+transformer students) summarize the last WINDOW_SIZE scaled samples of every
+feature into blocks of statistics (last value, mean, std, min, max,
+percentiles, trend, ...). This module defines those block layouts once and
+computes them two ways:
+
+    window_features()          vectorized over every window of a matrix
+                               (training / offline evaluation)
+    IncrementalWindowStats     online state updated per sample (serving)
+
+window_features works on chunks of windows (WINDOW_CHUNK_VALUES samples of
+windows at a time, so a chunk stays in cache). Sums run over the `window`
+shifted row views X[start + offset:stop + offset], added in time order exactly
+as np.mean/np.std(window, axis=0) add them, so the output is bit-identical to
+looping over the windows (cumulative sums drift by a few ulps, which flips
+burst counts and cv near zero). Percentiles, min and max come from a sorted
+copy of the chunk's windows with numpy's interpolation.
+
+The incremental state keeps running mean/M2 (Welford) for mean and std,
+monotonic deques for min and max, and a sorted list per feature for
+percentiles and burst counts, so a new sample costs O(log w) per feature
+instead of recomputing the window.
+
+Stats:
+    last       newest value
+    mean/std   population mean and std
+    min/max    window extremes
+    p25/p75/p95  linear-interpolated percentiles (numpy default)
+    trend      newest - oldest
+    rate       mean first difference
+    burst      fraction of samples with |x - mean| > BURST_THRESHOLD * (std + 1e-8)
+    cv         (std + 1e-8) / (|mean| + 1e-8), 0 where mean == 0
+    half_diff  mean of the recent half - mean of the older half
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from typing import Sequence
+
+import numpy as np
+
+WINDOW_SIZE = 30  # 15 minutes at 30s interval
+BURST_THRESHOLD = 1.5
+EPSILON = 1e-8
+# Window samples per chunk in window_features (2 MB of float64)
+WINDOW_CHUNK_VALUES = 1 << 18
+
+RANDOM_FOREST_WINDOW_LAYOUT = ('last', 'mean', 'std', 'min', 'max', 'p25', 'p75', 'trend', 'half_diff')
+CATBOOST_WINDOW_LAYOUT = ('last', 'mean', 'std', 'min', 'max', 'p95', 'trend', 'rate', 'burst', 'cv', 'half_diff')
+# No percentiles or cv: cheap to maintain and well-scaled for an MLP
+STUDENT_WINDOW_LAYOUT = ('last', 'mean', 'std', 'min', 'max', 'trend', 'rate', 'half_diff')
+
+PERCENTILE_STATS = {'p25': 25, 'p75': 75, 'p95': 95}
+WINDOW_STATS = ('last', 'mean', 'std', 'min', 'max', 'trend', 'rate', 'burst', 'cv', 'half_diff') + tuple(PERCENTILE_STATS)
+
+
+def _check_layout(layout: Sequence[str]):
+    unknown = [stat for stat in layout if stat not in WINDOW_STATS]
+    if unknown:
+        raise ValueError(f"Unknown window stats: {unknown}")
+
+
+def window_feature_names(feature_names: Sequence[str], layout: Sequence[str]) -> list:
+    """Names of the window feature vector, block by block"""
+    return [f'{stat}_{name}' for stat in layout for name in feature_names]
+
+
+def _lerp(a: np.ndarray, b: np.ndarray, fraction: float) -> np.ndarray:
+    """Linear interpolation exactly as np.percentile(method='linear') computes it"""
+    if fraction >= 0.5:
+        return b - (b - a) * (1 - fraction)
+    return a + (b - a) * fraction
+
+
+def _chunk_stats(X: np.ndarray, series: np.ndarray, diffs: np.ndarray, start: int, stop: int,
+                 layout: Sequence[str], window: int, burst_threshold: float) -> dict:
+    """
+    Stats of windows start..stop - 1 of X, each a (windows, n_features) array
+
+    series is X.T (contiguous) for the sorted windows, diffs np.diff(X, axis=0).
+    """
+    def shifted(offset):
+        # Sample `offset` of every window of the chunk
+        return X[start + offset:stop + offset]
+
+    half = window // 2
+    stats = {'last': shifted(window - 1), 'trend': shifted(window - 1) - shifted(0)}
+
+    # Sums add the samples of a window in time order, as np.mean(window, axis=0) does
+    total = shifted(0).copy()
+    for offset in range(1, half):
+        total += shifted(offset)
+    older = total.copy()
+    for offset in range(half, window):
+        total += shifted(offset)
+    mean = total / window
+    stats['mean'] = mean
+
+    if 'half_diff' in layout:
+        recent = shifted(half).copy()
+        for offset in range(half + 1, window):
+            recent += shifted(offset)
+        stats['half_diff'] = recent / (window - half) - older / half
+    if 'rate' in layout:
+        if window > 1:
+            # Rows of np.diff(window, axis=0) are rows of diffs = np.diff(X, axis=0)
+            rate = diffs[start:stop].copy()
+            for offset in range(1, window - 1):
+                rate += diffs[start + offset:stop + offset]
+            stats['rate'] = rate / (window - 1)
+        else:
+            stats['rate'] = np.zeros_like(mean)
+
+    percentiles = [stat for stat in layout if stat in PERCENTILE_STATS]
+    if percentiles:
+        # Sorted copy of the chunk's windows: (n_features, windows, window)
+        windows = np.lib.stride_tricks.sliding_window_view(series[:, start:stop + window - 1], window, axis=1)
+        ordered = np.sort(windows, axis=-1)
+        stats['min'], stats['max'] = ordered[..., 0].T, ordered[..., -1].T
+        for stat in percentiles:
+            position = (window - 1) * (PERCENTILE_STATS[stat] / 100)
+            lower = int(np.floor(position))
+            upper = min(lower + 1, window - 1)
+            stats[stat] = _lerp(ordered[..., lower], ordered[..., upper], position - lower).T
+    elif 'min' in layout or 'max' in layout:
+        lows, highs = shifted(0).copy(), shifted(0).copy()
+        for offset in range(1, window):
+            np.minimum(lows, shifted(offset), out=lows)
+            np.maximum(highs, shifted(offset), out=highs)
+        stats['min'], stats['max'] = lows, highs
+
+    if any(stat in layout for stat in ('std', 'burst', 'cv')):
+        # np.std: mean of the squared deviations, summed in time order
+        squares = np.zeros_like(mean)
+        deviation = np.empty_like(mean)
+        for offset in range(window):
+            np.subtract(shifted(offset), mean, out=deviation)
+            np.multiply(deviation, deviation, out=deviation)
+            squares += deviation
+        std = np.sqrt(squares / window)
+        stats['std'] = std
+        if 'burst' in layout:
+            spread = burst_threshold * (std + EPSILON)
+            count = np.zeros(mean.shape, dtype=np.int64)
+            for offset in range(window):
+                np.subtract(shifted(offset), mean, out=deviation)
+                np.abs(deviation, out=deviation)
+                count += deviation > spread
+            stats['burst'] = count / window
+        if 'cv' in layout:
+            stats['cv'] = np.where(mean != 0, (std + EPSILON) / (np.abs(mean) + EPSILON), 0)
+    return stats
+
+
+def window_features(X: np.ndarray, layout: Sequence[str], window: int = WINDOW_SIZE,
+                    burst_threshold: float = BURST_THRESHOLD) -> np.ndarray:
+    """
+    Window statistics for every complete window of X
+
+    Args:
+        X: (n_samples, n_features) scaled samples in time order
+        layout: Stat blocks to emit, e.g. RANDOM_FOREST_WINDOW_LAYOUT
+        window: Window length
+
+    Returns:
+        (n_samples - window + 1, len(layout) * n_features) array; row k
+        summarizes X[k:k + window]
+    """
+    _check_layout(layout)
+    X = np.ascontiguousarray(X, dtype=float)
+    n_features = X.shape[1]
+    if len(X) < window:
+        return np.empty((0, len(layout) * n_features))
+
+    n_windows = len(X) - window + 1
+    out = np.empty((n_windows, len(layout) * n_features))
+    series = np.ascontiguousarray(X.T) if any(stat in PERCENTILE_STATS for stat in layout) else None
+    diffs = np.diff(X, axis=0) if 'rate' in layout else None
+    chunk = max(1, WINDOW_CHUNK_VALUES // (n_features * window))
+    for start in range(0, n_windows, chunk):
+        stop = min(start + chunk, n_windows)
+        stats = _chunk_stats(X, series, diffs, start, stop, layout, window, burst_threshold)
+        for block, stat in enumerate(layout):
+            out[start:stop, block * n_features:(block + 1) * n_features] = stats[stat]
+    return out
+
+
+class IncrementalWindowStats:
+    """
+    Online window statistics for one service
+
+    push() one scaled sample per prediction cycle; once `window` samples
+    have been seen, features() returns the same vector window_features()
+    produces for the latest window. Running sums are re-synchronized from
+    the ring buffer once per window to bound floating point drift.
+    """
+
+    def __init__(self, n_features: int, layout: Sequence[str] = RANDOM_FOREST_WINDOW_LAYOUT,
+                 window: int = WINDOW_SIZE, burst_threshold: float = BURST_THRESHOLD):
+        _check_layout(layout)
+        if window < 2:
+            raise ValueError("window must be at least 2 samples")
+        self.n_features = n_features
+        self.layout = tuple(layout)
+        self.window = window
+        self.burst_threshold = burst_threshold
+        self.half = window // 2
+
+        self.count = 0
+        self.ring = np.zeros((window, n_features))
+        self.mean = np.zeros(n_features)
+        self.m2 = np.zeros(n_features)
+        self.older_sum = np.zeros(n_features)
+        self.recent_sum = np.zeros(n_features)
+
+        # Deques hold (sample index, value) with monotonic values
+        self.min_deques = [deque() for _ in range(n_features)]
+        self.max_deques = [deque() for _ in range(n_features)]
+
+        needs_order = 'burst' in self.layout or any(stat in PERCENTILE_STATS for stat in self.layout)
+        self.sorted_values = [[] for _ in range(n_features)] if needs_order else None
+
+    @property
+    def ready(self) -> bool:
+        return self.count >= self.window
+
+    def push(self, row: Sequence[float]):
+        """Add the newest sample, evicting the oldest once the window is full"""
+        row = np.asarray(row, dtype=float)
+        window, index = self.window, self.count
+        slot = index % window
+        full = index >= window
+        evicted = self.ring[slot].copy()
+
+        if full:
+            # Welford update for replacing `evicted` with `row`
+            previous_mean = self.mean
+            self.mean = previous_mean + (row - evicted) / window
+            self.m2 += (row - evicted) * (row - self.mean + evicted - previous_mean)
+
+            # The oldest sample of the recent half moves into the older half
+            crossing = self.ring[(index - (window - self.half)) % window]
+            self.older_sum += crossing - evicted
+            self.recent_sum += row - crossing
+
+        self.ring[slot] = row
+        self.count = index + 1
+
+        oldest_kept = self.count - window
+        values = row.tolist()
+        for j, value in enumerate(values):
+            min_deque = self.min_deques[j]
+            while min_deque and min_deque[-1][1] >= value:
+                min_deque.pop()
+            min_deque.append((index, value))
+            if min_deque[0][0] < oldest_kept:
+                min_deque.popleft()
+
+            max_deque = self.max_deques[j]
+            while max_deque and max_deque[-1][1] <= value:
+                max_deque.pop()
+            max_deque.append((index, value))
+            if max_deque[0][0] < oldest_kept:
+                max_deque.popleft()
+
+        if self.sorted_values is not None:
+            evicted_values = evicted.tolist()
+            for j, value in enumerate(values):
+                ordered = self.sorted_values[j]
+                if full:
+                    del ordered[bisect_left(ordered, evicted_values[j])]
+                insort(ordered, value)
+
+        # Exact recompute when the window first fills and once per window after
+        if self.count % window == 0:
+            self._resync()
+
+    def _resync(self):
+        """Recompute running sums from the ring buffer"""
+        ordered = self._ordered_window()
+        self.mean = ordered.mean(axis=0)
+        self.m2 = ((ordered - self.mean) ** 2).sum(axis=0)
+        self.older_sum = ordered[:self.half].sum(axis=0)
+        self.recent_sum = ordered[self.half:].sum(axis=0)
+
+    def _ordered_window(self) -> np.ndarray:
+        """Window samples from oldest to newest"""
+        start = self.count % self.window
+        return np.concatenate([self.ring[start:], self.ring[:start]])
+
+    def _percentile(self, q: float) -> np.ndarray:
+        # Same interpolation as np.percentile(method='linear')
+        position = (self.window - 1) * (q / 100)
+        lower = int(np.floor(position))
+        upper = min(lower + 1, self.window - 1)
+        fraction = position - lower
+        result = np.empty(self.n_features)
+        for j, ordered in enumerate(self.sorted_values):
+            a, b = ordered[lower], ordered[upper]
+            if fraction >= 0.5:
+                result[j] = b - (b - a) * (1 - fraction)
+            else:
+                result[j] = a + (b - a) * fraction
+        return result
+
+    def features(self, out: np.ndarray = None) -> np.ndarray:
+        """Feature vector for the current window (requires ready)"""
+        if not self.ready:
+            raise ValueError(f"Window not full: {self.count}/{self.window} samples")
+
+        n = self.n_features
+        if out is None:
+            out = np.empty(len(self.layout) * n)
+
+        window = self.window
+        last = self.ring[(self.count - 1) % window]
+        first = self.ring[self.count % window]
+        lows = np.array([min_deque[0][1] for min_deque in self.min_deques])
+        highs = np.array([max_deque[0][1] for max_deque in self.max_deques])
+
+        # Running sums leave ~1e-17 residue where the exact answer is 0; cv
+        # jumps at mean == 0 and std feeds burst, so snap those cases exactly
+        mean = self.mean.copy()
+        near_zero = np.abs(mean) <= 1e-12 * np.maximum(np.abs(lows), np.abs(highs))
+        if near_zero.any():
+            mean[near_zero] = self._ordered_window()[:, near_zero].mean(axis=0)
+        std = np.sqrt(np.maximum(self.m2, 0) / window)
+        std[lows == highs] = 0.0
+
+        for block, stat in enumerate(self.layout):
+            target = out[block * n:(block + 1) * n]
+            if stat == 'last':
+                target[:] = last
+            elif stat == 'mean':
+                target[:] = mean
+            elif stat == 'std':
+                target[:] = std
+            elif stat == 'min':
+                target[:] = lows
+            elif stat == 'max':
+                target[:] = highs
+            elif stat in PERCENTILE_STATS:
+                target[:] = self._percentile(PERCENTILE_STATS[stat])
+            elif stat == 'trend':
+                target[:] = last - first
+            elif stat == 'rate':
+                target[:] = (last - first) / (window - 1)
+            elif stat == 'burst':
+                spread = self.burst_threshold * (std + EPSILON)
+                low = (mean - spread).tolist()
+                high = (mean + spread).tolist()
+                target[:] = [
+                    (bisect_left(ordered, low[j]) + window - bisect_right(ordered, high[j])) / window
+                    for j, ordered in enumerate(self.sorted_values)
+                ]
+            elif stat == 'cv':
+                target[:] = np.where(mean != 0, (std + EPSILON) / (np.abs(mean) + EPSILON), 0)
+            elif stat == 'half_diff':
+                target[:] = self.recent_sum / (window - self.half) - self.older_sum / self.half
+
+        return out